@@ -5,13 +5,35 @@
 # License: ***GPLv3***
 
 import sys
-import os
+
+if __name__ == "__main__":
+    # Run as a script: jdelay_engine parses the arguments and runs headless,
+    # or imports this file again for the GUI. Neither tkinter nor NumPy is
+    # loaded for --headless.
+    from jdelay_engine import main
+
+    sys.exit(main())
+
+import math
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import numpy as np
-import argparse
 import time
-import configparser
+
+from jdelay_engine import (
+    INTERP_NAMES,
+    RECONNECT_MAX,
+    STATS_INTERVAL,
+    JDelayEngine,
+    StatsReporter,
+    initial_delays,
+    initial_interp,
+    load_config,
+    load_preset,
+    save_preset,
+    save_session,
+    start_osc,
+)
+from jdelay_presets import PRESET_SLOTS
 
 try:
     import jack
@@ -20,7 +42,135 @@ try:
 except ImportError:
     JACK_AVAILABLE = False
 
-CONFIG_FILE = "J-Delay.ini"
+# The channel list only builds rows for the lines in view; every row has the
+# same height, so a channel's position is its index times ROW_HEIGHT.
+ROW_HEIGHT = 28
+ROW_PADX = 5
+# Rows bound beyond the visible ones, so small scrolls reuse bound rows.
+ROW_OVERSCAN = 2
+CHECKBOX_COL_WIDTH = 55
+# Delay edits from sliders and entries reach the widgets and the engine at
+# most once per UI tick, with the latest value per channel.
+UI_TICK_MS = 33
+PRESET_BUTTONS = 8
+# Input meters next to each row, redrawn from the engine's levels every tick.
+METER_MS = 33
+METER_WIDTH = 48
+METER_HEIGHT = 8
+# Range shown, in dBFS.
+METER_MIN_DB = -60.0
+# How often the status follows the engine's connection to JACK, and retries
+# connecting while JACK was not there at startup.
+JACK_WATCH_MS = 200
+JACK_RETRY_MS = int(RECONNECT_MAX * 1000)
+
+
+def meter_x(level):
+    # Pixel position of a linear level on the meter.
+    if level <= 0.0:
+        return 0
+    db = 20.0 * math.log10(level)
+    return int(max(min((db - METER_MIN_DB) / -METER_MIN_DB, 1.0), 0.0) * METER_WIDTH)
+
+
+class ChannelRow:
+    # One reusable line of the channel list. Scrolling binds it to whichever
+    # channel moves into its place; its widgets are built once.
+    def __init__(self, app):
+        self.app = app
+        self.index = -1
+        self.binding = False
+        canvas = app.canvas
+        self.frame = ttk.Frame(canvas)
+
+        left_col = tk.Frame(self.frame, width=CHECKBOX_COL_WIDTH, height=20)
+        left_col.pack_propagate(False)
+        left_col.pack(side="left", padx=(0, 5))
+        self.link_var = tk.BooleanVar(value=False)
+        self.link = ttk.Checkbutton(
+            left_col,
+            text="Link",
+            variable=self.link_var,
+            style="Link.TCheckbutton",
+            command=lambda: app.engine.set_link(self.index, self.link_var.get()),
+        )
+
+        self.label = ttk.Label(self.frame, width=15, anchor="w")
+        self.label.pack(side="left")
+        self.label.bind("<Button-1>", lambda e: app.rename_channel(self.index + 1))
+
+        # RMS bar with the held peak as a tick; turns red at full scale.
+        self.meter = tk.Canvas(self.frame, width=METER_WIDTH, height=METER_HEIGHT, bg="#303030", highlightthickness=0)
+        self.meter.pack(side="left", padx=(6, 0))
+        self.rms_bar = self.meter.create_rectangle(0, 0, 0, METER_HEIGHT, fill="#4CAF50", outline="")
+        self.peak_tick = self.meter.create_line(0, 0, 0, METER_HEIGHT, fill="#C0E0C0")
+        self.shown_level = (0, 0, False)
+
+        self.slider = ttk.Scale(self.frame, from_=0, to=app.max_delay_ms, orient="horizontal", command=self._on_slider)
+        self.slider.pack(side="left", fill="x", expand=True, padx=(10, 5))
+
+        self.entry_var = tk.StringVar()
+        entry = ttk.Entry(self.frame, textvariable=self.entry_var, width=7, font=("Consolas", 10))
+        entry.pack(side="left")
+        entry.bind("<Return>", lambda e: app.update_from_entry(self.index, self.entry_var))
+        entry.bind("<FocusOut>", lambda e: app.update_from_entry(self.index, self.entry_var))
+
+        ttk.Label(self.frame, text="ms").pack(side="left", padx=(2, 0))
+
+        self.interp_var = tk.StringVar()
+        interp_box = ttk.Combobox(
+            self.frame, textvariable=self.interp_var, values=INTERP_NAMES, width=7, state="readonly"
+        )
+        interp_box.pack(side="left", padx=(8, 0))
+        interp_box.bind("<<ComboboxSelected>>", lambda e: app.update_interp(self.index, self.interp_var))
+
+        self.window = canvas.create_window(
+            ROW_PADX, 0, window=self.frame, anchor="nw", height=ROW_HEIGHT - 4, state="hidden"
+        )
+
+    def _on_slider(self, value):
+        # Scale.set() runs the command too; ignore it while rebinding.
+        if not self.binding:
+            self.app.update_from_slider(self.index, value)
+
+    def bind(self, index):
+        app = self.app
+        self.index = index
+        self.binding = True
+        if index % 2 == 0 and index + 1 < app.channels:
+            self.link.pack(side="left", anchor="w")
+            self.link_var.set(index in app.engine.links)
+        else:
+            self.link.pack_forget()
+        self.label.config(text=app.channel_name(index + 1))
+        self.set_delay(app.delays_ms[index])
+        self.interp_var.set(app.interp_modes[index])
+        self.binding = False
+        app.canvas.coords(self.window, ROW_PADX, index * ROW_HEIGHT + 2)
+        app.canvas.itemconfig(self.window, state="normal")
+
+    def set_delay(self, ms):
+        if abs(self.slider.get() - ms) > 0.01:
+            binding, self.binding = self.binding, True
+            self.slider.set(ms)
+            self.binding = binding
+        self.entry_var.set(f"{ms:.2f}")
+
+    def set_level(self, peak, rms):
+        # Only touches the canvas when a pixel changes.
+        shown = (meter_x(rms), meter_x(peak), peak >= 1.0)
+        if shown == self.shown_level:
+            return
+        rms_x, peak_x, clipped = shown
+        self.meter.coords(self.rms_bar, 0, 0, rms_x, METER_HEIGHT)
+        self.meter.coords(self.peak_tick, peak_x, 0, peak_x, METER_HEIGHT)
+        if clipped != self.shown_level[2]:
+            self.meter.itemconfig(self.peak_tick, fill="#F44336" if clipped else "#C0E0C0")
+        self.shown_level = shown
+
+    def hide(self):
+        self.index = -1
+        self.app.canvas.itemconfig(self.window, state="hidden")
 
 
 class JDelayApp:
@@ -33,6 +183,19 @@ class JDelayApp:
         autostart=False,
         channel_names=None,
         loaded_delays=None,
+        interp="none",
+        loaded_interp=None,
+        fade_ms=20.0,
+        stats_target=None,
+        stats_interval=STATS_INTERVAL,
+        realtime=False,
+        threads=1,
+        meters=True,
+        latency_groups=None,
+        buffer_format="float32",
+        buffer_dir=None,
+        taps=None,
+        reconnect=True,
     ):
         self.root = root
         self.root.title("J-Delay Controller by Marco Herglotz in 2026 - NoNo19-Edition")
@@ -44,34 +207,52 @@ class JDelayApp:
         self.max_delay_ms = max_delay_ms
         self.initial_delay = initial_delay
         self.autostart = autostart
-        self.sample_rate = 44100
         self.channel_names = channel_names if channel_names else {}
 
         # Load delays if provided via config, else default
-        if loaded_delays and len(loaded_delays) >= self.channels:
-            self.delays_ms = loaded_delays[: self.channels]
-        else:
-            self.delays_ms = [initial_delay] * self.channels
-            # If we loaded fewer delays than channels, fill rest with 0
-            if loaded_delays:
-                for i in range(len(loaded_delays)):
-                    if i < self.channels:
-                        self.delays_ms[i] = loaded_delays[i]
-
-        self.buffers = []
-        self.write_pointers = [0] * self.channels
-
-        self.client = None
-        self.active = False
+        self.delays_ms = initial_delays(self.channels, initial_delay, loaded_delays)
+        self.interp_modes = initial_interp(self.channels, interp, loaded_interp)
+
+        self.engine = JDelayEngine(
+            self.channels,
+            max_delay_ms,
+            self.delays_ms,
+            self.interp_modes,
+            fade_ms=fade_ms,
+            realtime=realtime,
+            threads=threads,
+            meters=meters,
+            latency_groups=latency_groups,
+            buffer_format=buffer_format,
+            buffer_dir=buffer_dir,
+            taps=taps,
+            reconnect=reconnect,
+        )
+        self.stats_reporter = StatsReporter(stats_target) if stats_target else None
+        self.stats_interval_ms = int(stats_interval * 1000)
+
         self.blink_job = None
         self.blink_state = False
         self.blink_color = "red"
-
-        self.in_ports = []
-        self.out_ports = []
-        self.link_vars = {}
+        # Set once the status shows a JACK shutdown; cleared after recovery.
+        self.jack_lost = False
+        self.retry_job = None
+        self.osc = None
+        # Set from the OSC or latency thread; the Tk side picks the changes up
+        # in _osc_poll.
+        self.osc_changed = False
+        self.osc_recalled = None
+        # Channel index -> latest delay not yet shown or published.
+        self.pending_delays = {}
+        self.ui_job = None
+        self.last_ui_flush = 0.0
+
+        # Channel index -> the ChannelRow showing it.
+        self.rows = {}
+        self.spare_rows = []
         self.edit_names_var = tk.BooleanVar(value=False)
         self.preset_buttons = []
+        self.preset_bank = tk.IntVar(value=1)
 
         self.create_widgets()
 
@@ -81,16 +262,22 @@ class JDelayApp:
             messagebox.showerror("Error", "Python library 'JACK-Client' missing.")
         else:
             self.root.after(100, self.initial_connect)
+            self.root.after(JACK_WATCH_MS, self._jack_watch)
+        self.root.after(self.stats_interval_ms, self._stats_loop)
+        if meters:
+            self.root.after(METER_MS, self._meter_loop)
+        if latency_groups is not None:
+            self.engine.on_compensate = self._on_osc_change
+            self.root.after(50, self._osc_poll)
 
     def resize_window(self):
-        self.root.update_idletasks()
-        content_height = self.scrollable_frame.winfo_reqheight()
+        content_height = self.channels * ROW_HEIGHT
         OVERHEAD = 150  # Increased for Preset Bar
         needed_height = content_height + OVERHEAD
         MAX_HEIGHT = 615
         final_height = min(needed_height, MAX_HEIGHT)
-        self.root.geometry(f"650x{final_height}")
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.root.geometry(f"730x{final_height}")
+        self.canvas.configure(scrollregion=(0, 0, 0, content_height))
 
     def create_widgets(self):
         style = ttk.Style()
@@ -113,6 +300,7 @@ class JDelayApp:
         ttk.Checkbutton(
             cfg_frame, text="Edit Names", variable=self.edit_names_var, command=self.refresh_name_cursors
         ).pack(side="left", padx=10)
+        ttk.Button(cfg_frame, text="Measure", width=8, command=self.measure_latency).pack(side="left", padx=2)
         ttk.Button(cfg_frame, text="-2 Ch", width=6, command=self.remove_channels).pack(side="left", padx=2)
         ttk.Button(cfg_frame, text="+2 Ch", width=6, command=self.add_channels).pack(side="left", padx=2)
 
@@ -120,12 +308,23 @@ class JDelayApp:
         preset_frame = ttk.LabelFrame(self.header_frame, text="Presets (L-Click Load | R-Click Save)")
         preset_frame.pack(fill="x", pady=5)
 
-        for i in range(1, 9):
-            btn = ttk.Button(preset_frame, text=str(i), width=3, style="Preset.TButton")
+        # Eight buttons per bank; the bank picks which slots they address.
+        ttk.Label(preset_frame, text="Bank").pack(side="left", padx=(4, 2))
+        ttk.Spinbox(
+            preset_frame,
+            from_=1,
+            to=PRESET_SLOTS // PRESET_BUTTONS,
+            width=3,
+            state="readonly",
+            textvariable=self.preset_bank,
+            command=self.update_preset_buttons,
+        ).pack(side="left", padx=(0, 6))
+        for i in range(PRESET_BUTTONS):
+            btn = ttk.Button(preset_frame, text=str(i + 1), width=3, style="Preset.TButton")
             btn.pack(side="left", padx=2, pady=2, fill="x", expand=True)
             # Bindings
-            btn.bind("<Button-1>", lambda e, slot=i: self.load_preset(slot))
-            btn.bind("<Button-3>", lambda e, slot=i: self.save_preset(slot))
+            btn.bind("<Button-1>", lambda e, i=i: self.load_preset(self.preset_slot(i)))
+            btn.bind("<Button-3>", lambda e, i=i: self.save_preset(self.preset_slot(i)))
             self.preset_buttons.append(btn)
 
         # --- Footer ---
@@ -134,6 +333,8 @@ class JDelayApp:
 
         self.activate_btn = ttk.Button(self.footer_frame, text="ACTIVATE", command=self.toggle_activation, width=15)
         self.activate_btn.pack(side="left")
+        self.stats_label = ttk.Label(self.footer_frame, text="", font=("Segoe UI", 8), foreground="#606060")
+        self.stats_label.pack(side="left", padx=10)
 
         status_frame = ttk.Frame(self.footer_frame)
         status_frame.pack(side="right")
@@ -147,14 +348,8 @@ class JDelayApp:
         self.main_container = ttk.Frame(self.root)
         self.main_container.pack(side="top", fill="both", expand=True, padx=10)
 
-        self.canvas = tk.Canvas(self.main_container, bd=0, highlightthickness=0)
-        self.scrollbar = ttk.Scrollbar(self.main_container, orient="vertical", command=self.canvas.yview)
-
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        self.scrollable_frame.columnconfigure(0, weight=1)
-
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.canvas = tk.Canvas(self.main_container, bd=0, highlightthickness=0, yscrollincrement=ROW_HEIGHT)
+        self.scrollbar = ttk.Scrollbar(self.main_container, orient="vertical", command=self._on_scroll)
         self.canvas.bind("<Configure>", self._on_canvas_resize)
         self.canvas.configure(yscrollcommand=self.scrollbar.set)
 
@@ -165,76 +360,67 @@ class JDelayApp:
         self.render_channels()
 
     def _on_canvas_resize(self, event):
-        self.canvas.itemconfig(self.canvas_window, width=event.width)
+        for row in list(self.rows.values()) + self.spare_rows:
+            self.canvas.itemconfig(row.window, width=max(event.width - 2 * ROW_PADX, 1))
+        self.update_rows()
+
+    def _on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.update_rows()
 
     def _on_mousewheel(self, event):
-        if self.scrollable_frame.winfo_height() > self.canvas.winfo_height():
+        if self.channels * ROW_HEIGHT > self.canvas.winfo_height():
             self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+            self.update_rows()
 
-    def render_channels(self):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
-        self.sliders = []
-        self.entries = []
-        self.name_labels = []
-        self.link_vars = {}
-
-        CHECKBOX_COL_WIDTH = 55
-
-        for i in range(self.channels):
-            channel_idx = i + 1
-            name = self.channel_names.get(channel_idx, f"Channel {channel_idx}")
-
-            frame = ttk.Frame(self.scrollable_frame)
-            frame.pack(fill="x", pady=2, padx=5, expand=True)
-
-            left_col = tk.Frame(frame, width=CHECKBOX_COL_WIDTH, height=20)
-            left_col.pack_propagate(False)
-            left_col.pack(side="left", padx=(0, 5))
-
-            if i % 2 == 0 and (i + 1) < self.channels:
-                link_var = tk.BooleanVar(value=False)
-                self.link_vars[i] = link_var
-                cb = ttk.Checkbutton(left_col, text="Link", variable=link_var, style="Link.TCheckbutton")
-                cb.pack(side="left", anchor="w")
-
-            lbl = ttk.Label(frame, text=name, width=15, anchor="w")
-            lbl.pack(side="left")
-            lbl.bind("<Button-1>", lambda e, idx=channel_idx: self.rename_channel(idx))
-            self.name_labels.append(lbl)
-
-            val = self.delays_ms[i] if i < len(self.delays_ms) else 0.0
-            entry_var = tk.StringVar(value=f"{val:.2f}")
-            self.entries.append(entry_var)
-
-            slider = ttk.Scale(
-                frame,
-                from_=0,
-                to=self.max_delay_ms,
-                orient="horizontal",
-                command=lambda v, idx=i: self.update_from_slider(idx, v),
-            )
-            slider.pack(side="left", fill="x", expand=True, padx=(40, 5))
-            slider.set(val)
-            self.sliders.append(slider)
+    def channel_name(self, idx):
+        return self.channel_names.get(idx, f"Channel {idx}")
 
-            entry = ttk.Entry(frame, textvariable=entry_var, width=7, font=("Consolas", 10))
-            entry.pack(side="left")
-            entry.bind("<Return>", lambda event, idx=i, var=entry_var: self.update_from_entry(idx, var))
-            entry.bind("<FocusOut>", lambda event, idx=i, var=entry_var: self.update_from_entry(idx, var))
+    def render_channels(self):
+        # After the channel count or many values changed: rebinds the rows in
+        # view, whatever the total number of channels.
+        self.resize_window()
+        self.update_rows(rebind=True)
+
+    def update_rows(self, rebind=False):
+        # Binds a row to every channel in view; rows still showing a visible
+        # channel are kept as they are unless `rebind` is set.
+        height = max(self.canvas.winfo_height(), ROW_HEIGHT)
+        first = max(int(self.canvas.canvasy(0)) // ROW_HEIGHT, 0)
+        last = min(first + height // ROW_HEIGHT + ROW_OVERSCAN, self.channels)
+        rows = {}
+        for index, row in self.rows.items():
+            if first <= index < last and not rebind:
+                rows[index] = row
+            else:
+                self.spare_rows.append(row)
+        for index in range(first, last):
+            if index not in rows:
+                row = self.spare_rows.pop() if self.spare_rows else self._new_row()
+                row.bind(index)
+                rows[index] = row
+        for row in self.spare_rows:
+            if row.index >= 0:
+                row.hide()
+        self.rows = rows
+        self.refresh_name_cursors()
 
-            ttk.Label(frame, text="ms").pack(side="left", padx=(2, 0))
+    def _new_row(self):
+        row = ChannelRow(self)
+        self.canvas.itemconfig(row.window, width=max(self.canvas.winfo_width() - 2 * ROW_PADX, 1))
+        return row
 
-        self.refresh_name_cursors()
-        self.resize_window()
+    def refresh_row(self, index):
+        row = self.rows.get(index)
+        if row:
+            row.bind(index)
 
     def refresh_name_cursors(self):
         is_editing = self.edit_names_var.get()
         cursor = "hand2" if is_editing else "arrow"
         color = "blue" if is_editing else "black"
-        for lbl in self.name_labels:
-            lbl.config(cursor=cursor, foreground=color)
+        for row in self.rows.values():
+            row.label.config(cursor=cursor, foreground=color)
 
     def rename_channel(self, idx):
         if not self.edit_names_var.get():
@@ -243,60 +429,40 @@ class JDelayApp:
         new_name = simpledialog.askstring("Rename", f"Name for Channel {idx}:", initialvalue=old_name, parent=self.root)
         if new_name:
             self.channel_names[idx] = new_name
-            self.render_channels()
+            self.refresh_row(idx - 1)
+            self.save_current_state()
 
     # --- PRESET SYSTEM ---
+    def preset_slot(self, button):
+        return (self.preset_bank.get() - 1) * PRESET_BUTTONS + button + 1
+
+    def update_preset_buttons(self):
+        for i, btn in enumerate(self.preset_buttons):
+            btn.config(text=str(self.preset_slot(i)))
+
     def save_preset(self, slot):
+        self.flush_ui()
         if messagebox.askyesno("Save Preset", f"Save current setup to Preset {slot}?"):
-            config = configparser.ConfigParser()
-            config.read(CONFIG_FILE)
-            section = f"PRESET_{slot}"
-            config[section] = {}
-            config[section]["channels"] = str(self.channels)
-
-            # Save Delays
-            delays_str = ",".join([f"{d:.2f}" for d in self.delays_ms])
-            config[section]["delays"] = delays_str
-
-            # Save Names
-            for idx, name in self.channel_names.items():
-                config[section][f"name_{idx}"] = name
-
-            with open(CONFIG_FILE, "w") as f:
-                config.write(f)
+            save_preset(slot, self.channels, self.delays_ms, self.interp_modes, self.channel_names, self.engine.taps)
             messagebox.showinfo("Saved", f"Preset {slot} saved!")
 
     def load_preset(self, slot):
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
-        section = f"PRESET_{slot}"
-
-        if section not in config:
+        try:
+            preset = load_preset(slot)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load preset: {e}")
+            return
+        if preset is None:
             messagebox.showwarning("Empty", f"Preset {slot} is empty.")
             return
 
         try:
-            # 1. Stop Audio if structural change needed
-            self.ensure_stopped()
-
-            # 2. Load Channels
-            new_channels = config.getint(section, "channels")
-            self.channels = new_channels
-
-            # 3. Load Delays
-            delays_str = config.get(section, "delays")
-            self.delays_ms = [float(x) for x in delays_str.split(",")]
-            # Padding if mismatch
-            while len(self.delays_ms) < self.channels:
-                self.delays_ms.append(0.0)
-            self.write_pointers = [0] * self.channels
-
-            # 4. Load Names
-            self.channel_names = {}
-            for key in config[section]:
-                if key.startswith("name_"):
-                    idx = int(key.split("_")[1])
-                    self.channel_names[idx] = config[section][key]
+            # Load Channels, Delays and Names; a running engine keeps going and
+            # only adds or removes the ports that differ.
+            self.pending_delays = {}
+            self.channels, self.channel_names, self.delays_ms, interp, taps = preset
+            self.interp_modes = initial_interp(self.channels, "none", interp)
+            self.apply_channels(taps)
 
             self.render_channels()
             messagebox.showinfo("Loaded", f"Preset {slot} loaded.")
@@ -305,25 +471,30 @@ class JDelayApp:
             messagebox.showerror("Error", f"Failed to load preset: {e}")
 
     def add_channels(self):
-        self.ensure_stopped()
         self.channels += 2
         self.delays_ms.extend([0.0, 0.0])
-        self.write_pointers.extend([0, 0])
+        self.interp_modes.extend(self.interp_modes[-2:])
+        self.apply_channels()
         self.render_channels()
 
     def remove_channels(self):
         if self.channels <= 2:
             return
-        self.ensure_stopped()
         self.channels -= 2
         self.delays_ms = self.delays_ms[: self.channels]
-        self.write_pointers = self.write_pointers[: self.channels]
+        self.interp_modes = self.interp_modes[: self.channels]
+        self.apply_channels()
         self.render_channels()
 
-    def ensure_stopped(self):
-        if self.active:
-            self.toggle_activation()
-            # messagebox.showinfo("Info", "Audio deactivated.") # Less nagging
+    def apply_channels(self, taps=None):
+        # While running, the engine switches channel count (and taps, which
+        # the engine keeps) without stopping; otherwise it just keeps the
+        # settings for activation.
+        try:
+            self.engine.configure(self.channels, self.delays_ms, self.interp_modes, taps)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to change channels: {e}")
+        self.save_current_state()
 
     def stop_blinking(self):
         if self.blink_job:
@@ -352,42 +523,91 @@ class JDelayApp:
             fill_color = colors.get(mode, "gray")
             self.status_led.itemconfig(self.led_circle, fill=fill_color)
 
+    def _stats_loop(self):
+        # Low-rate refresh; the engine only counts, it never touches Tk.
+        stats = self.engine.stats_snapshot()
+        text = ""
+        if self.engine.active and stats["callbacks"]:
+            text = (
+                f"DSP {stats['dsp_load']:.0%}  p99 {stats['p99_load']:.0%}  max {stats['max_load']:.0%}"
+                f"  |  Xruns {stats['xruns']} ({stats['own_xruns']} own)  |  Errors {stats['errors']}"
+                f"  |  Buffers {stats['buffer_bytes'] / 1e6:.1f} MB"
+            )
+        self.stats_label.config(text=text)
+        if self.stats_reporter:
+            self.stats_reporter.send(stats)
+        self.root.after(self.stats_interval_ms, self._stats_loop)
+
+    def _jack_watch(self):
+        # The engine reconnects on its own thread; the status follows here.
+        engine = self.engine
+        if engine.shutdown_reason is not None and not self.jack_lost:
+            self.jack_lost = True
+            if engine.reconnecting:
+                self.set_status("error", "JACK lost - reconnecting")
+            else:
+                self.set_status("error", "JACK lost")
+                self.activate_btn.config(text="ACTIVATE")
+        elif self.jack_lost and engine.shutdown_reason is None and not engine.reconnecting:
+            self.jack_lost = False
+            if engine.active:
+                self.set_status("green", f"Running (back in {engine.recovery['restore_ms']:.0f} ms)")
+            else:
+                self.set_status("red", "Ready")
+        self.root.after(JACK_WATCH_MS, self._jack_watch)
+
+    def _meter_loop(self):
+        # Reads the levels the callback left behind; rows out of view have no
+        # meter to draw.
+        levels = self.engine.levels() if self.engine.active else None
+        if levels is None:
+            for row in self.rows.values():
+                row.set_level(0.0, 0.0)
+        else:
+            peak, rms = levels
+            for index, row in self.rows.items():
+                if index < len(peak):
+                    row.set_level(float(peak[index]), float(rms[index]))
+        self.root.after(METER_MS, self._meter_loop)
+
     def initial_connect(self):
+        self.retry_job = None
         try:
-            self.client = jack.Client("j_delay", no_start_server=True)
-            self.client.set_process_callback(self.process)
-            self.client.set_samplerate_callback(self.samplerate_cb)
-            self.sample_rate = self.client.samplerate
+            self.engine.connect()
             self.set_status("red", "Ready")
-            self.activate_btn.config(state="normal")
+            self.activate_btn.config(state="normal", command=self.toggle_activation)
             if self.autostart:
                 self.toggle_activation()
         except jack.JackError:
             self.set_status("error", "JACK Offline?")
             self.activate_btn.config(state="normal", command=self.retry_connect)
+            if self.engine.reconnect:
+                self.retry_job = self.root.after(JACK_RETRY_MS, self.initial_connect)
         except Exception as e:
             self.set_status("error", "Error")
             print(f"Init Error: {e}")
 
     def retry_connect(self):
+        if self.retry_job is not None:
+            self.root.after_cancel(self.retry_job)
         self.initial_connect()
 
     def toggle_activation(self):
-        if not self.client:
+        if self.engine.reconnecting:
+            return
+        if self.jack_lost:
+            # Without reconnect the old client died with the server.
+            self.engine.close()
+            self.jack_lost = False
+        if not self.engine.client:
             self.initial_connect()
-            if not self.client:
+            if not self.engine.client:
                 return
 
-        if not self.active:
+        if not self.engine.active:
             try:
-                self.in_ports = []
-                self.out_ports = []
-                for i in range(self.channels):
-                    self.in_ports.append(self.client.inports.register(f"in_{i+1}"))
-                    self.out_ports.append(self.client.outports.register(f"out_{i+1}"))
-                self.init_buffers()
-                self.client.activate()
-                self.active = True
+                self.engine.configure(self.channels, self.delays_ms, self.interp_modes)
+                self.engine.activate()
                 self.activate_btn.config(text="STOP")
                 self.set_status("green", "Running")
             except Exception as e:
@@ -395,28 +615,52 @@ class JDelayApp:
                 messagebox.showerror("Error", str(e))
         else:
             try:
-                self.client.deactivate()
-                self.active = False
-                for p in self.in_ports + self.out_ports:
-                    p.unregister()
-                self.in_ports = []
-                self.out_ports = []
+                self.engine.deactivate()
                 self.activate_btn.config(text="ACTIVATE")
                 self.set_status("yellow", "Paused")
             except Exception as e:
                 self.status_label.config(text=f"Error: {e}")
 
-    def samplerate_cb(self, sr):
-        if sr != self.sample_rate:
-            self.sample_rate = sr
-            self.init_buffers()
+    # --- LATENCY MEASUREMENT ---
+    def measure_latency(self):
+        if not self.engine.active:
+            messagebox.showwarning("Measure", "Activate first and patch each out_N back to its in_N through the loop.")
+            return
+        try:
+            self.engine.start_measurement("mls")
+        except Exception as e:
+            messagebox.showerror("Error", f"Measurement failed: {e}")
+            return
+        self.set_status("yellow", "Measuring...")
+        self.root.after(50, self._poll_measurement)
 
-    def init_buffers(self):
-        max_frames = int((self.max_delay_ms / 1000.0) * self.sample_rate) + 8192
-        self.buffers = []
-        self.write_pointers = [0] * self.channels
-        for _ in range(self.channels):
-            self.buffers.append(np.zeros(max_frames, dtype=np.float32))
+    def _poll_measurement(self):
+        measurement = self.engine.measurement
+        if measurement is None:
+            return
+        if not measurement.finished:
+            if self.engine.active:
+                self.root.after(50, self._poll_measurement)
+            else:
+                self.engine.measurement = None
+            return
+        latencies = self.engine.finish_measurement()
+        self.set_status("green", "Running")
+        if not any(ms is not None for ms in latencies.values()):
+            messagebox.showwarning("Measure", "No test signal came back on any input.")
+            return
+        lines = []
+        for i, ms in sorted(latencies.items()):
+            name = self.channel_names.get(i + 1, f"Channel {i + 1}")
+            lines.append(f"{name}: " + ("no signal" if ms is None else f"{ms:.3f} ms"))
+        question = "\n".join(lines) + "\n\nSet the delays so every loop matches the slowest one?"
+        if messagebox.askyesno("Measured Latency", question):
+            from jdelay_measure import compensation_delays
+
+            delays = compensation_delays(latencies, self.delays_ms)
+            for i, ms in enumerate(delays):
+                self._set_single_channel(i, min(ms, self.max_delay_ms))
+            self.publish_params()
 
     def update_from_slider(self, index, value):
         ms = float(value)
@@ -435,145 +679,108 @@ class JDelayApp:
         except ValueError:
             var.set(f"{self.delays_ms[index]:.2f}")
 
+    def update_interp(self, index, var):
+        mode = var.get()
+        self.interp_modes[index] = mode
+        target_idx = self._linked_channel(index)
+        if target_idx >= 0:
+            self.interp_modes[target_idx] = mode
+            self.refresh_row(target_idx)
+        self.publish_params()
+
+    def publish_params(self):
+        self.engine.configure(delays_ms=self.delays_ms, interp_modes=self.interp_modes)
+        self.save_current_state()
+
+    def _linked_channel(self, index):
+        return self.engine.linked_channel(index)
+
     def _apply_delay(self, index, ms):
-        self._set_single_channel(index, ms)
-        target_idx = -1
-        if index in self.link_vars:
-            if self.link_vars[index].get():
-                target_idx = index + 1
-        elif (index - 1) in self.link_vars:
-            if self.link_vars[index - 1].get():
-                target_idx = index - 1
-        if target_idx >= 0 and target_idx < self.channels:
-            self._set_single_channel(target_idx, ms)
+        self.pending_delays[index] = ms
+        target_idx = self._linked_channel(index)
+        if target_idx >= 0:
+            self.pending_delays[target_idx] = ms
+        # The first edit after a quiet tick shows at once, a drag's further
+        # motion events are merged until the next tick.
+        if self.ui_job is None:
+            wait = self.last_ui_flush + UI_TICK_MS / 1000 - time.perf_counter()
+            if wait <= 0:
+                self.flush_ui()
+            else:
+                self.ui_job = self.root.after(int(wait * 1000) + 1, self.flush_ui)
+
+    def flush_ui(self):
+        if self.ui_job is not None:
+            self.root.after_cancel(self.ui_job)
+            self.ui_job = None
+        if not self.pending_delays:
+            return
+        pending, self.pending_delays = self.pending_delays, {}
+        for index, ms in pending.items():
+            if index < self.channels:
+                self._set_single_channel(index, ms)
+        self.publish_params()
+        self.last_ui_flush = time.perf_counter()
 
     def _set_single_channel(self, index, ms):
         self.delays_ms[index] = ms
-        if index < len(self.sliders):
-            if abs(self.sliders[index].get() - ms) > 0.01:
-                self.sliders[index].set(ms)
-        if index < len(self.entries):
-            self.entries[index].set(f"{ms:.2f}")
-
-    def process(self, frames):
-        if not self.active:
-            return
+        row = self.rows.get(index)
+        if row:
+            row.set_delay(ms)
+
+    # --- OSC REMOTE CONTROL ---
+    def start_osc(self, target):
         try:
-            for i in range(self.channels):
-                in_data = self.in_ports[i].get_array()
-                out_data = self.out_ports[i].get_array()
-                buf = self.buffers[i]
-                buf_len = len(buf)
-                wp = self.write_pointers[i]
-
-                if frames <= (buf_len - wp):
-                    buf[wp : wp + frames] = in_data
-                else:
-                    part1 = buf_len - wp
-                    part2 = frames - part1
-                    buf[wp:buf_len] = in_data[:part1]
-                    buf[0:part2] = in_data[part1:]
-
-                delay_frames = int((self.delays_ms[i] / 1000.0) * self.sample_rate)
-                rp = (wp - delay_frames) % buf_len
-
-                if frames <= (buf_len - rp):
-                    out_data[:] = buf[rp : rp + frames]
-                else:
-                    part1 = buf_len - rp
-                    part2 = frames - part1
-                    out_data[:part1] = buf[rp:buf_len]
-                    out_data[part1:] = buf[0:part2]
-
-                self.write_pointers[i] = (wp + frames) % buf_len
-        except:
-            pass
+            self.osc = start_osc(self.engine, target, lambda: self.channel_names, self._on_osc_change)
+        except Exception as e:
+            messagebox.showerror("OSC", str(e))
+            return
+        if self.engine.latency_groups is None:
+            self.root.after(50, self._osc_poll)
+
+    def _on_osc_change(self):
+        self.osc_changed = True
+
+    def _osc_poll(self):
+        # Mirrors remote changes into the widgets; the engine already has them.
+        if self.osc_changed:
+            self.osc_changed = False
+            engine = self.engine
+            recalled = self.osc.recalled if self.osc else None
+            if engine.channels != self.channels or recalled is not self.osc_recalled:
+                self.osc_recalled = recalled
+                self.channels = engine.channels
+                if recalled:
+                    self.channel_names = recalled[1]
+                self.delays_ms = list(engine.delays_ms)
+                self.interp_modes = list(engine.interp_modes)
+                self.render_channels()
+            else:
+                # Only the rows in view have widgets to update.
+                self.delays_ms = list(engine.delays_ms)
+                self.interp_modes = list(engine.interp_modes)
+                for index, row in self.rows.items():
+                    row.bind(index)
+            self.save_current_state()
+        self.root.after(50, self._osc_poll)
 
     def on_closing(self):
+        self.flush_ui()
         self.save_current_state()  # Auto-Save on Close
-        if self.client:
-            try:
-                if self.active:
-                    self.client.deactivate()
-                    for p in self.in_ports + self.out_ports:
-                        p.unregister()
-                self.client.close()
-            except:
-                pass
+        if self.osc:
+            self.osc.stop()
+        self.engine.close()
+        if self.stats_reporter:
+            self.stats_reporter.close()
         self.root.destroy()
 
     def save_current_state(self):
-        # Saves current state to [IO] and [LAST_SESSION]
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)  # Read existing to keep presets
-
-        if "IO" not in config:
-            config["IO"] = {}
-        config["IO"]["input"] = str(self.channels)
-
-        if "NAMES" not in config:
-            config["NAMES"] = {}
-        # Clear old names in NAMES section to be safe
-        config["NAMES"] = {}
-        for idx, name in self.channel_names.items():
-            config["NAMES"][str(idx)] = name
-
-        if "DELAYS" not in config:
-            config["DELAYS"] = {}
-        # Save Delays as string list or individual keys? List is cleaner.
-        delays_str = ",".join([f"{d:.2f}" for d in self.delays_ms])
-        config["DELAYS"]["values"] = delays_str
-
-        try:
-            with open(CONFIG_FILE, "w") as f:
-                config.write(f)
-        except:
-            pass
-
-
-def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        return None, {}, []
-    channels = None
-    names = {}
-    delays = []
-
-    try:
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
-
-        if "IO" in config and "input" in config["IO"]:
-            channels = config.getint("IO", "input")
-
-        if "NAMES" in config:
-            for key in config["NAMES"]:
-                try:
-                    names[int(key)] = config["NAMES"][key]
-                except ValueError:
-                    pass
-
-        if "DELAYS" in config and "values" in config["DELAYS"]:
-            try:
-                delays = [float(x) for x in config["DELAYS"]["values"].split(",")]
-            except:
-                pass
-
-    except:
-        pass
-    return channels, names, delays
-
-
-if __name__ == "__main__":
-    ini_channels, ini_names, ini_delays = load_config()
-    default_channels = ini_channels if ini_channels else 2
+        # Autosaved in the background a moment after the last change.
+        save_session(self.channels, self.channel_names, self.delays_ms, self.interp_modes, self.engine.taps)
 
-    parser = argparse.ArgumentParser(description="J-Delay")
-    parser.add_argument("-c", "--channels", type=int, default=default_channels)
-    parser.add_argument("-d", "--delay", type=float, default=0.0)
-    parser.add_argument("-m", "--max", type=float, default=1000.0)
-    parser.add_argument("-a", "--autostart", action="store_true")
-    args = parser.parse_args()
 
+def run_gui(args, config=None):
+    ini_channels, ini_names, ini_delays, ini_interp, ini_taps = config if config else load_config()
     root = tk.Tk()
     app = JDelayApp(
         root,
@@ -583,6 +790,23 @@ if __name__ == "__main__":
         autostart=args.autostart,
         channel_names=ini_names,
         loaded_delays=ini_delays,
+        interp=args.interp,
+        loaded_interp=ini_interp,
+        fade_ms=args.fade,
+        stats_target=args.stats,
+        stats_interval=args.stats_interval,
+        realtime=args.rt,
+        threads=args.threads,
+        meters=not args.no_meters,
+        latency_groups=args.auto_latency,
+        buffer_format=args.buffer_format,
+        buffer_dir=args.buffer_dir,
+        taps=args.tap or ini_taps,
+        reconnect=not args.no_reconnect,
     )  # Pass loaded delays
+    app.engine.client_name = args.name
+    if args.osc:
+        app.start_osc(args.osc)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
+    return 0
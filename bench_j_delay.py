@@ -0,0 +1,1746 @@
+# ***bench_j_delay.py***
+# Version: ***1.0***
+# Description: ***Benchmarks for the J-Delay processing engine***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+import numpy as np
+
+from jdelay_dsp import INTERP_MODES, MultiChannelDelay
+from jdelay_engine import JDelayEngine, parse_latency_groups
+from jdelay_fakejack import CAPTURE, FakeServer
+
+# Largest interpolation error (dB) the interp benchmark accepts per mode, for
+# test tones up to 1 kHz; well above what each mode reaches at any fraction.
+INTERP_LIMITS_DB = {"none": -20.0, "linear": -45.0, "cubic": -90.0, "allpass": -65.0}
+
+# Slider motion events in the GUI benchmark's drag.
+DRAG_EVENTS = 200
+
+# Sample rate and period changes the retune benchmark steps through, as
+# (sample rate, period) with None for "unchanged".
+RETUNE_STEPS = ((None, 64), (None, 1024), (None, 100), (44100, None), (44100, 256), (96000, 128), (48000, None))
+
+# Benchmarks the check command runs, with arguments that keep each one short.
+# Every one of them exits with code 1 when the engine misbehaves.
+CHECKS = (
+    ("retune",),
+    ("retune", "--rt"),
+    ("retune", "--threads", "2"),
+    ("alloc", "--channels", "2", "64", "--frames", "16", "256", "--periods", "100"),
+    ("osc", "--seconds", "1"),
+    ("latency",),
+    ("latency", "--groups", "1-4,5-8"),
+    ("taps", "--taps", "1", "3", "--periods", "50"),
+    ("taps", "--taps", "3", "--periods", "50", "--rt"),
+    ("reconnect", "--downtime", "0", "0.1"),
+    ("reconnect", "--downtime", "0.1", "--rt"),
+    ("interp", "--periods", "100"),
+    ("measure", "--channels", "16", "--taps"),
+    ("resize",),
+    ("resize", "--rt"),
+    ("resize", "--threads", "2"),
+)
+
+# Reference results of the callback suite with its default grid, compared
+# against unless --baseline names another file or --no-baseline is given.
+SUITE_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Delay settings of the callback suite: (interpolation, random fractional delays)
+SUITE_DELAYS = {
+    "zero": ("none", False),
+    "integer": ("none", True),
+    "linear": ("linear", True),
+    "cubic": ("cubic", True),
+    "allpass": ("allpass", True),
+}
+
+
+class BenchPort:
+    def __init__(self, frames):
+        self.data = np.zeros(frames, dtype=np.float32)
+
+    def get_array(self):
+        return self.data
+
+
+class LegacyLoop:
+    # The original per-channel Python loop from JDelayApp.process, kept for comparison.
+    def __init__(self, channels, max_delay_ms, sample_rate):
+        max_frames = int((max_delay_ms / 1000.0) * sample_rate) + 8192
+        self.sample_rate = sample_rate
+        self.buffers = [np.zeros(max_frames, dtype=np.float32) for _ in range(channels)]
+        self.write_pointers = [0] * channels
+
+    def process(self, in_ports, out_ports, frames, delays_ms):
+        for i in range(len(self.buffers)):
+            in_data = in_ports[i].get_array()
+            out_data = out_ports[i].get_array()
+            buf = self.buffers[i]
+            buf_len = len(buf)
+            wp = self.write_pointers[i]
+
+            if frames <= (buf_len - wp):
+                buf[wp : wp + frames] = in_data
+            else:
+                part1 = buf_len - wp
+                part2 = frames - part1
+                buf[wp:buf_len] = in_data[:part1]
+                buf[0:part2] = in_data[part1:]
+
+            delay_frames = int((delays_ms[i] / 1000.0) * self.sample_rate)
+            rp = (wp - delay_frames) % buf_len
+
+            if frames <= (buf_len - rp):
+                out_data[:] = buf[rp : rp + frames]
+            else:
+                part1 = buf_len - rp
+                part2 = frames - part1
+                out_data[:part1] = buf[rp:buf_len]
+                out_data[part1:] = buf[0:part2]
+
+            self.write_pointers[i] = (wp + frames) % buf_len
+
+
+def time_callbacks(callback, periods):
+    for _ in range(min(periods, 50)):
+        callback()
+    start = time.perf_counter()
+    for _ in range(periods):
+        callback()
+    return (time.perf_counter() - start) / periods
+
+
+def bench_channels(args):
+    rng = np.random.default_rng(1)
+    budget_us = args.frames / args.rate * 1e6
+    print(f"Per-callback time, {args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us)")
+    print(f"{'channels':>8} {'legacy us':>10} {'engine us':>10} {'dsp us':>8} {'speedup':>8}")
+    for channels in args.channels:
+        delays_ms = list(rng.uniform(0, args.max, channels))
+        in_ports = [BenchPort(args.frames) for _ in range(channels)]
+        out_ports = [BenchPort(args.frames) for _ in range(channels)]
+        for p in in_ports:
+            p.data[:] = rng.standard_normal(args.frames)
+
+        legacy = LegacyLoop(channels, args.max, args.rate)
+        legacy_s = time_callbacks(lambda: legacy.process(in_ports, out_ports, args.frames, delays_ms), args.periods)
+
+        engine = MultiChannelDelay(channels, args.max, args.rate)
+        engine.publish(delays_ms, in_ports=in_ports, out_ports=out_ports)
+        engine_s = time_callbacks(lambda: engine.process_ports(args.frames), args.periods)
+        # The batched write/gather alone, without the per-port copies JACK forces on us.
+        params = engine.params
+        dsp_s = time_callbacks(lambda: engine.process_block(engine.in_block, engine.out_block, params), args.periods)
+        print(
+            f"{channels:>8} {legacy_s * 1e6:>10.1f} {engine_s * 1e6:>10.1f} {dsp_s * 1e6:>8.1f}"
+            f" {legacy_s / engine_s:>7.1f}x"
+        )
+
+
+def bench_interp(args):
+    budget_us = args.frames / args.rate * 1e6
+    delay_ms = args.delay
+    exact = delay_ms / 1000.0 * args.rate
+    print(
+        f"{args.channels} channels, {args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us),"
+        f" delay {delay_ms} ms = {exact:.3f} samples"
+    )
+    print(f"{'mode':>8} {'dsp us':>8} " + " ".join(f"{f'err@{f:g}Hz dB':>14}" for f in args.freqs))
+    periods_for_signal = 64
+    n = np.arange(periods_for_signal * args.frames)
+    failures = 0
+    for mode in INTERP_MODES:
+        engine = MultiChannelDelay(args.channels, delay_ms * 2, args.rate)
+        engine.publish([delay_ms] * args.channels, [mode] * args.channels, crossfade=False)
+        in_block = np.zeros((args.channels, args.frames), dtype=np.float32)
+        out_block = np.zeros((args.channels, args.frames), dtype=np.float32)
+        dsp_s = time_callbacks(lambda: engine.process_block(in_block, out_block, engine.params), args.periods)
+
+        # Accuracy: run one sine per channel through the engine and compare with
+        # the ideal, continuously delayed sine once the history is filled.
+        errors = []
+        for freq in args.freqs:
+            engine.reset(1, args.rate)
+            engine.publish([delay_ms], [mode], crossfade=False)
+            signal = np.sin(2 * np.pi * freq * n / args.rate).astype(np.float32)
+            result = np.empty_like(signal)
+            block_in = np.zeros((1, args.frames), dtype=np.float32)
+            block_out = np.zeros((1, args.frames), dtype=np.float32)
+            for k in range(periods_for_signal):
+                block_in[0] = signal[k * args.frames : (k + 1) * args.frames]
+                engine.process_block(block_in, block_out, engine.params)
+                result[k * args.frames : (k + 1) * args.frames] = block_out[0]
+            ideal = np.sin(2 * np.pi * freq * (n - exact) / args.rate)
+            settled = n > exact + 64
+            err = np.sqrt(np.mean((result[settled] - ideal[settled]) ** 2)) / np.sqrt(0.5)
+            errors.append(20 * np.log10(max(err, 1e-12)))
+        checked = [e for f, e in zip(args.freqs, errors) if f <= 1000.0]
+        status = ""
+        if checked and max(checked) > INTERP_LIMITS_DB[mode]:
+            status = f" ABOVE {INTERP_LIMITS_DB[mode]:g} dB"
+            failures += 1
+        print(f"{mode:>8} {dsp_s * 1e6:>8.1f} " + " ".join(f"{e:>14.1f}" for e in errors) + status)
+    if failures:
+        print(f"{failures} mode(s) less accurate than expected")
+        return 1
+    return 0
+
+
+def bench_fade(args):
+    budget_us = args.frames / args.rate * 1e6
+    print(
+        f"{args.channels} channels, {args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us), fade {args.fade} ms"
+    )
+    in_block = np.zeros((args.channels, args.frames), dtype=np.float32)
+    out_block = np.zeros((args.channels, args.frames), dtype=np.float32)
+    engine = MultiChannelDelay(args.channels, args.max, args.rate, fade_ms=args.fade)
+    engine.publish([args.max / 4] * args.channels, crossfade=False)
+
+    steady_s = time_callbacks(lambda: engine.process_block(in_block, out_block, engine.params), args.periods)
+
+    # A slider drag: a new parameter block every period. Fades are coalesced, so
+    # the cost stays that of a single running fade.
+    step = [0]
+
+    def drag():
+        step[0] += 1
+        engine.publish([args.max / 4 + (step[0] % 100) * 0.1] * args.channels)
+        engine.process_block(in_block, out_block, engine.params)
+
+    drag_s = time_callbacks(drag, args.periods)
+    publish_s = time_callbacks(lambda: engine.publish([args.max / 3] * args.channels), args.periods)
+    print(f"steady callback {steady_s * 1e6:8.1f} us")
+    print(f"drag callback   {(drag_s - publish_s) * 1e6:8.1f} us (publish on the GUI thread: {publish_s * 1e6:.1f} us)")
+
+    # Largest sample-to-sample step when jumping the delay on a 440 Hz sine.
+    periods = 200
+    n = np.arange(periods * args.frames)
+    signal = np.sin(2 * np.pi * 440 * n / args.rate).astype(np.float32)
+    for fade_ms in (0.0, args.fade):
+        engine = MultiChannelDelay(1, args.max, args.rate, fade_ms=fade_ms)
+        engine.publish([1.0], crossfade=False)
+        block_in = np.zeros((1, args.frames), dtype=np.float32)
+        block_out = np.zeros((1, args.frames), dtype=np.float32)
+        result = np.empty_like(signal)
+        for k in range(periods):
+            if k == periods // 2:
+                engine.publish([1.0 + 1000.0 / 440 / 2])
+            block_in[0] = signal[k * args.frames : (k + 1) * args.frames]
+            engine.process_block(block_in, block_out, engine.params)
+            result[k * args.frames : (k + 1) * args.frames] = block_out[0]
+        settled = result[args.frames * 10 :]
+        label = "hard switch" if fade_ms == 0 else "crossfade"
+        print(
+            f"{label:<12} max step {np.abs(np.diff(settled)).max():.4f} (signal alone {np.abs(np.diff(signal)).max():.4f})"
+        )
+
+
+def time_command(argv, ready=None):
+    # Wall time from launch until the process exits, or until a stdout line
+    # starting with `ready` appears.
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if ready:
+        for line in proc.stdout:
+            if line.startswith(ready):
+                elapsed = time.perf_counter() - start
+                proc.wait()
+                return elapsed, None
+    proc.wait()
+    elapsed = time.perf_counter() - start
+    if proc.returncode or ready:
+        return None, proc.stderr.read().strip()
+    return elapsed, None
+
+
+def bench_startup(args):
+    python = sys.executable
+    steps = [
+        ("interpreter", [python, "-c", "pass"], None),
+        ("import jdelay_engine", [python, "-c", "import jdelay_engine"], None),
+        ("import numpy + jack", [python, "-c", "import numpy, jack"], None),
+        (
+            "launch -> ports registered",
+            [python, "jdelay_engine.py", "--headless", "--check", "-c", str(args.channels), "-n", "j_delay_bench"]
+            + (["--fake-jack"] if args.fake_jack else []),
+            "J-Delay:",
+        ),
+    ]
+    print(f"Startup time, best of {args.runs} runs ({args.channels} channels)")
+    for label, argv, ready in steps:
+        times = []
+        error = None
+        for _ in range(args.runs):
+            elapsed, error = time_command(argv, ready)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+        if times:
+            print(f"{label:<28} {min(times) * 1000:8.1f} ms")
+        else:
+            print(f"{label:<28} failed: {error.splitlines()[-1] if error else 'no output'}")
+
+
+def bench_render(args):
+    import resource
+
+    from jdelay_render import WavWriter, render
+
+    rng = np.random.default_rng(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path = os.path.join(tmp, "in.wav")
+        out_path = os.path.join(tmp, "out.wav")
+        writer = WavWriter(in_path, args.channels, args.rate, args.format)
+        block = (rng.standard_normal((args.channels, args.rate)) * 0.1).astype(np.float32)
+        for _ in range(int(args.seconds)):
+            writer.write(block)
+        writer.close()
+        size_mb = os.path.getsize(in_path) / 1e6
+
+        delays = list(rng.uniform(0, args.max, args.channels))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        frames, _ = render(in_path, out_path, delays, ["cubic"] * args.channels, args.max, args.chunk)
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{args.channels} channels, {args.seconds:.0f} s {args.format} ({size_mb:.0f} MB), chunk {args.chunk} frames")
+    print(f"render {elapsed:.2f} s = {frames / args.rate / elapsed:.0f}x real-time")
+    print(f"peak RSS grew by {(rss_after - rss_before) / 1024:.0f} MB while rendering")
+
+
+def bench_measure(args):
+    # Latency measurement against simulated loops with known fractional delays.
+    # With --taps every channel also has a tap feeding the same loop, which the
+    # measurement must silence. Fails above --tolerance or on a lost loop.
+    rng = np.random.default_rng(3)
+    delays = rng.uniform(20, args.max_loop, args.channels)
+    taps = [(i, 5.0) for i in range(args.channels)] if args.taps else None
+    print(
+        f"{args.channels} loops of 20..{args.max_loop:.0f} samples, {args.frames} frames @ {args.rate} Hz"
+        + (", a tap on every loop" if taps else "")
+    )
+    print(f"{'signal':>8} {'max err':>12} {'analysis ms':>12}")
+    failures = 0
+    for kind in args.signals:
+        server = FakeServer(args.rate, args.frames)
+        engine = JDelayEngine(args.channels, 10.0, client_factory=server.Client, taps=taps)
+        engine.activate()
+        loop = server.add_loopback(delays)
+        for i in range(args.channels):
+            server.connect(engine.out_ports[i], loop.client.inports[i])
+            server.connect(loop.client.outports[i], engine.in_ports[i])
+        for port, (i, _) in zip(engine.tap_ports, taps or ()):
+            server.connect(port, loop.client.inports[i])
+        measurement = engine.start_measurement(kind)
+        while not measurement.finished:
+            server.cycle()
+        start = time.perf_counter()
+        latencies = engine.finish_measurement()
+        elapsed = time.perf_counter() - start
+        measured = np.array([latencies[i] for i in range(args.channels)], dtype=float) / 1000.0 * args.rate
+        err = np.abs(measured - args.frames - delays).max()
+        # NaN (a loop without signal) fails too.
+        ok = err <= args.tolerance
+        failures += not ok
+        print(f"{kind:>8} {err:>8.4f} smp {elapsed * 1000:>12.1f}{'' if ok else ' FAIL'}")
+        engine.close()
+    if failures:
+        print(f"{failures} signal(s) above {args.tolerance} samples")
+        return 1
+    return 0
+
+
+def traced_allocations(callback, frames, periods):
+    # Bytes still allocated after `periods` callbacks, and the largest transient
+    # excursion above the starting point (tracemalloc peak).
+    gc.disable()
+    tracemalloc.start()
+    for _ in range(10):
+        callback(frames)
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(periods):
+        callback(frames)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.enable()
+    return after - before, peak - before
+
+
+def bench_alloc(args):
+    # Steady-state allocations per callback of the full engine callback on the
+    # fake server (port copies, stats and GC handling included). The loop's own
+    # overhead is measured with an empty callback and subtracted.
+    noop_net, noop_peak = traced_allocations(lambda frames: None, 64, args.periods)
+    rng = np.random.default_rng(4)
+    failures = 0
+    print(f"{'case':<34} {'retained B':>10} {'transient B':>11}")
+    for realtime in (True, False) if args.compare else (True,):
+        for channels in args.channels:
+            for frames in args.frames:
+                for interp in args.interp:
+                    server = FakeServer(args.rate, frames)
+                    system = server.add_system(channels, channels)
+                    for port in system.outports:
+                        port.get_array()[:] = rng.standard_normal(frames)
+                    delays = list(rng.uniform(0, args.max, channels))
+                    engine = JDelayEngine(
+                        channels, args.max, delays, [interp] * channels, client_factory=server.Client, realtime=realtime
+                    )
+                    engine.activate()
+                    for i in range(channels):
+                        server.connect(system.outports[i], engine.in_ports[i])
+                    server.run(20)
+                    # Start a crossfade so the measured periods include one. Shorter
+                    # delays never grow a ring (which allocates, off the audio thread).
+                    engine.configure(delays_ms=[d / 2 for d in delays])
+                    # Latency reports run on their own thread, not in the callback.
+                    engine.wait_latency()
+                    # The first traced run pays for tracemalloc's own bookkeeping.
+                    traced_allocations(engine.process, frames, 10)
+                    net, peak = traced_allocations(engine.process, frames, args.periods)
+                    engine.close()
+                    net, peak = max(net - noop_net, 0), max(peak - noop_peak, 0)
+                    label = f"{'rt' if realtime else 'std'} {channels}ch/{frames}f/{interp}"
+                    status = "" if not realtime or (net == 0 and peak == 0) else " ALLOCATES"
+                    failures += bool(status)
+                    print(f"{label:<34} {net:>10} {peak:>11}{status}")
+    if failures:
+        print(f"{failures} real-time case(s) allocate in steady state")
+        return 1
+    print("Real-time callback: zero allocations in steady state")
+    return 0
+
+
+def bench_memory(args):
+    # Ring memory per channel against the old layout, which gave every channel
+    # max delay + 8192 samples (plus the mirror), and the cost of growing a ring
+    # while the fake server runs in real time.
+    from jdelay_dsp import HISTORY_PAD, MAX_BLOCK
+
+    rng = np.random.default_rng(5)
+    delays = list(rng.uniform(0, args.delay, args.channels))
+    fixed_frames = int(args.max / 1000.0 * args.rate) + 2 * (MAX_BLOCK + HISTORY_PAD)
+    fixed = args.channels * fixed_frames * 4
+    server = FakeServer(args.rate, args.frames)
+    engine = JDelayEngine(
+        args.channels, args.max, delays, ["cubic"] * args.channels, client_factory=server.Client, realtime=args.rt
+    )
+    engine.activate()
+    channel_bytes, total = engine.dsp.memory_usage()
+    print(f"{args.channels} channels @ {args.rate} Hz, -m {args.max:g} ms, delays up to {args.delay:g} ms")
+    print(f"fixed buffers    {fixed / 1e6:10.1f} MB")
+    print(
+        f"per-channel ring {total / 1e6:10.1f} MB (smallest {min(channel_bytes) / 1e3:.0f} kB,"
+        f" largest {max(channel_bytes) / 1e3:.0f} kB)"
+    )
+
+    # A delay change within the rings' capacity, then one that grows them;
+    # the fake server counts overruns of the paced period in both windows.
+    server.start()
+    print(f"{'change':<24} {'applied after':>13} {'xruns':>6} {'max load':>9} {'buffers':>10}")
+    shorter = [d / 2 for d in delays]
+    for label, target in (("halve every delay", shorter), (f"grow to {args.max:g} ms", [args.max] * args.channels)):
+        time.sleep(0.5)
+        engine.stats.reset()
+        start = time.perf_counter()
+        engine.configure(delays_ms=target)
+        dsp = engine.dsp
+        while dsp._live is not dsp.params:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.5 - min(elapsed, 0.5))
+        stats = engine.stats.snapshot()
+        _, total = dsp.memory_usage()
+        print(
+            f"{label:<24} {elapsed * 1000:>10.0f} ms {stats['xruns']:>6} {stats['max_load']:>8.0%}"
+            f" {total / 1e6:>7.1f} MB"
+        )
+    server.stop()
+    engine.close()
+
+
+def _resident_mb():
+    # (anonymous, file-backed) resident memory of this process in MB, from
+    # /proc (Linux); None elsewhere.
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return int(fields["RssAnon"].split()[0]) / 1024.0, int(fields["RssFile"].split()[0]) / 1024.0
+
+
+def bench_longdelay(args):
+    # Long delays (seconds) on many channels with each ring storage: ring
+    # bytes, the resident memory they add (anonymous RAM against page cache of
+    # the mapped files), callback time on the fake server and, for float16,
+    # the largest difference to the float32 output. Mapped rings are kept
+    # warm by the engine's thread, as when running live.
+    rng = np.random.default_rng(8)
+    max_ms = args.seconds * 1000.0
+    delays = list(rng.uniform(0.5 * max_ms, max_ms, args.channels))
+    periods = args.periods + int(max_ms / 1000.0 * args.rate / args.frames)
+    signal = rng.standard_normal((args.channels, 64 * args.frames)).astype(np.float32) * 0.25
+    directory = args.dir or tempfile.mkdtemp(prefix="jdelay-bench-")
+    cases = [
+        ("std", "float32", None),
+        ("std", "float16", None),
+        ("std", "float32", directory),
+        ("std", "float16", directory),
+        ("rt", "float32", None),
+        ("rt", "float32", directory),
+    ]
+    print(
+        f"{args.channels} channels @ {args.rate} Hz, {args.frames} frames, delays {max_ms / 2000.0:g}-{args.seconds:g} s,"
+        f" {args.interp}, mapped files in {directory}"
+    )
+    print(
+        f"{'storage':<20} {'ring MB':>8} {'RAM MB':>7} {'file MB':>7} {'p50 us':>7} {'p99 us':>7}"
+        f" {'load p99':>8} {'max error':>9}"
+    )
+    reference = {}
+    for engine_kind, fmt, mapped in cases:
+        gc.collect()
+        before = _resident_mb()
+        server = FakeServer(args.rate, args.frames)
+        system = server.add_system(args.channels, args.channels)
+        engine = JDelayEngine(
+            args.channels,
+            max_ms,
+            delays,
+            [args.interp] * args.channels,
+            client_factory=server.Client,
+            realtime=engine_kind == "rt",
+            buffer_format=fmt,
+            buffer_dir=mapped,
+        )
+        engine.activate()
+        for i in range(args.channels):
+            server.connect(system.outports[i], engine.in_ports[i])
+        # The whole delay line is filled before the timed periods.
+        times = np.zeros(periods)
+        outputs = np.zeros((args.channels, args.periods * args.frames), dtype=np.float32)
+        for k in range(periods):
+            chunk = signal[:, (k % 64) * args.frames : (k % 64 + 1) * args.frames]
+            for i, port in enumerate(system.outports):
+                port.get_array()[:] = chunk[i]
+            server.cycle(times, k, engine.client)
+            if k >= periods - args.periods:
+                at = (k - periods + args.periods) * args.frames
+                for i, port in enumerate(engine.out_ports):
+                    outputs[i, at : at + args.frames] = port.get_array()
+        after = _resident_mb()
+        _, total = engine.dsp.memory_usage()
+        engine.close()
+        times = times[-args.periods :] * 1e6
+        budget_us = args.frames / args.rate * 1e6
+        error = ""
+        if fmt == "float32":
+            reference[engine_kind] = outputs
+        elif engine_kind in reference:
+            error = f"{np.abs(outputs - reference[engine_kind]).max():.2e}"
+        ram = file = "-"
+        if before and after:
+            ram, file = f"{after[0] - before[0]:.0f}", f"{after[1] - before[1]:.0f}"
+        label = f"{engine_kind} {fmt}{' mapped' if mapped else ''}"
+        print(
+            f"{label:<20} {total / 1e6:>8.1f} {ram:>7} {file:>7} {np.median(times):>7.0f}"
+            f" {np.percentile(times, 99):>7.0f} {np.percentile(times, 99) / budget_us:>8.0%} {error:>9}"
+        )
+    if not args.dir:
+        os.rmdir(directory)
+
+
+class NoiseSource:
+    # A client on the fake server playing seeded noise on out_N, indexed by the
+    # server's frame time, so delayed outputs can be checked sample by sample.
+    # Clients run in creation order: create it before the engine.
+    LENGTH = 1 << 18
+
+    def __init__(self, server, channels, seed=0, name="noise"):
+        self.server = server
+        self.signal = np.random.default_rng(seed).standard_normal((channels, self.LENGTH)).astype(np.float32)
+        self.client = server.Client(name)
+        for i in range(channels):
+            self.client.outports.register(f"out_{i+1}")
+        self.client.set_process_callback(self.process)
+        self.client.activate()
+
+    def process(self, frames):
+        index = (self.server.frame_time + np.arange(frames)) % self.LENGTH
+        for port, row in zip(self.client.outports, self.signal):
+            port.get_array()[:] = row[index]
+
+    def expected(self, channel, time, frames, delay):
+        # What `channel` delayed by `delay` whole frames plays in the period
+        # starting at `time`.
+        return self.signal[channel, (time - delay + np.arange(frames)) % self.LENGTH]
+
+
+class Recorder:
+    # A client on the fake server keeping (frame time, buffers) of `ports`
+    # every period while `recording`. Create it after the client it records.
+    def __init__(self, server, ports, name="recorder"):
+        self.server = server
+        self.ports = list(ports)
+        self.blocks = []
+        self.recording = False
+        self.client = server.Client(name)
+        self.client.set_process_callback(self.process)
+        self.client.activate()
+
+    def process(self, frames):
+        if self.recording:
+            self.blocks.append((self.server.frame_time, np.array([p.get_array() for p in self.ports])))
+
+
+def bench_resize(args):
+    # Channel count changes while the fake server runs in real time: time until
+    # the engine runs the new count, overruns in the window, whether the
+    # connections of the remaining channels survived, and output samples of
+    # the kept channels that differ from their delayed input. Delays are whole
+    # samples, so every kept channel whose delay the change leaves alone must
+    # come out exact. The delays first go up to --max and back, so the rings
+    # stay larger than those of the successors built for later changes.
+    rng = np.random.default_rng(6)
+    n = args.channels
+    server = FakeServer(args.rate, args.frames)
+    system = server.add_system(n + 2, n + 2)
+    source = NoiseSource(server, n + 2)
+    frames_per_ms = args.rate / 1000.0
+    delays = list(np.round(rng.uniform(0, args.delay, n) * frames_per_ms) / frames_per_ms)
+    engine = JDelayEngine(
+        n,
+        args.max,
+        delays,
+        ["cubic"] * n,
+        client_factory=server.Client,
+        realtime=args.rt,
+        threads=args.threads,
+    )
+    engine.activate()
+    for i in range(n):
+        server.connect(source.client.outports[i], engine.in_ports[i])
+        server.connect(engine.out_ports[i], system.inports[i])
+    recorder = Recorder(server, engine.out_ports)
+    server.start()
+    half = n // 2
+    # The first half of the preset's channels keep their delays.
+    preset = delays[: half // 2] + list(
+        np.round(rng.uniform(0, args.delay, half - half // 2) * frames_per_ms) / frames_per_ms
+    )
+    changes = (
+        (f"raise delays to {args.max:g} ms", n, [args.max] * n),
+        ("lower them again", n, delays),
+        ("add 2 channels", n + 2, None),
+        ("remove 2 channels", n, None),
+        (f"recall {half}-channel preset", half, preset),
+    )
+    print(
+        f"{n} channels @ {args.rate} Hz, {args.frames} frames, {'rt' if args.rt else 'standard'} engine,"
+        f" {args.threads} thread(s)"
+    )
+    print(
+        f"{'change':<28} {'applied after':>13} {'xruns':>6} {'max load':>9} {'connections':>12} {'wrong samples':>14}"
+    )
+    failures = 0
+    for label, channels, target in changes:
+        time.sleep(0.5)
+        kept = min(channels, engine.channels)
+        before = [round(d * frames_per_ms) for d in engine.delays_ms[:kept]]
+        engine.stats.reset()
+        recorder.blocks = []
+        recorder.recording = True
+        start = time.perf_counter()
+        engine.configure(channels=channels, delays_ms=target)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.5)
+        recorder.recording = False
+        stats = engine.stats.snapshot()
+        intact = sum(1 for i in range(kept) if engine.in_ports[i].connections and engine.out_ports[i].connections)
+        after = [round(d * frames_per_ms) for d in engine.delays_ms[:kept]]
+        wrong = 0
+        for t, block in recorder.blocks:
+            for c in range(kept):
+                if before[c] == after[c]:
+                    wrong += int(
+                        np.count_nonzero(np.abs(block[c] - source.expected(c, t, len(block[c]), before[c])) > 1e-6)
+                    )
+        status = ""
+        if intact < kept:
+            status = " CONNECTIONS LOST"
+        elif wrong:
+            status = " WRONG AUDIO"
+        failures += bool(status)
+        print(
+            f"{label:<28} {elapsed * 1000:>10.0f} ms {stats['xruns']:>6} {stats['max_load']:>8.0%}"
+            f" {f'{intact}/{kept}':>12} {wrong:>14}{status}"
+        )
+    server.stop()
+    engine.close()
+    if failures:
+        print(f"{failures} change(s) failed")
+        return 1
+    return 0
+
+
+def bench_osc(args):
+    # OSC control on localhost against an engine on a paced fake server: a
+    # sender thread streams delay changes for every channel, one message per
+    # channel or one bulk message per update, and the control side should
+    # publish at most once per period however many messages arrive. Fails if a
+    # message is lost, a period gets more than one publish or the engine does
+    # not end at the last delays sent.
+    import threading
+
+    from jdelay_osc import OscClient, OscControl
+
+    server = FakeServer(args.rate, args.frames)
+    engine = JDelayEngine(args.channels, args.max, None, ["linear"] * args.channels, client_factory=server.Client)
+    engine.activate()
+    osc = OscControl(engine, "127.0.0.1", 0)
+    osc.start()
+    server.start()
+    client = OscClient("127.0.0.1", osc.port)
+    period = args.frames / args.rate
+    print(f"{args.channels} channels, {args.updates:g} updates/s for {args.seconds:g} s, period {period * 1000:.2f} ms")
+    print(
+        f"{'messages':<12} {'sent':>8} {'received':>9} {'publishes':>10} {'per period':>11} {'xruns':>6} {'max load':>9}"
+    )
+    failures = 0
+    for mode in ("per-channel", "bulk"):
+        time.sleep(0.3)
+        engine.stats.reset()
+        received, publishes = osc.received, osc.publishes
+        sent = 0
+        start = time.perf_counter()
+        updates = int(args.updates * args.seconds)
+
+        def send():
+            nonlocal sent
+            for k in range(updates):
+                delays = [float((k + c) % 100) for c in range(args.channels)]
+                if mode == "bulk":
+                    client.send("/jdelay/delays", *delays)
+                    sent += 1
+                else:
+                    for c, ms in enumerate(delays):
+                        client.send("/jdelay/delay", c + 1, ms)
+                    sent += args.channels
+                wait = start + (k + 1) / args.updates - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        sender.join()
+        time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+        stats = engine.stats.snapshot()
+        count = osc.publishes - publishes
+        last = [float((updates - 1 + c) % 100) for c in range(args.channels)]
+        status = ""
+        if osc.received - received != sent:
+            status = " LOST"
+        elif count > elapsed / period + 1:
+            status = " TOO MANY PUBLISHES"
+        elif list(engine.delays_ms) != last:
+            status = " WRONG DELAYS"
+        failures += bool(status)
+        print(
+            f"{mode:<12} {sent:>8} {osc.received - received:>9} {count:>10} {count / (elapsed / period):>11.2f}"
+            f" {stats['xruns']:>6} {stats['max_load']:>8.0%}{status}"
+        )
+    client.close()
+    server.stop()
+    osc.stop()
+    engine.close()
+    if failures:
+        print(f"{failures} mode(s) failed")
+        return 1
+    return 0
+
+
+def bench_groups(args):
+    # Full engine callback for delay layouts with fewer and fewer distinct
+    # delays: every channel different, linked pairs, eight shared delays, one
+    # shared delay and all at 0 ms (bypass), then every channel distinct with
+    # only half of the inputs connected. Median callback time in us.
+    rng = np.random.default_rng(9)
+    layouts = (
+        ("all distinct", lambda c: rng.uniform(1, args.max, c), 1.0),
+        ("stereo pairs", lambda c: np.repeat(rng.uniform(1, args.max, c // 2), 2), 1.0),
+        ("8 distinct", lambda c: rng.choice(rng.uniform(1, args.max, 8), c), 1.0),
+        ("1 shared", lambda c: np.full(c, args.max / 2), 1.0),
+        ("all 0 ms", lambda c: np.zeros(c), 1.0),
+        ("half connected", lambda c: rng.uniform(1, args.max, c), 0.5),
+    )
+    print(
+        f"{args.frames} frames @ {args.rate} Hz, {'rt' if args.rt else 'standard'} engine,"
+        f" {args.interp} interpolation; median us per callback"
+    )
+    print(f"{'layout':<16} " + " ".join(f"{f'{c} ch':>8}" for c in args.channels))
+    for label, make, connected in layouts:
+        cells = []
+        for channels in args.channels:
+            server = FakeServer(args.rate, args.frames)
+            system = server.add_system(channels, channels)
+            for port in system.outports:
+                port.get_array()[:] = rng.standard_normal(args.frames)
+            engine = JDelayEngine(
+                channels,
+                args.max,
+                list(make(channels)),
+                [args.interp] * channels,
+                client_factory=server.Client,
+                realtime=args.rt,
+            )
+            engine.activate()
+            for i in range(channels):
+                if i < channels * connected:
+                    server.connect(system.outports[i], engine.in_ports[i])
+                server.connect(engine.out_ports[i], system.inports[i])
+            server.run(50)
+            cells.append(np.median(server.run(args.periods, engine.client)) * 1e6)
+            engine.close()
+        print(f"{label:<16} " + " ".join(f"{t:>8.0f}" for t in cells))
+
+
+def bench_shards(args):
+    # Full engine callback with the channels sharded over 1..N threads, on a
+    # fake server run back to back. Sharding pays off once the per-shard
+    # array work outweighs the wake-up of the workers; on a single core it
+    # only adds that overhead. Median and p99 callback times, in us.
+    rng = np.random.default_rng(8)
+    budget_us = args.frames / args.rate * 1e6
+    print(
+        f"{args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us), {os.cpu_count()} CPUs,"
+        f" {'rt' if args.rt else 'standard'} engine, {args.interp} interpolation"
+    )
+    print(f"{'channels':>8} " + " ".join(f"{f'{t} thr p50/p99':>18}" for t in args.threads) + f" {'best':>6}")
+    for channels in args.channels:
+        results = []
+        for threads in args.threads:
+            server = FakeServer(args.rate, args.frames)
+            system = server.add_system(channels, channels)
+            for port in system.outports:
+                port.get_array()[:] = rng.standard_normal(args.frames)
+            delays = list(rng.uniform(0, args.max, channels))
+            engine = JDelayEngine(
+                channels,
+                args.max,
+                delays,
+                [args.interp] * channels,
+                client_factory=server.Client,
+                realtime=args.rt,
+                threads=threads,
+            )
+            engine.activate()
+            for i in range(channels):
+                server.connect(system.outports[i], engine.in_ports[i])
+                server.connect(engine.out_ports[i], system.inports[i])
+            server.run(50)
+            times = server.run(args.periods, engine.client) * 1e6
+            engine.close()
+            results.append((np.median(times), np.percentile(times, 99)))
+        best = args.threads[int(np.argmin([p50 for p50, _ in results]))]
+        cells = " ".join(f"{f'{p50:.0f}/{p99:.0f}':>18}" for p50, p99 in results)
+        print(f"{channels:>8} {cells} {f'{best} thr':>6}")
+
+
+def bench_meters(args):
+    # Full engine callback with and without the input level meters. Both
+    # engines run on their own fake server, alternating in rounds of 50
+    # periods so drifting machine load hits both alike. The added median is
+    # what metering costs per period, also as a share of the time budget.
+    rng = np.random.default_rng(9)
+    budget_us = args.frames / args.rate * 1e6
+    print(
+        f"{args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us),"
+        f" {'rt' if args.rt else 'standard'} engine, {args.interp} interpolation; p50/p99 us per callback"
+    )
+    print(f"{'channels':>8} {'no meters':>12} {'meters':>12} {'added p50':>10} {'of budget':>10}")
+    for channels in args.channels:
+        delays = list(rng.uniform(0, args.max, channels))
+        engines = []
+        for meters in (False, True):
+            server = FakeServer(args.rate, args.frames)
+            system = server.add_system(channels, channels)
+            for port in system.outports:
+                port.get_array()[:] = rng.standard_normal(args.frames)
+            engine = JDelayEngine(
+                channels,
+                args.max,
+                delays,
+                [args.interp] * channels,
+                client_factory=server.Client,
+                realtime=args.rt,
+                meters=meters,
+            )
+            engine.activate()
+            for i in range(channels):
+                server.connect(system.outports[i], engine.in_ports[i])
+            server.run(50)
+            engines.append((server, engine, []))
+        for _ in range(max(args.periods // 50, 1)):
+            for server, engine, times in engines:
+                times.append(server.run(50, engine.client))
+        results = []
+        for server, engine, times in engines:
+            engine.close()
+            times = np.concatenate(times) * 1e6
+            results.append((np.median(times), np.percentile(times, 99)))
+        added = results[1][0] - results[0][0]
+        cells = " ".join(f"{f'{p50:.0f}/{p99:.0f}':>12}" for p50, p99 in results)
+        print(f"{channels:>8} {cells} {added:>10.1f} {added / budget_us:>10.1%}")
+
+
+def bench_retune(args):
+    # A running engine on the fake server through the sample rate and period
+    # changes of RETUNE_STEPS. Every channel plays a sine, delayed by whole
+    # samples at each rate, so every output sample after a change can be
+    # checked against the ideal delayed sine: exact across period changes,
+    # within --tolerance where the history was resampled (not checked when
+    # --no-resample drops it). Also times
+    # the change itself (engine.retune on the notification thread) and, for
+    # --rt, checks the callbacks after it allocate nothing.
+    delays = [10.0 * (i % 5 + 1) for i in range(args.channels)]
+    freqs = [110.0 * (i + 1) for i in range(args.channels)]
+    server = FakeServer(48000, 256)
+    system = server.add_system(args.channels, args.channels)
+    engine = JDelayEngine(
+        args.channels,
+        100.0,
+        delays,
+        client_factory=server.Client,
+        realtime=args.rt,
+        threads=args.threads,
+        resample=not args.no_resample,
+    )
+    engine.activate()
+    for i in range(args.channels):
+        server.connect(system.outports[i], engine.in_ports[i])
+    clock = [0.0]
+
+    def play(periods, errors=None):
+        rate, frames = server.samplerate, server.blocksize
+        for _ in range(periods):
+            t = clock[0] + np.arange(frames) / rate
+            for i, port in enumerate(system.outports):
+                port.get_array()[:] = np.sin(2 * np.pi * freqs[i] * t)
+            server.cycle()
+            if errors is not None:
+                for i, port in enumerate(engine.out_ports):
+                    ideal = np.sin(2 * np.pi * freqs[i] * (t - delays[i] / 1000.0))
+                    # Nothing was played before time 0.
+                    ideal[t < delays[i] / 1000.0] = 0.0
+                    errors.append(np.abs(port.get_array() - ideal).max())
+            clock[0] += frames / rate
+
+    play(args.periods)
+    noop_net, noop_peak = traced_allocations(lambda frames: None, 64, 50)
+    failures = 0
+    print(
+        f"{args.channels} channels, {'rt' if args.rt else 'standard'} engine, {args.threads} thread(s),"
+        f" history {'dropped' if args.no_resample else 'resampled'} on rate changes"
+    )
+    print(f"{'change':<22} {'retune ms':>9} {'max error':>10} {'retained B':>10} {'transient B':>11}")
+    for rate, frames in RETUNE_STEPS:
+        before = (server.samplerate, server.blocksize)
+        start = time.perf_counter()
+        server.reconfigure(rate, frames)
+        elapsed = time.perf_counter() - start
+        errors = []
+        play(args.periods, errors)
+        net = peak = 0
+        if args.rt:
+            # The callback alone, as in the alloc benchmark; it runs on stale
+            # inputs, so the delay lines are refilled afterwards.
+            engine.wait_latency()
+            net, peak = traced_allocations(engine.process, server.blocksize, 50)
+            net, peak = max(net - noop_net, 0), max(peak - noop_peak, 0)
+            clock[0] += 60 * server.blocksize / server.samplerate
+            play(int(max(delays) / 1000.0 * server.samplerate / server.blocksize) + 2)
+        error = max(errors)
+        rate_changed = server.samplerate != before[0]
+        if rate_changed and args.no_resample:
+            ok = True
+        else:
+            ok = error <= (args.tolerance if rate_changed else 1e-5) and net == 0 and peak == 0
+        failures += not ok
+        label = f"{before[0]}/{before[1]} -> {server.samplerate}/{server.blocksize}"
+        print(f"{label:<22} {elapsed * 1000:>9.2f} {error:>10.2e} {net:>10} {peak:>11}{'' if ok else ' FAIL'}")
+    engine.close()
+    if failures:
+        print(f"{failures} change(s) lost continuity or allocate")
+        return 1
+    print("Sample rate and period changes: continuous output")
+    return 0
+
+
+def bench_latency(args):
+    # Automatic latency compensation against a stand-in graph on the fake
+    # server: system capture -> "pre" plugin (first half) -> J-Delay -> "post"
+    # plugin (second half) -> system playback, the plugins reporting their
+    # latencies. After each graph change the engine has to settle with every
+    # connected channel of a group at the same total latency, as reported to
+    # system:playback_N through J-Delay's own latency reports; an impulse
+    # through the finished graph checks the audio lines up too.
+    n = args.channels
+    half = n // 2
+    server = FakeServer(48000, 256)
+    system = server.add_system(n, n, capture_latency=256, playback_latency=512)
+    pre = server.add_loopback([16 + 37 * i for i in range(half)], "pre", report_latency=True)
+    engine = JDelayEngine(n, 1000.0, client_factory=server.Client, latency_groups=args.groups)
+    engine.activate()
+    post = server.add_loopback([16 + 53 * i for i in range(n - half)], "post", report_latency=True)
+    extra = server.add_loopback([300], "extra", report_latency=True)
+    groups = [range(n)] if args.groups == "all" else args.groups
+
+    def totals():
+        return [system.inports[i].get_latency_range(CAPTURE)[1] + 512 for i in range(n)]
+
+    def spread():
+        # Largest difference of total latency within a group, connected channels only.
+        total = totals()
+        worst = 0
+        for group in groups:
+            values = [total[i] for i in group if i < n and engine.path_latency(i) is not None]
+            if values:
+                worst = max(worst, max(values) - min(values))
+        return worst
+
+    def connect_all():
+        for i in range(n):
+            if i < half:
+                server.connect(system.outports[i], pre.client.inports[i])
+                server.connect(pre.client.outports[i], engine.in_ports[i])
+                server.connect(engine.out_ports[i], system.inports[i])
+            else:
+                server.connect(system.outports[i], engine.in_ports[i])
+                server.connect(engine.out_ports[i], post.client.inports[i - half])
+                server.connect(post.client.outports[i - half], system.inports[i])
+
+    def reroute():
+        server.disconnect(engine.out_ports[0], system.inports[0])
+        server.connect(engine.out_ports[0], extra.client.inports[0])
+        server.connect(extra.client.outports[0], system.inports[0])
+
+    def unplug():
+        server.disconnect(system.outports[n - 1], engine.in_ports[n - 1])
+
+    steps = (("connect graph", connect_all), ("reroute ch 1 via +300", reroute), (f"unplug ch {n} input", unplug))
+    print(f"{n} channels, groups: {args.groups if args.groups == 'all' else ','.join(str(len(g)) for g in groups)}")
+    print(f"{'step':<24} {'settle ms':>9} {'updates':>7} {'delays set':>10} {'spread':>6}")
+    failures = 0
+    for label, change in steps:
+        before = list(engine.delays_ms)
+        updates = engine.compensations
+        start = time.perf_counter()
+        change()
+        # The server recomputes latencies before the next cycle, like JACK.
+        server.cycle()
+        settled = engine.wait_latency()
+        elapsed = time.perf_counter() - start
+        changed = sum(a != b for a, b in zip(before, engine.delays_ms))
+        worst = spread()
+        ok = settled and worst == 0
+        failures += not ok
+        print(
+            f"{label:<24} {elapsed * 1000:>9.2f} {engine.compensations - updates:>7} {changed:>10} {worst:>6}"
+            f"{'' if ok else ' FAIL'}"
+        )
+
+    # Grown rings and the crossfade to the new delays finish first, so the
+    # impulse meets the compensated delays only.
+    dsp = engine.dsp
+    while dsp._live is not dsp.params:
+        server.cycle()
+    server.run(dsp.fade_frames // server.blocksize + 1)
+    # An impulse on every capture port at once; system is first in client
+    # order, so every arrival is one period late alike.
+    periods = max(totals()) // server.blocksize + 4
+    recorded = np.zeros((n, periods * server.blocksize), dtype=np.float32)
+    for k in range(periods):
+        for i, port in enumerate(system.outports):
+            port.get_array()[:] = 0.0
+            port.get_array()[0] = 1.0 if k == 0 else 0.0
+        server.cycle()
+        for i, port in enumerate(system.inports):
+            recorded[i, k * server.blocksize : (k + 1) * server.blocksize] = port.get_array()
+    arrivals = recorded.argmax(axis=1)
+    engine.close()
+    audio = 0
+    for group in groups:
+        members = [i for i in group if i < n - 1]
+        if members:
+            audio = max(audio, int(arrivals[members].max() - arrivals[members].min()))
+    print(f"Impulse arrival spread within groups: {audio} frames")
+    failures += audio != 0
+    if failures:
+        print(f"{failures} check(s) failed")
+        return 1
+    print("Latency compensation: all groups aligned")
+    return 0
+
+
+def bench_taps(args):
+    # Channels with K extra taps each against the same outputs built from
+    # duplicated channels (one input fanned out to K + 1 channels), on fake
+    # servers fed the same noise. Taps read their channel's ring, so buffer
+    # memory stays with the channel count; the outputs must match exactly.
+    # Median and p99 callback times in us; with --rt, taps are also checked
+    # for allocations in the callback.
+    rng = np.random.default_rng(10)
+    n = args.channels
+    budget_us = args.frames / args.rate * 1e6
+    print(
+        f"{n} channels, {args.frames} frames @ {args.rate} Hz (budget {budget_us:.0f} us),"
+        f" {'rt' if args.rt else 'standard'} engine, {args.interp} interpolation"
+    )
+    print(f"{'taps/ch':>7} {'outputs':>7} {'layout':<10} {'buffers MB':>10} {'p50 us':>7} {'p99 us':>7} {'max err':>8}")
+    noop = traced_allocations(lambda frames: None, 64, args.periods) if args.rt else None
+    failures = 0
+    for count in args.taps:
+        delays = list(rng.uniform(0, args.max, n * (count + 1)))
+        taps = [(c, delays[n + c * count + k]) for c in range(n) for k in range(count)]
+        sources = list(range(n)) + [c for c, _ in taps]
+        noise = rng.standard_normal((n, args.frames)).astype(np.float32)
+        results = []
+        for layout in ("taps", "channels"):
+            server = FakeServer(args.rate, args.frames)
+            system = server.add_system(n, 0)
+            for port, row in zip(system.outports, noise):
+                port.get_array()[:] = row
+            if layout == "taps":
+                channels = n
+                engine = JDelayEngine(
+                    n,
+                    args.max,
+                    delays[:n],
+                    [args.interp] * n,
+                    client_factory=server.Client,
+                    realtime=args.rt,
+                    taps=taps,
+                )
+            else:
+                channels = len(sources)
+                engine = JDelayEngine(
+                    channels, args.max, delays, [args.interp] * channels, client_factory=server.Client, realtime=args.rt
+                )
+            engine.activate()
+            for i in range(channels):
+                server.connect(system.outports[sources[i]], engine.in_ports[i])
+            # Fill the delay lines, so both layouts read real history.
+            server.run(int(args.max / 1000.0 * args.rate) // args.frames + 2)
+            times = server.run(args.periods, engine.client) * 1e6
+            outputs = np.array([p.get_array() for p in engine.out_ports + engine.tap_ports])
+            _, total = engine.dsp.memory_usage()
+            allocated = None
+            if layout == "taps" and args.rt:
+                engine.wait_latency()
+                traced_allocations(engine.process, args.frames, 10)
+                net, peak = traced_allocations(engine.process, args.frames, args.periods)
+                allocated = max(net - noop[0], 0) + max(peak - noop[1], 0)
+            engine.close()
+            results.append((layout, total, times, outputs, allocated))
+        reference = results[1][3]
+        for layout, total, times, outputs, allocated in results:
+            error = float(np.abs(outputs - reference).max())
+            status = ""
+            if error > 0.0:
+                status = " MISMATCH"
+            elif allocated:
+                status = f" ALLOCATES {allocated} B"
+            failures += bool(status)
+            print(
+                f"{count:>7} {len(sources):>7} {layout:<10} {total / 1e6:>10.2f}"
+                f" {np.median(times):>7.0f} {np.percentile(times, 99):>7.0f} {error:>8.1e}{status}"
+            )
+    if failures:
+        print(f"{failures} case(s) failed")
+        return 1
+    return 0
+
+
+def _impulse_arrivals(server, channels, outputs, periods):
+    # Frame at which an impulse on every system capture port reaches each of
+    # the first `outputs` playback ports, after `periods` of silence.
+    captures = [server.port(f"system:capture_{i+1}") for i in range(channels)]
+    playbacks = [server.port(f"system:playback_{i+1}") for i in range(outputs)]
+    for port in captures:
+        port.get_array()[:] = 0.0
+    server.run(periods)
+    for port in captures:
+        port.get_array()[0] = 1.0
+    recorded = []
+    for _ in range(periods):
+        server.cycle()
+        for port in captures:
+            port.get_array()[:] = 0.0
+        recorded.append([p.get_array().copy() for p in playbacks])
+    return list(np.abs(np.concatenate(recorded, axis=1)).argmax(axis=1))
+
+
+def bench_reconnect(args):
+    # The fake server shuts down under a running engine (channels plus one tap
+    # each, all connected to system ports) and restarts after each downtime.
+    # Reports the time from the restart to the first callback with everything
+    # reconnected, the engine's own restore time (open to audio), the reconnect
+    # attempts, restored connections, and whether impulses still arrive where
+    # they did before the loss.
+    rng = np.random.default_rng(11)
+    n = args.channels
+    server = FakeServer(args.rate, args.frames)
+    server.add_system(n, 2 * n)
+    delays = list(rng.uniform(0, args.delay, 2 * n))
+    engine = JDelayEngine(
+        n,
+        args.max,
+        delays[:n],
+        client_factory=server.Client,
+        realtime=args.rt,
+        taps=[(c, delays[n + c]) for c in range(n)],
+    )
+    engine.activate()
+    for i in range(n):
+        server.connect(f"system:capture_{i+1}", engine.in_ports[i])
+        server.connect(engine.out_ports[i], f"system:playback_{i+1}")
+        server.connect(engine.tap_ports[i], f"system:playback_{n + i + 1}")
+    expected = sorted((s.name, d.name) for s, d in server.connections)
+    flush = int(args.max / 1000.0 * args.rate) // args.frames + 2
+    arrivals = _impulse_arrivals(server, n, 2 * n, flush)
+    print(
+        f"{n} channels + {n} taps, {len(expected)} connections, {args.frames} frames @ {args.rate} Hz,"
+        f" {'rt' if args.rt else 'standard'} engine"
+    )
+    print(f"{'downtime':>9} {'back->audio':>12} {'restore':>9} {'attempts':>8} {'connections':>12} {'audio':>6}")
+    failures = 0
+    for downtime in args.downtime:
+        server.start()
+        time.sleep(0.2)
+        recoveries = engine.recoveries
+        server.shutdown()
+        time.sleep(downtime)
+        start = time.perf_counter()
+        server.restart()
+        while engine.recoveries == recoveries and time.perf_counter() - start < 10.0:
+            time.sleep(0.0005)
+        elapsed = time.perf_counter() - start
+        server.stop()
+        if engine.recoveries == recoveries:
+            print(f"{downtime * 1000:>6.0f} ms  no recovery")
+            failures += 1
+            continue
+        recovery = engine.recovery
+        connected = sorted((s.name, d.name) for s, d in server.connections)
+        audio = _impulse_arrivals(server, n, 2 * n, flush) == arrivals
+        status = ""
+        if connected != expected:
+            status = " CONNECTIONS LOST"
+        elif not audio:
+            status = " WRONG AUDIO"
+        failures += bool(status)
+        print(
+            f"{downtime * 1000:>6.0f} ms {elapsed * 1000:>9.1f} ms {recovery['restore_ms']:>6.1f} ms"
+            f" {recovery['attempts']:>8} {f'{len(connected)}/{len(expected)}':>12} {'ok' if audio else 'wrong':>6}{status}"
+        )
+    engine.close()
+    if failures:
+        print(f"{failures} case(s) failed")
+        return 1
+    return 0
+
+
+def bench_presets(args):
+    # The preset store in a temporary directory: the cost of a save call on the
+    # caller's thread, of a recall up to the published parameters of a running
+    # engine, and of one full autosave to disk with every slot filled.
+    from jdelay_presets import PRESET_SLOTS, PresetStore
+
+    rng = np.random.default_rng(7)
+    server = FakeServer(args.rate, args.frames)
+    engine = JDelayEngine(args.channels, args.max, client_factory=server.Client)
+    engine.activate()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PresetStore(os.path.join(tmp, "presets.json"), None)
+        saves = []
+        for slot in range(1, PRESET_SLOTS + 1):
+            delays = list(rng.uniform(0, args.max, args.channels))
+            names = {c + 1: f"Channel {slot}.{c + 1}" for c in range(args.channels)}
+            start = time.perf_counter()
+            store.save_preset(slot, args.channels, delays, ["cubic"] * args.channels, names)
+            saves.append(time.perf_counter() - start)
+        recalls = []
+        for slot in range(1, PRESET_SLOTS + 1):
+            start = time.perf_counter()
+            channels, _, delays, interp, taps = store.preset(slot)
+            engine.configure(channels, delays, interp, taps)
+            recalls.append(time.perf_counter() - start)
+            server.cycle()
+        start = time.perf_counter()
+        store.flush()
+        write = time.perf_counter() - start
+        size = os.path.getsize(store.path)
+    engine.close()
+    print(f"{PRESET_SLOTS} slots x {args.channels} channels, file {size / 1024:.0f} KiB")
+    for label, times in (("save call", saves), ("recall + publish", recalls)):
+        times = np.array(times) * 1e6
+        print(f"{label:<18} median {np.median(times):>8.1f} us   max {times.max():>8.1f} us")
+    print(f"{'autosave write':<18} {write * 1000:>8.1f} ms")
+
+
+def bench_gui(args):
+    # Tk cost of the channel list against channel count: building the window,
+    # a full re-render, adding two channels, renaming one, scrolling to the end
+    # and a linked slider drag of DRAG_EVENTS motion events, 2 ms apart, with
+    # the number of parameter publishes it caused. Needs a display; the app
+    # never connects to JACK here.
+    import importlib.util
+    import tkinter as tk
+
+    spec = importlib.util.spec_from_file_location("jdelay_gui", os.path.join(os.path.dirname(__file__), "J-Delay.py"))
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    gui.JACK_AVAILABLE = True
+
+    class BenchApp(gui.JDelayApp):
+        publishes = 0
+
+        def initial_connect(self):
+            pass
+
+        def _stats_loop(self):
+            pass
+
+        def publish_params(self):
+            self.publishes += 1
+            super().publish_params()
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"No display for Tk: {e}")
+        return 1
+    root.withdraw()
+
+    def timed(action):
+        start = time.perf_counter()
+        action()
+        window.update()
+        return (time.perf_counter() - start) * 1000
+
+    def drag(app):
+        app.engine.set_link(0, True)
+        app.publishes = 0
+        for k in range(DRAG_EVENTS):
+            app.update_from_slider(0, k * args.max / DRAG_EVENTS)
+            window.update()
+            time.sleep(0.002)
+        app.flush_ui()
+
+    print(
+        f"{'channels':>8} {'build':>9} {'render':>9} {'+2 ch':>9} {'rename':>9} {'scroll':>9} {'drag':>9}"
+        f" {'publishes':>9} {'rows':>5}"
+    )
+    for channels in args.channels:
+        window = tk.Toplevel(root)
+        app = None
+
+        def build():
+            nonlocal app
+            app = BenchApp(window, channels=channels, max_delay_ms=args.max)
+
+        build_ms = timed(build)
+        render_ms = timed(app.render_channels)
+        add_ms = timed(app.add_channels)
+        app.channel_names[1] = "Renamed"
+        rename_ms = timed(lambda: app.refresh_row(0))
+        scroll_ms = timed(lambda: app._on_scroll("moveto", 1.0))
+        app._on_scroll("moveto", 0.0)
+        drag_ms = timed(lambda: drag(app))
+        rows = len(app.rows) + len(app.spare_rows)
+        print(
+            f"{channels:>8} {build_ms:>6.1f} ms {render_ms:>6.1f} ms {add_ms:>6.1f} ms {rename_ms:>6.1f} ms"
+            f" {scroll_ms:>6.1f} ms {drag_ms:>6.0f} ms {app.publishes:>9} {rows:>5}"
+        )
+        app.engine.close()
+        window.destroy()
+    root.destroy()
+    return 0
+
+
+def run_suite_case(channels, frames, rate, delays, max_ms, periods, warmup=50):
+    # Runs the full engine callback (port copies included) on a fake server
+    # and returns the per-callback durations in seconds.
+    rng = np.random.default_rng(channels * 7919 + frames)
+    interp, spread = SUITE_DELAYS[delays]
+    delays_ms = list(rng.uniform(0, max_ms, channels)) if spread else [0.0] * channels
+    server = FakeServer(rate, frames)
+    system = server.add_system(channels, channels)
+    for port in system.outports:
+        port.get_array()[:] = rng.standard_normal(frames)
+    engine = JDelayEngine(channels, max_ms, delays_ms, [interp] * channels, client_factory=server.Client)
+    engine.activate()
+    for i in range(channels):
+        server.connect(system.outports[i], engine.in_ports[i])
+        server.connect(engine.out_ports[i], system.inports[i])
+    server.run(warmup)
+    timings = server.run(periods, engine.client)
+    engine.close()
+    return timings
+
+
+def suite_key(channels, frames, rate, delays):
+    return f"{channels}ch/{frames}f/{rate}Hz/{delays}"
+
+
+def suite_case(key):
+    channels, frames, rate, delays = key.split("/")
+    return int(channels[:-2]), int(frames[:-1]), int(rate[:-2]), delays
+
+
+def suite_stats(channels, frames, rate, delays, args):
+    timings = run_suite_case(channels, frames, rate, delays, args.max, args.periods) * 1e6
+    p50, p99 = np.percentile(timings, [50, 99])
+    return {"p50_us": p50, "p99_us": p99, "max_us": timings.max(), "deadline_us": frames / rate * 1e6}
+
+
+def suite_regressions(key, result, baseline, args):
+    regressions = []
+    for stat in ("p50_us", "p99_us"):
+        limit = baseline[key][stat] * (1 + args.tolerance) + args.slack
+        if result[stat] > limit:
+            regressions.append(
+                f"{key} {stat[:3]} {result[stat]:.1f} us > {limit:.1f} us (baseline {baseline[key][stat]:.1f})"
+            )
+    return regressions
+
+
+def bench_suite(args):
+    results = {}
+    print(f"{'case':<28} {'p50 us':>9} {'p99 us':>9} {'max us':>9} {'deadline':>9} {'p99 load':>9}")
+    for rate in args.rates:
+        for frames in args.frames:
+            deadline_us = frames / rate * 1e6
+            for channels in args.channels:
+                for delays in args.delays:
+                    key = suite_key(channels, frames, rate, delays)
+                    results[key] = suite_stats(channels, frames, rate, delays, args)
+                    if args.save_baseline:
+                        # Best of 1 + --retries runs, the most a slow case gets
+                        # in the comparison below.
+                        for _ in range(args.retries):
+                            again = suite_stats(channels, frames, rate, delays, args)
+                            results[key] = {stat: min(results[key][stat], again[stat]) for stat in again}
+                    p50, p99, worst = (results[key][stat] for stat in ("p50_us", "p99_us", "max_us"))
+                    miss = " MISS" if worst > deadline_us else ""
+                    print(
+                        f"{key:<28} {p50:>9.1f} {p99:>9.1f} {worst:>9.1f} {deadline_us:>9.0f}"
+                        f" {p99 / deadline_us:>8.1%}{miss}",
+                        flush=True,
+                    )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.no_baseline or (args.baseline == SUITE_BASELINE and not os.path.exists(args.baseline)):
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    # p50 and p99 are compared; the max of a few thousand callbacks is too noisy
+    # to gate on. A case regresses when it is slower than the baseline by more
+    # than the relative tolerance plus a small absolute slack for timer noise.
+    # A slow case is measured again up to --retries times, keeping the best of
+    # each statistic, so that a burst of load on the machine does not fail the
+    # run; a real regression stays slow on every try.
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        case = suite_case(key)
+        for _ in range(args.retries):
+            if not suite_regressions(key, result, baseline, args):
+                break
+            again = suite_stats(*case, args)
+            result = {stat: min(result[stat], again[stat]) for stat in result}
+            print(f"{key:<28} {result['p50_us']:>9.1f} {result['p99_us']:>9.1f} (best after retry)", flush=True)
+        regressions += suite_regressions(key, result, baseline, args)
+    compared = len(set(results) & set(baseline))
+    print(f"Compared with {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) in {compared} compared cases:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions in {compared} compared cases")
+    return 0
+
+
+def bench_check(args):
+    # Runs the pass/fail benchmarks of CHECKS one after another on the fake
+    # server and exits with code 1 if any of them failed.
+    parser = build_parser()
+    results = []
+    for argv in CHECKS:
+        name = " ".join(argv)
+        if args.only and argv[0] not in args.only:
+            continue
+        print(f"=== {name}", flush=True)
+        start = time.perf_counter()
+        check = parser.parse_args(argv)
+        try:
+            failed = bool(check.func(check))
+        except Exception:
+            # A benchmark that crashes fails, and the others still run.
+            traceback.print_exc()
+            failed = True
+        results.append((name, failed, time.perf_counter() - start))
+        print()
+    width = max((len(name) for name, _, _ in results), default=0)
+    for name, failed, elapsed in results:
+        print(f"{name:<{width}} {elapsed:>6.1f} s  {'FAIL' if failed else 'ok'}")
+    failures = sum(failed for _, failed, _ in results)
+    if failures:
+        print(f"{failures} of {len(results)} check(s) failed")
+        return 1
+    print(f"All {len(results)} checks passed")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="J-Delay benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("channels", help="Per-callback time against channel count")
+    p.add_argument("--channels", type=int, nargs="+", default=[2, 8, 16, 32, 64, 128, 256])
+    p.add_argument("--frames", type=int, default=64)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--periods", type=int, default=2000)
+    p.set_defaults(func=bench_channels)
+
+    p = sub.add_parser("interp", help="CPU cost and accuracy of the fractional delay interpolators")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=64)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--delay", type=float, default=1.2345, help="Delay in ms (use a fractional sample count)")
+    p.add_argument("--freqs", type=float, nargs="+", default=[1000.0, 5000.0, 15000.0])
+    p.add_argument("--periods", type=int, default=1000)
+    p.set_defaults(func=bench_interp)
+
+    p = sub.add_parser("fade", help="Callback cost of crossfaded delay changes")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=64)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--fade", type=float, default=20.0)
+    p.add_argument("--periods", type=int, default=1000)
+    p.set_defaults(func=bench_fade)
+
+    p = sub.add_parser("startup", help="Time from launch to registered JACK ports for the headless daemon")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--fake-jack", action="store_true", help="Launch the daemon against the in-process fake server")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("render", help="Offline render speed and memory use")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--seconds", type=float, default=30.0)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--format", default="pcm24", choices=["pcm16", "pcm24", "pcm32", "float32"])
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--chunk", type=int, default=65536)
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("measure", help="Latency measurement accuracy against simulated loops")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max-loop", type=float, default=2000.0, help="Longest simulated loop in samples")
+    p.add_argument("--signals", nargs="+", default=["impulse", "mls", "sweep"])
+    p.add_argument("--taps", action="store_true", help="Give every channel a tap that also feeds its loop")
+    p.add_argument("--tolerance", type=float, default=0.05, help="Largest accepted error in samples")
+    p.set_defaults(func=bench_measure)
+
+    p = sub.add_parser("alloc", help="Verify the real-time engine allocates nothing per callback")
+    p.add_argument("--channels", type=int, nargs="+", default=[2, 64, 256])
+    p.add_argument("--frames", type=int, nargs="+", default=[16, 256, 2048])
+    p.add_argument("--interp", nargs="+", choices=INTERP_MODES, default=list(INTERP_MODES))
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=100.0)
+    p.add_argument("--periods", type=int, default=200, help="Measured callbacks per case (at most 256)")
+    p.add_argument("--compare", action="store_true", help="Also show the standard engine")
+    p.set_defaults(func=bench_alloc)
+
+    p = sub.add_parser("memory", help="Per-channel ring memory and the cost of growing a ring while running")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=96000)
+    p.add_argument("--max", type=float, default=10000.0)
+    p.add_argument("--delay", type=float, default=20.0, help="Initial delays are spread up to this many ms")
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser(
+        "longdelay", help="Memory and callback cost of long delays per ring storage (RAM, float16, mapped)"
+    )
+    p.add_argument("--channels", type=int, default=32)
+    p.add_argument("--seconds", type=float, default=10.0, help="Longest delay; delays are spread over its upper half")
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--periods", type=int, default=500, help="Timed periods after the delay lines are full")
+    p.add_argument("--interp", choices=INTERP_MODES, default="none")
+    p.add_argument("--dir", help="Directory for the mapped files (default: a new temporary directory)")
+    p.set_defaults(func=bench_longdelay)
+
+    p = sub.add_parser("resize", help="Adding, removing and recalling channels while running")
+    p.add_argument("--channels", type=int, default=32)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--delay", type=float, default=100.0, help="Delays are spread up to this many ms")
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.add_argument("--threads", type=int, default=1, help="Shard the channels over this many threads")
+    p.set_defaults(func=bench_resize)
+
+    p = sub.add_parser("osc", help="OSC update coalescing against a running engine on localhost")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--updates", type=float, default=50.0, help="Updates of every channel per second")
+    p.add_argument("--seconds", type=float, default=2.0)
+    p.set_defaults(func=bench_osc)
+
+    p = sub.add_parser(
+        "groups", help="Callback time against the number of distinct delays, bypass and unconnected inputs"
+    )
+    p.add_argument("--channels", type=int, nargs="+", default=[16, 64, 256])
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=100.0)
+    p.add_argument("--interp", choices=INTERP_MODES, default="none")
+    p.add_argument("--periods", type=int, default=500)
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_groups)
+
+    p = sub.add_parser("shards", help="Callback time with the channels sharded over several threads")
+    p.add_argument("--channels", type=int, nargs="+", default=[32, 64, 128, 256])
+    p.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--interp", choices=INTERP_MODES, default="cubic")
+    p.add_argument("--periods", type=int, default=500)
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser("meters", help="Callback cost of the per-channel input level meters")
+    p.add_argument("--channels", type=int, nargs="+", default=[8, 32, 128, 256])
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--interp", choices=INTERP_MODES, default="none")
+    p.add_argument("--periods", type=int, default=1000)
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_meters)
+
+    p = sub.add_parser("retune", help="Sample rate and period changes of a running engine on the fake server")
+    p.add_argument("--channels", type=int, default=8)
+    p.add_argument("--periods", type=int, default=40, help="Periods checked after each change")
+    p.add_argument("--threads", type=int, default=1)
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.add_argument("--no-resample", action="store_true", help="Drop the buffered audio on sample rate changes")
+    p.add_argument("--tolerance", type=float, default=1e-2, help="Allowed error after a resampled rate change")
+    p.set_defaults(func=bench_retune)
+
+    p = sub.add_parser("latency", help="Automatic latency compensation on a stand-in graph of reporting clients")
+    p.add_argument("--channels", type=int, default=8)
+    p.add_argument(
+        "--groups", type=parse_latency_groups, default="all", help="Latency groups as for --auto-latency, e.g. 1-4,5-8"
+    )
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser("taps", help="Multi-tap outputs against duplicated channels: memory, callback time, output")
+    p.add_argument("--channels", type=int, default=16)
+    p.add_argument("--taps", type=int, nargs="+", default=[1, 3, 7], help="Extra taps per channel")
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=500.0)
+    p.add_argument("--interp", choices=INTERP_MODES, default="cubic")
+    p.add_argument("--periods", type=int, default=500)
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_taps)
+
+    p = sub.add_parser(
+        "reconnect", help="Recovery from JACK server loss on the fake server: time to audio, connections"
+    )
+    p.add_argument("--channels", type=int, default=16)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=100.0)
+    p.add_argument("--delay", type=float, default=50.0, help="Delays are spread up to this many ms")
+    p.add_argument(
+        "--downtime", type=float, nargs="+", default=[0.0, 0.1, 0.5, 2.0], help="Seconds the server stays away"
+    )
+    p.add_argument("--rt", action="store_true", help="Use the real-time safe engine")
+    p.set_defaults(func=bench_reconnect)
+
+    p = sub.add_parser("presets", help="Preset save, recall and autosave cost with every slot filled")
+    p.add_argument("--channels", type=int, default=64)
+    p.add_argument("--frames", type=int, default=256)
+    p.add_argument("--rate", type=int, default=48000)
+    p.add_argument("--max", type=float, default=1000.0)
+    p.set_defaults(func=bench_presets)
+
+    p = sub.add_parser("gui", help="Channel list build, render and scroll time against channel count (needs a display)")
+    p.add_argument("--channels", type=int, nargs="+", default=[8, 32, 128, 512])
+    p.add_argument("--max", type=float, default=1000.0)
+    p.set_defaults(func=bench_gui)
+
+    p = sub.add_parser("suite", help="Callback latency percentiles on a fake JACK server, with baseline comparison")
+    p.add_argument("--channels", type=int, nargs="+", default=[2, 16, 64, 256])
+    p.add_argument("--frames", type=int, nargs="+", default=[16, 64, 256, 2048])
+    p.add_argument("--rates", type=int, nargs="+", default=[48000])
+    p.add_argument("--delays", nargs="+", choices=sorted(SUITE_DELAYS), default=["zero", "integer", "cubic"])
+    p.add_argument("--max", type=float, default=1000.0)
+    p.add_argument("--periods", type=int, default=1000)
+    p.add_argument(
+        "--baseline", default=SUITE_BASELINE, help="Compare against this baseline JSON and exit 1 on regressions"
+    )
+    p.add_argument("--no-baseline", action="store_true", help="Only print the results")
+    p.add_argument("--save-baseline", help="Write the results as a baseline JSON")
+    p.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%)")
+    p.add_argument("--slack", type=float, default=5.0, help="Allowed absolute slowdown in us")
+    p.add_argument("--retries", type=int, default=4, help="Measure a slow case again this many times before failing")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("check", help="Run the pass/fail benchmarks with short settings; exit 1 if any fails")
+    p.add_argument("--only", nargs="+", help="Only the checks of these benchmarks")
+    p.set_defaults(func=bench_check)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
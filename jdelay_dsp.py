@@ -0,0 +1,1555 @@
+# ***jdelay_dsp.py***
+# Version: ***1.0***
+# Description: ***Vectorized multichannel delay engine for J-Delay***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+import mmap
+import tempfile
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Largest period (in frames) the ring buffer reserves headroom for.
+MAX_BLOCK = 8192
+# Extra history kept behind the longest delay for the interpolator taps.
+HISTORY_PAD = 4
+# While a ring grows, every period also moves this many periods of history
+# from the old ring into the new one.
+MIGRATE_PERIODS = 8
+# Samples zeroed (or write slots built) at a time when a new ring is prepared
+# in the background, before the GIL is handed back to the audio thread.
+GROW_CHUNK = 1 << 18
+SLOT_CHUNK = 1024
+# Default crossfade window for live delay changes.
+FADE_MS = 20.0
+# Published parameter blocks kept alive on the control side besides the ones the
+# audio thread still renders, so a block is never freed inside the callback.
+RETIRED_KEEP = 2
+# Input meters: held peaks fall at this rate, the RMS level averages over
+# about this time constant. Squared levels never decay below METER_FLOOR, which
+# keeps the arithmetic out of denormals during silence.
+METER_PEAK_FALL_DB = 20.0
+METER_RMS_TIME = 0.3
+METER_FLOOR = 1e-12
+# Sample formats of the rings. float16 halves their memory for long delays
+# (11 significant bits, about 66 dB below the signal at any level); NumPy
+# cannot convert it without allocating, so only the standard engine reads it.
+BUFFER_FORMATS = ("float32", "float16")
+# Rings in a memory-mapped file: the pages that the next WARM_PERIODS periods
+# will write or read are touched every WARM_INTERVAL seconds from a background
+# thread, so the callback finds them resident.
+WARM_PERIODS = 8
+WARM_INTERVAL = 0.005
+
+# Fractional delay interpolators, selectable per channel. "none" truncates to
+# whole samples like J-Delay always did.
+INTERP_MODES = ("none", "linear", "cubic", "allpass")
+INTERP_TAPS = {"none": 1, "linear": 2, "cubic": 4, "allpass": 2, "bypass": 1}
+# Channels at exactly 0 ms are copied from input to output without reading the
+# ring. Their input is still written, so a later delay change has history.
+GROUP_MODES = ("bypass",) + INTERP_MODES
+
+
+def lagrange_coefficients(fraction, taps):
+    # FIR taps h[j] applied to x[n - base - j] for a delay of base + fraction.
+    coeffs = np.ones((taps, len(fraction)), dtype=np.float64)
+    for j in range(taps):
+        for m in range(taps):
+            if m != j:
+                coeffs[j] *= (fraction - m) / (j - m)
+    return coeffs.astype(np.float32)[:, :, None]
+
+
+# Outputs that read their delay the same way are processed together. The group
+# arrays are built on the control thread when parameters are published.
+class TapGroup:
+    __slots__ = ("mode", "taps", "index", "source", "target", "base", "coeffs", "shared", "layouts")
+
+    def __init__(self, mode, index, base, coeffs, outputs, shared=False, source=None):
+        self.mode = mode
+        self.taps = INTERP_TAPS[mode]
+        self.index = index
+        # The channel (ring and input row) each output reads; the output
+        # itself unless the engine has extra taps.
+        self.source = index if source is None else source
+        # Plain slices keep the common "every channel in one group" case cheap.
+        self.target = slice(None) if len(index) == outputs else index
+        self.base = base
+        self.coeffs = coeffs
+        # Every channel has the same delay; see MultiChannelDelay._shared_window.
+        self.shared = shared
+        self.layouts = {}
+
+
+def build_tap_groups(frames, fraction, interp, sources=None):
+    # `sources` maps every output to the channel it reads, None for one
+    # output per channel.
+    outputs = len(frames)
+    modes = np.array(interp, dtype=object)
+    modes[(frames == 0) & (fraction == 0.0)] = "bypass"
+    fraction = fraction.copy()
+    frames = frames.copy()
+    # A first-order allpass needs its fractional part in [0.5, 1.5) to stay
+    # stable and accurate; borrow one sample from the integer part when we can.
+    allpass = modes == "allpass"
+    borrow = allpass & (fraction < 0.5) & (frames > 0)
+    frames[borrow] -= 1
+    fraction[borrow] += 1.0
+    # Delays below half a sample have nothing to borrow; interpolate linearly.
+    modes[allpass & (fraction < 0.5)] = "linear"
+    # Cubic Lagrange is best centred between its middle taps.
+    cubic = (modes == "cubic") & (frames > 0)
+    frames[cubic] -= 1
+    fraction[cubic] += 1.0
+
+    groups = []
+    for mode in GROUP_MODES:
+        index = np.flatnonzero(modes == mode)
+        if not len(index):
+            continue
+        source = None if sources is None else sources[index]
+        if mode == "bypass":
+            groups.append(TapGroup(mode, index, frames[index], None, outputs, True, source))
+            continue
+        if mode == "none":
+            coeffs = None
+        elif mode == "allpass":
+            delta = fraction[index]
+            coeffs = ((1.0 - delta) / (1.0 + delta)).astype(np.float32)[:, None]
+        else:
+            coeffs = lagrange_coefficients(fraction[index], INTERP_TAPS[mode])
+        # Splitting a mode's channels further, one group per distinct delay,
+        # was measured: the per-group overhead outweighs the cheaper slices
+        # unless a single delay is left.
+        shared = bool(np.all(frames[index] == frames[index[0]]) and np.all(fraction[index] == fraction[index[0]]))
+        groups.append(TapGroup(mode, index, frames[index], coeffs, outputs, shared, source))
+    return tuple(groups)
+
+
+# Immutable parameter block read by the audio thread. The control side builds a
+# new one for every change and publishes it with a single reference swap, so the
+# callback never sees a half-updated state and never converts ms to frames.
+class DelayParams:
+    __slots__ = (
+        "delays_ms",
+        "interp",
+        "sources",
+        "delay_frames",
+        "delay_fraction",
+        "groups",
+        "read_key",
+        "crossfade",
+        "in_ports",
+        "out_ports",
+        "plan",
+        "generation",
+    )
+
+    def __init__(
+        self, delays_ms, sample_rate, max_frames, interp=None, in_ports=(), out_ports=(), crossfade=True, sources=None
+    ):
+        exact = np.array(delays_ms, dtype=np.float64) / 1000.0 * sample_rate
+        # Whole-frame delays given in ms (latency compensation) must not come
+        # out a hair short and lose a frame.
+        nearest = np.rint(exact)
+        exact = np.where(np.abs(exact - nearest) < 1e-6, nearest, exact)
+        frames = exact.astype(np.int64)
+        fraction = exact - frames
+        clipped = (frames < 0) | (frames > max_frames)
+        frames = np.clip(frames, 0, max_frames)
+        fraction[clipped] = 0.0
+        frames.flags.writeable = False
+        fraction.flags.writeable = False
+
+        self.delays_ms = tuple(float(d) for d in delays_ms)
+        self.interp = tuple(interp) if interp else ("none",) * len(self.delays_ms)
+        # Channel read by each output (extra taps come after the channels'
+        # own outputs), None for one output per channel.
+        self.sources = sources
+        self.delay_frames = frames
+        self.delay_fraction = fraction
+        self.groups = build_tap_groups(frames, fraction, self.interp, sources)
+        # Blocks with equal keys read the ring identically; switching between
+        # them (e.g. when only the ports changed) needs no crossfade.
+        self.read_key = (frames.tobytes(), fraction.tobytes(), self.interp)
+        self.crossfade = crossfade
+        self.in_ports = tuple(in_ports)
+        self.out_ports = tuple(out_ports)
+        # Precomputed per-period work for RealtimeDelay, None otherwise.
+        self.plan = None
+        # The ring generation large enough for these delays; the audio thread
+        # holds the block back until that ring is in use.
+        self.generation = 0
+
+
+def ring_capacity(frames, pad):
+    # Smallest power of two holding `frames` of delay plus `pad` samples, and
+    # never less than two pads (see DelayRing.store).
+    need = np.maximum(np.asarray(frames, dtype=np.int64), pad) + pad
+    return np.left_shift(1, np.ceil(np.log2(need)).astype(np.int64)).astype(np.intp)
+
+
+# Every channel gets its own ring, a power of two long and sized from its delay,
+# so sample n of channel c lives at offset[c] + (n & mask[c]): the write position
+# is a plain sample counter and wrapping is a bitwise and. The rings are packed
+# into one flat array; behind each ring its first `pad` samples are mirrored, so
+# every read window is contiguous and a whole group of channels is gathered with
+# one fancy index. `pad` spare samples on either side take the part of a write
+# that falls outside ring and mirror, and a last sink element takes junk. Rings
+# are laid out by capacity, so channels of equal capacity form one 2-D block.
+# The flat array is float32 in RAM by default; `dtype` and `directory` (a
+# temporary file there, mapped into memory) are for long delays.
+class DelayRing:
+    def __init__(self, capacity, pad, generation=0, dtype=np.float32, directory=None):
+        self.capacity = np.asarray(capacity, dtype=np.intp)
+        self.mask = self.capacity - 1
+        self.pad = pad
+        stride = self.capacity + 3 * pad
+        order = np.argsort(self.capacity, kind="stable")
+        start = np.empty_like(stride)
+        start[order] = np.cumsum(stride[order]) - stride[order]
+        self.offset = (start + pad).astype(np.intp)
+        # Start of each channel's spare samples behind the mirror.
+        self.spare = self.offset + self.capacity + pad
+        self.min_capacity = int(self.capacity.min())
+        self.sink = int(stride.sum())
+        self.mapped = directory is not None
+        if self.mapped:
+            # The mapping keeps its own handle; the file is gone once the ring is.
+            with tempfile.TemporaryFile(prefix="jdelay-ring-", dir=directory) as f:
+                data = np.memmap(f, dtype=dtype, mode="w+", shape=(self.sink + 1,))
+            self.data = data.view(np.ndarray)
+        else:
+            self.data = np.zeros(self.sink + 1, dtype=dtype)
+        self.generation = generation
+        self.write_classes = None
+        self._windows = {}
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def windows(self, width, writeable=False):
+        key = (width, writeable)
+        if key not in self._windows:
+            self._windows[key] = sliding_window_view(self.data, width, writeable=writeable)
+        return self._windows[key]
+
+    def block(self, rows):
+        # 2-D view over the rings of `rows`, which must share one capacity:
+        # [pad spare][ring][pad mirror][pad spare] per row.
+        stride = int(self.capacity[rows[0]]) + 3 * self.pad
+        start = int(self.offset[rows[0]]) - self.pad
+        return self.data[start : start + len(rows) * stride].reshape(len(rows), stride)
+
+    def write_starts(self, wp, frames):
+        # A period is written at its ring position, running on into the mirror
+        # when it wraps. A second copy goes where the missing samples are: into
+        # the mirror when the period starts inside the first pad, to the ring
+        # start when it wraps, and into the spare samples for other channels.
+        # Rings of at least two pads never need both. None when no channel
+        # needs the second copy: every capacity is a multiple of the smallest,
+        # so the position in the smallest ring decides for all of them.
+        p = wp & self.mask
+        first = self.offset + p
+        shortest = self.min_capacity
+        if self.pad <= wp & (shortest - 1) <= shortest - frames:
+            return first, None
+        second = np.where(p < self.pad, first + self.capacity, self.spare)
+        wrap = p > self.capacity - frames
+        second[wrap] = first[wrap] - self.capacity[wrap]
+        return first, second
+
+    def store(self, in_block, wp):
+        frames = in_block.shape[1]
+        first, second = self.write_starts(wp, frames)
+        windows = self.windows(frames, writeable=True)
+        windows[first] = in_block
+        if second is not None:
+            windows[second] = in_block
+
+    def prepare_writes(self, in_block):
+        # Tables for RealtimeDelay's allocation-free version of store(), which
+        # always writes `in_block`. With a power-of-two period every write
+        # starts on a multiple of the period and never wraps, so each class of
+        # equal-capacity channels gets a ready-made view per position; other
+        # period sizes scatter every sample with put.
+        frames = in_block.shape[1]
+        if frames & (frames - 1) == 0:
+            self.write_shift = np.array(frames.bit_length() - 1, dtype=np.intp)
+            self.write_slot = np.zeros((), dtype=np.intp)
+            self.write_classes = [
+                _WriteClass(self, np.flatnonzero(self.capacity == c), in_block) for c in np.unique(self.capacity)
+            ]
+            return
+        channels = len(self.capacity)
+        self.write_source = in_block.reshape(-1)
+        self.write_row = np.repeat(np.arange(channels, dtype=np.intp), frames)
+        self.write_ramp = np.tile(np.arange(frames, dtype=np.intp), channels)
+        self.write_index = np.zeros(channels * frames, dtype=np.intp)
+        self.write_limit = self.capacity - frames
+        self.write_pad = np.array(self.pad, dtype=np.intp)
+        self.write_pos = np.zeros(channels, dtype=np.intp)
+        self.write_first = np.zeros(channels, dtype=np.intp)
+        self.write_second = np.zeros(channels, dtype=np.intp)
+        self.write_other = np.zeros(channels, dtype=np.intp)
+        self.write_flag = np.zeros(channels, dtype=bool)
+
+    def store_rt(self, wp):
+        classes = self.write_classes
+        if classes is not None:
+            slot = self.write_slot
+            np.right_shift(wp, self.write_shift, out=slot)
+            i = 0
+            while i < len(classes):
+                classes[i].store(slot)
+                i += 1
+            return
+        p, first, second, other, flag = (
+            self.write_pos,
+            self.write_first,
+            self.write_second,
+            self.write_other,
+            self.write_flag,
+        )
+        np.bitwise_and(wp, self.mask, out=p)
+        np.add(self.offset, p, out=first)
+        np.copyto(second, self.spare)
+        np.less(p, self.write_pad, out=flag)
+        np.add(first, self.capacity, out=other)
+        np.putmask(second, flag, other)
+        np.greater(p, self.write_limit, out=flag)
+        np.subtract(first, self.capacity, out=other)
+        np.putmask(second, flag, other)
+        index = self.write_index
+        first.take(self.write_row, out=index, mode="clip")
+        np.add(index, self.write_ramp, out=index)
+        self.data.put(index, self.write_source)
+        second.take(self.write_row, out=index, mode="clip")
+        np.add(index, self.write_ramp, out=index)
+        self.data.put(index, self.write_source)
+
+
+# Period writes of the channels of one ring capacity. The period number masked
+# to the ring length picks a precomputed view of the 2-D block, plus one of the
+# mirror when the period lands inside the first pad. Indexing an object array
+# with a 0-d array creates no Python int, so picking a view allocates nothing.
+class _WriteClass:
+    def __init__(self, ring, rows, in_block):
+        frames = in_block.shape[1]
+        capacity = int(ring.capacity[rows[0]])
+        pad = ring.pad
+        block = ring.block(rows)
+        first = int(rows[0])
+        if np.array_equal(rows, np.arange(first, first + len(rows))):
+            self.rows = None
+            self.source = in_block[first : first + len(rows)]
+        else:
+            self.rows = rows
+            self.in_block = in_block
+            self.source = np.zeros((len(rows), frames), dtype=np.float32)
+        count = capacity // frames
+        self.slot_mask = np.array(count - 1, dtype=np.intp)
+        self.slot = np.zeros((), dtype=np.intp)
+        self.slots = np.empty(count, dtype=object)
+        self.mirrors = np.empty(count, dtype=object)
+        self.mirror_sources = np.empty(count, dtype=object)
+        for k in range(count):
+            p = pad + k * frames
+            self.slots[k] = block[:, p : p + frames]
+            if k * frames < pad:
+                n = min(frames, pad - k * frames)
+                self.mirrors[k] = block[:, p + capacity : p + capacity + n]
+                self.mirror_sources[k] = self.source[:, :n]
+            if k % SLOT_CHUNK == SLOT_CHUNK - 1:
+                time.sleep(0)
+
+    def store(self, period):
+        if self.rows is not None:
+            self.in_block.take(self.rows, axis=0, out=self.source, mode="clip")
+        k = self.slot
+        np.bitwise_and(period, self.slot_mask, out=k)
+        np.copyto(self.slots[k], self.source)
+        mirror = self.mirrors[k]
+        if mirror is not None:
+            np.copyto(mirror, self.mirror_sources[k])
+
+
+# Moves the history of a ring into a larger one while the audio thread keeps
+# writing every period into both. Each step() copies the next `frames`
+# positions of every channel, oldest first and at least a period's worth per
+# period, so the copy always stays ahead of the samples that the ongoing writes
+# overwrite in the old ring. Only the first `channels` channels (all by
+# default) are moved, each to the same index. All arrays are built off the audio
+# thread.
+class _Migration:
+    def __init__(self, old, new, frames, channels=None):
+        if channels is None:
+            channels = len(old.capacity)
+        size = channels * frames
+        self.old = old
+        self.new = new
+        self.frames = frames
+        self.started = False
+        self.complete = False
+        self.since = np.zeros((), dtype=np.intp)
+        self.done = np.zeros((), dtype=np.intp)
+        self._done_next = np.zeros((), dtype=np.intp)
+        self._step = np.array(frames, dtype=np.intp)
+        # Only the newest positions the new ring holds: a successor's ring may
+        # be smaller (rings never shrink), and older samples copied into it
+        # would wrap onto the ones the callback writes meanwhile.
+        span = np.minimum(old.capacity[:channels], new.capacity[:channels])
+        self._total = np.array(span.max(), dtype=np.intp)
+        self._finished = np.zeros((), dtype=bool)
+        self.ramp = np.tile(np.arange(frames, dtype=np.intp), channels)
+        self.capacity = np.repeat(span, frames)
+        self.old_mask = np.repeat(old.mask[:channels], frames)
+        self.old_offset = np.repeat(old.offset[:channels], frames)
+        self.new_mask = np.repeat(new.mask[:channels], frames)
+        self.new_offset = np.repeat(new.offset[:channels], frames)
+        self.new_capacity = np.repeat(new.capacity[:channels], frames)
+        self.pad = np.array(new.pad, dtype=np.intp)
+        self.old_sink = np.array(old.sink, dtype=np.intp)
+        self.new_sink = np.array(new.sink, dtype=np.intp)
+        self.age = np.zeros(size, dtype=np.intp)
+        self.pos = np.zeros(size, dtype=np.intp)
+        self.src = np.zeros(size, dtype=np.intp)
+        self.dst = np.zeros(size, dtype=np.intp)
+        self.mirror = np.zeros(size, dtype=np.intp)
+        self.spent = np.zeros(size, dtype=bool)
+        self.unmirrored = np.zeros(size, dtype=bool)
+        self.samples = np.zeros(size, dtype=old.data.dtype)
+
+    def start(self, wp):
+        # `wp` is the first position written into both rings.
+        np.copyto(self.since, wp)
+        self.started = True
+
+    def step(self):
+        # Position since - span + age of each channel, written to the new
+        # ring and, inside its first pad, to the mirror. Channels whose history
+        # is already complete copy sink to sink.
+        np.add(self.ramp, self.done, out=self.age)
+        np.greater_equal(self.age, self.capacity, out=self.spent)
+        np.subtract(self.age, self.capacity, out=self.pos)
+        np.add(self.pos, self.since, out=self.pos)
+        np.bitwise_and(self.pos, self.old_mask, out=self.src)
+        np.add(self.src, self.old_offset, out=self.src)
+        np.putmask(self.src, self.spent, self.old_sink)
+        np.bitwise_and(self.pos, self.new_mask, out=self.dst)
+        np.greater_equal(self.dst, self.pad, out=self.unmirrored)
+        np.add(self.dst, self.new_offset, out=self.dst)
+        np.add(self.dst, self.new_capacity, out=self.mirror)
+        np.putmask(self.dst, self.spent, self.new_sink)
+        np.putmask(self.mirror, self.spent, self.new_sink)
+        np.putmask(self.mirror, self.unmirrored, self.new_sink)
+        self.old.data.take(self.src, out=self.samples, mode="clip")
+        self.new.data.put(self.dst, self.samples)
+        self.new.data.put(self.mirror, self.samples)
+        # Zero-dimensional in-place ufuncs allocate; alternate two counters.
+        np.add(self.done, self._step, out=self._done_next)
+        self.done, self._done_next = self._done_next, self.done
+        np.greater_equal(self.done, self._total, out=self._finished)
+        if self._finished:
+            self.complete = True
+
+    def advance(self, wp, frames):
+        # At least `frames` positions per channel, so the copy keeps ahead of
+        # the writes.
+        if not self.started:
+            self.start(wp)
+        copied = 0
+        while copied < frames and not self.complete:
+            self.step()
+            copied += self.frames
+
+    def run(self, wp):
+        # Whole migration at once, when no audio thread is writing.
+        self.start(wp)
+        while not self.complete:
+            self.step()
+
+
+def _carry_history(old, new, channels, wp, start, ratio):
+    # Fills each of the first `channels` rings of `new`, up to position
+    # `start`, with the history of `old` up to `wp`: one new sample every
+    # `ratio` old ones, interpolated unless the ratio is 1. Samples from
+    # before the old history are silent; taps before it repeat its first
+    # sample, taps after it continue its last slope.
+    for c in range(channels):
+        length = int(new.capacity[c])
+        oldest = wp - int(old.capacity[c])
+        back = np.arange(length, 0, -1)
+        point = wp - back * ratio
+        if ratio == 1.0:
+            samples = old.data[old.offset[c] + (np.maximum(wp - back, oldest) & old.mask[c])]
+        else:
+            # Taps at floor(point) - 1 .. + 2: a delay of 2 - frac behind the last.
+            last = np.floor(point).astype(np.int64) + 2
+            coeffs = lagrange_coefficients(last - point, 4)[:, :, 0]
+            newest = old.data[old.offset[c] + ((wp - np.arange(1, 3)) & old.mask[c])]
+            slope = newest[0] - newest[1]
+            samples = np.zeros(length, dtype=np.float32)
+            for j in range(4):
+                pos = last - j
+                ahead = np.maximum(pos - (wp - 1), 0)
+                tap = old.data[old.offset[c] + (np.clip(pos, oldest, wp - 1) & old.mask[c])] + ahead * slope
+                samples += coeffs[j] * tap
+        samples[point < oldest] = 0.0
+        index = (start - back) & new.mask[c]
+        new.data[new.offset[c] + index] = samples
+        mirrored = index < new.pad
+        new.data[new.offset[c] + new.capacity[c] + index[mirrored]] = samples[mirrored]
+
+
+# Moves a running engine over to a successor built for another channel count:
+# the history of the channels both share migrates as when a ring grows, while
+# every period is also written into the successor. Channels it adds start
+# silent, channels it drops are left behind.
+def _shared_layout(ring, index):
+    # (capacity block, rows of `index` in it, ring mask), or False when the
+    # channels' rings differ in capacity. Taps may list a channel twice or out
+    # of order, so only runs of consecutive rows become a slice.
+    capacity = ring.capacity[index]
+    if np.any(capacity != capacity[0]):
+        return False
+    members = np.flatnonzero(ring.capacity == capacity[0])
+    rows = np.searchsorted(members, index)
+    if np.all(np.diff(rows) == 1):
+        rows = slice(int(rows[0]), int(rows[-1]) + 1)
+    return ring.block(members), rows, int(capacity[0]) - 1
+
+
+class _Handover:
+    def __init__(self, dsp, successor, frames):
+        kept = min(dsp.channels, successor.channels)
+        self.successor = successor
+        self.kept = kept
+        self.migration = _Migration(dsp._ring, successor._ring, frames, kept)
+        self.state = dsp._allpass_state[:kept]
+        self.successor_state = successor._allpass_state[:kept]
+        # Input rows copied into the successor each period (RealtimeDelay).
+        self.source = None
+        self.target = None
+
+
+# Per-channel input levels, computed by the callback from the period block it
+# already holds, into preallocated storage. Both levels are kept squared: the
+# block is squared once, the mean square is a matrix-vector product with the
+# averaging weights and the peak comes from folding each row in halves with
+# np.maximum. Row reductions with axis= and ufuncs on 2-D slices allocate on
+# every call, so the folds run over the flat squares shifted against
+# themselves: after the last one, each row's first sample holds its maximum
+# and the samples behind it hold junk that is never read. Only the audio thread
+# writes; other threads read without a lock and may see one channel a period
+# ahead of another, which no meter shows.
+class LevelMeter:
+    def __init__(self, channels, sample_rate):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.peak_square = np.full(channels, METER_FLOOR, dtype=np.float32)
+        self.mean_square = np.full(channels, METER_FLOOR, dtype=np.float32)
+        self._floor = np.full(channels, METER_FLOOR, dtype=np.float32)
+        self.frames = 0
+
+    def prepare(self, block):
+        # Binds the (channels, frames) input block process() reads. Scratch,
+        # fold views and decay factors only change with the period size.
+        frames = block.shape[1]
+        seconds = frames / self.sample_rate
+        keep = np.exp(-seconds / METER_RMS_TIME)
+        size = self.channels * frames
+        squares = np.zeros(size, dtype=np.float32)
+        spare = np.zeros(size, dtype=np.float32)
+        self._source = block
+        self._squares = squares.reshape(self.channels, frames)
+        self._period = np.zeros(self.channels, dtype=np.float32)
+        self._weights = np.full(frames, (1.0 - keep) / frames, dtype=np.float32)
+        self._keep = np.full(self.channels, keep, dtype=np.float32)
+        self._peak_fall = np.full(self.channels, 10.0 ** (-METER_PEAK_FALL_DB * seconds / 10.0), dtype=np.float32)
+        # A fold of `width` leading samples per row into the first
+        # width - width // 2: each of those takes the larger of itself and
+        # the sample width // 2 behind it, which is still inside the row.
+        self._folds = []
+        width, src, dst = frames, squares, spare
+        while width > 1:
+            shift = width // 2
+            self._folds.append((src[: size - shift], src[shift:], dst[: size - shift]))
+            width -= shift
+            src, dst = dst, src
+        self._block_peak = src[::frames]
+        self.frames = frames
+
+    def process(self):
+        squares = self._squares
+        np.multiply(self._source, self._source, out=squares)
+        np.dot(squares, self._weights, out=self._period)
+        np.multiply(self.mean_square, self._keep, out=self.mean_square)
+        np.add(self.mean_square, self._period, out=self.mean_square)
+        np.maximum(self.mean_square, self._floor, out=self.mean_square)
+        folds = self._folds
+        i = 0
+        while i < len(folds):
+            low, high, out = folds[i]
+            np.maximum(low, high, out=out)
+            i += 1
+        np.multiply(self.peak_square, self._peak_fall, out=self.peak_square)
+        np.maximum(self.peak_square, self._block_peak, out=self.peak_square)
+        np.maximum(self.peak_square, self._floor, out=self.peak_square)
+
+    def levels(self):
+        # (peak, rms) as linear amplitudes, copied.
+        return np.sqrt(self.peak_square), np.sqrt(self.mean_square)
+
+
+# All channels are written at the same sample position, so one write counter is
+# enough and a period costs a handful of batched NumPy calls whatever the channel
+# count: one scatter into the rings and one masked gather per group of channels.
+#
+# Rings are sized from the published delays. A delay beyond its channel's ring
+# publishes a parameter block that waits for a larger ring: the ring is
+# allocated (and its pages touched) on a background thread, then the audio
+# thread migrates the buffered history into it a few periods at a time and
+# swaps it in without losing a sample.
+#
+# Delay changes are crossfaded: while a fade runs, the previous and the new read
+# positions are both gathered and blended once per period. Blocks published
+# during a fade are coalesced; when it ends the engine fades straight to the
+# newest block, so a fast slider drag never stacks fades.
+#
+# Besides one output per channel the engine can have extra taps: `taps` lists
+# the channel each of them reads, and their outputs follow the channels' own.
+# A tap reads its channel's ring like another delay would, in the same gather
+# as every output of its tap group, so memory grows with the channels only.
+class MultiChannelDelay:
+    def __init__(
+        self,
+        channels,
+        max_delay_ms,
+        sample_rate,
+        max_block=MAX_BLOCK,
+        fade_ms=FADE_MS,
+        metering=False,
+        buffer_format="float32",
+        buffer_dir=None,
+        taps=(),
+    ):
+        self.max_delay_ms = max_delay_ms
+        self.max_block = max_block
+        # Fixed for the engine; another layout needs a new one (see hand_over).
+        self.taps = tuple(int(c) for c in taps)
+        self.fade_ms = fade_ms
+        # Ring storage, see DelayRing.
+        self.buffer_dtype = np.dtype(buffer_format)
+        self.buffer_dir = buffer_dir
+        # Input level meters (see LevelMeter); rebuilt by reset().
+        self.metering = metering
+        # Set while an audio thread calls process_block; rings then grow in the
+        # background, otherwise right away on the publishing thread.
+        self.running = False
+        self._grow_lock = threading.Lock()
+        self.reset(channels, sample_rate)
+
+    def reset(self, channels, sample_rate):
+        self.channels = channels
+        self.outputs = channels + len(self.taps)
+        self.sources = None
+        if self.taps:
+            self.sources = np.concatenate([np.arange(channels), self.taps]).astype(np.intp)
+            self.sources.flags.writeable = False
+        self.sample_rate = sample_rate
+        self.max_delay_frames = int((self.max_delay_ms / 1000.0) * sample_rate)
+        self._pad = self.max_block + HISTORY_PAD
+        self._ring = self._new_ring(ring_capacity(np.zeros(channels), self._pad), 0)
+        # The ring that will be in use once every pending growth is done.
+        self._target = self._ring
+        self._migration = None
+        self._handover = None
+        # Set by the callback once a hand_over() is complete.
+        self.successor = None
+        self.handed_over = False
+        self.write_pointer = 0
+        self._allpass_state = np.zeros(self.outputs, dtype=np.float32)
+        self._fade_state = np.zeros(self.outputs, dtype=np.float32)
+        self._block_frames = 0
+        self.fade_frames = int(self.fade_ms / 1000.0 * sample_rate)
+        self._fade_pos = -1
+        self.params = DelayParams([0.0] * self.outputs, sample_rate, self.max_delay_frames, sources=self.sources)
+        self._live = self.params
+        self._fade_from = self.params
+        self._retired = []
+        self.meter = LevelMeter(channels, sample_rate) if self.metering else None
+
+    def publish(self, delays_ms=None, interp=None, in_ports=None, out_ports=None, crossfade=True):
+        # Runs on the control thread. Delays and output ports are per output,
+        # interpolation modes per channel; taps use their channel's. Replaced
+        # blocks stay referenced here until the audio thread has moved past
+        # them (double buffering), so the callback never drops the last
+        # reference to a block.
+        current = self.params
+        if delays_ms is None and interp is None:
+            # Only ports change: a pending switch of delays keeps its fade
+            # setting (crossfade=False at startup must not turn into a fade).
+            crossfade = crossfade and current.crossfade
+        if delays_ms is None:
+            delays_ms = current.delays_ms
+        if interp is None:
+            interp = current.interp
+        padded = list(delays_ms[: self.outputs]) + [0.0] * max(0, self.outputs - len(delays_ms))
+        modes = list(interp[: self.channels]) + ["none"] * max(0, self.channels - len(interp))
+        modes += [modes[c] for c in self.taps]
+        params = self._make_params(
+            padded,
+            modes,
+            current.in_ports if in_ports is None else in_ports,
+            current.out_ports if out_ports is None else out_ports,
+            crossfade,
+        )
+        self._reserve(params)
+        self.params = params
+        if not crossfade and not self.running:
+            # Nothing plays yet (e.g. the successor of a channel count change):
+            # start at these settings, so the next change fades from them and
+            # not from the all-zero block of reset().
+            self._live = params
+            self._fade_from = params
+        self._retired.append(current)
+        recent = self._retired[-RETIRED_KEEP:]
+        self._retired = [p for p in self._retired if p is self._live or p is self._fade_from or p in recent]
+
+    def hand_over(self, successor, deadline=None):
+        # Control thread: `successor` is a prepared engine for another channel
+        # count. From the next period on the callback copies the shared
+        # channels' history into it a few periods at a time, then sets
+        # handed_over; from the period after that the caller runs `successor`.
+        # A pending ring growth finishes first. Returns False, with nothing
+        # handed over, if it does not finish by `deadline` (time.monotonic())
+        # or the engine stops running: no callback will complete it, and the
+        # caller switches to `successor` directly.
+        while self._ring is not self._target:
+            if not self.running or (deadline is not None and time.monotonic() > deadline):
+                return False
+            time.sleep(0.005)
+        self._handover = self._make_handover(successor)
+        return True
+
+    def _make_handover(self, successor):
+        return _Handover(self, successor, self._migrate_frames())
+
+    def adopt(self, previous, resample=True):
+        # Control thread, while no callback runs `previous` (JACK suspends
+        # processing to change its sample rate or period size): takes over the
+        # buffered audio, write position and allpass state of the channels
+        # both share, so the delays play on instead of restarting from
+        # silence. Across a sample rate change the history is resampled with
+        # cubic Lagrange interpolation, or dropped when `resample` is false.
+        kept = min(self.channels, previous.channels)
+        wp = int(previous.write_pointer)
+        start = self._start_position(wp)
+        self._allpass_state[:kept] = previous._allpass_state[:kept]
+        ratio = previous.sample_rate / self.sample_rate
+        if ratio == 1.0 or resample:
+            _carry_history(previous._ring, self._ring, kept, wp, start, ratio)
+        self._start_at(start)
+
+    def _start_position(self, wp):
+        # Write position for a history ending at `wp`.
+        return wp
+
+    def _start_at(self, wp):
+        self.write_pointer = wp
+
+    def _make_params(self, delays_ms, interp, in_ports, out_ports, crossfade):
+        return DelayParams(
+            delays_ms, self.sample_rate, self.max_delay_frames, interp, in_ports, out_ports, crossfade, self.sources
+        )
+
+    def _new_ring(self, capacity, generation):
+        return DelayRing(capacity, self._pad, generation, self.buffer_dtype, self.buffer_dir)
+
+    def _reserve(self, params):
+        # Control thread: makes sure a ring for params' delays is or will be in
+        # use, growing only the channels that need it.
+        target = self._target
+        frames = params.delay_frames
+        if self.sources is not None:
+            # A channel's ring holds the longest delay of any of its outputs.
+            frames = np.zeros(self.channels, dtype=np.int64)
+            np.maximum.at(frames, self.sources, params.delay_frames)
+        need = ring_capacity(frames, self._pad)
+        if np.all(need <= target.capacity):
+            params.generation = target.generation
+            return
+        ring = self._new_ring(np.maximum(need, target.capacity), target.generation + 1)
+        params.generation = ring.generation
+        self._target = ring
+        if self.running:
+            threading.Thread(target=self._grow, args=(ring,), name="jdelay-grow", daemon=True).start()
+        else:
+            self._grow(ring)
+
+    def _grow(self, ring):
+        # Growths are serialized; each one migrates from the ring its
+        # predecessor left in use.
+        with self._grow_lock:
+            # Touch every page here, so the audio thread never faults them in,
+            # and hand the GIL back between chunks.
+            for start in range(0, len(ring.data), GROW_CHUNK):
+                ring.data[start : start + GROW_CHUNK] = 0.0
+                time.sleep(0)
+            self._prepare_ring(ring)
+            migration = _Migration(self._ring, ring, self._migrate_frames())
+            if self.running:
+                self._migration = migration
+                while self._migration is migration and self.running:
+                    time.sleep(0.005)
+                if self._migration is not migration:
+                    return
+                # The audio thread stopped half-way; finish on this thread.
+                migration = _Migration(self._ring, ring, migration.frames)
+            migration.run(self.write_pointer)
+            self._ring = ring
+            self._migration = None
+
+    def _prepare_ring(self, ring):
+        pass
+
+    def _migrate_frames(self):
+        return MIGRATE_PERIODS * (self._block_frames or 1024)
+
+    def prepare_blocks(self, frames):
+        # Control thread: scratch blocks for periods of `frames` ahead of the
+        # first callback, which would otherwise build them.
+        self._prepare_blocks(frames)
+
+    def levels(self):
+        # (peak, rms) per channel, or None without metering.
+        meter = self.meter
+        return meter.levels() if meter is not None else None
+
+    def warm(self):
+        # Background thread, for rings in a memory-mapped file: reads one
+        # sample per page of every position the next WARM_PERIODS periods
+        # write, or read at the published and live delays (crossfades and
+        # growths included), so their pages are resident before the callback
+        # gets there. NumPy drops the GIL inside take, so a page fault here
+        # does not hold up the audio thread.
+        frames = WARM_PERIODS * (self._block_frames or self.max_block)
+        wp = int(self.write_pointer)
+        delays = {id(p): p.delay_frames for p in (self.params, self._live, self._fade_from)}
+        starts = [np.full(self.channels, wp)] + [wp - d - INTERP_TAPS["cubic"] for d in delays.values()]
+        starts = np.concatenate(starts)
+        sources = np.arange(self.channels) if self.sources is None else self.sources
+        rows = np.concatenate([np.arange(self.channels)] + [sources] * len(delays))
+        span = frames + INTERP_TAPS["cubic"]
+        step = max(mmap.PAGESIZE // self.buffer_dtype.itemsize, 1)
+        ramp = np.append(np.arange(0, span, step), span - 1)
+        for ring in {id(r): r for r in (self._ring, self._target)}.values():
+            mask = ring.mask[rows][:, None]
+            offset = ring.offset[rows][:, None]
+            ring.data.take((offset + ((starts[:, None] + ramp) & mask)).ravel(), mode="clip")
+
+    def memory_usage(self):
+        # Ring bytes per channel, and the total including a growth in progress.
+        ring, target = self._ring, self._target
+        channel = [int(c) * ring.data.itemsize for c in ring.capacity]
+        total = ring.nbytes + (target.nbytes if target is not ring else 0)
+        return channel, total
+
+    def _prepare_blocks(self, frames):
+        # Scratch blocks and window views only change when JACK changes the period size.
+        self.in_block = np.zeros((self.channels, frames), dtype=np.float32)
+        self.out_block = np.zeros((self.outputs, frames), dtype=np.float32)
+        self._fade_block = np.zeros((self.outputs, frames), dtype=np.float32)
+        self._fade_ramp = np.arange(1, frames + 1, dtype=np.float32)
+        self._in_rows = list(self.in_block)
+        self._out_rows = list(self.out_block)
+        # The input ports are gathered with one concatenate into the flat
+        # block; an input without a port reads this silent period.
+        self._in_flat = self.in_block.reshape(-1)
+        self._silence = np.zeros(frames, dtype=np.float32)
+        self._ramps = {taps: np.arange(frames + taps - 1) for taps in set(INTERP_TAPS.values())}
+        self._block_frames = frames
+        if self.meter is not None:
+            self.meter.prepare(self.in_block)
+
+    def _read_group(self, ring, group, wp, frames, allpass_state, in_block):
+        taps = group.taps
+        source = group.source
+        # Every channel, each read once and in order.
+        whole = group.target is not group.index and source is group.index
+        if group.mode == "bypass":
+            return in_block if whole else in_block[source]
+        window = self._shared_window(ring, group, wp, frames + taps - 1) if group.shared else None
+        if window is None:
+            if whole:
+                offset, mask = ring.offset, ring.mask
+            else:
+                offset, mask = ring.offset[source], ring.mask[source]
+            starts = offset + ((wp - group.base - (taps - 1)) & mask)
+            window = ring.windows(frames + taps - 1)[starts]
+        if group.mode == "none":
+            return window
+        if group.mode == "allpass":
+            # y[n] = a * x[n - base] + x[n - base - 1] - a * y[n - 1]; the
+            # recursion runs per sample but across the whole group at once.
+            a = group.coeffs
+            feed = a * window[:, 1:] + window[:, :-1]
+            a = a[:, 0]
+            y = allpass_state[group.index]
+            for k in range(frames):
+                y = feed[:, k] - a * y
+                feed[:, k] = y
+            allpass_state[group.index] = y
+            return feed
+        coeffs = group.coeffs
+        out = coeffs[0] * window[:, taps - 1 : taps - 1 + frames]
+        for j in range(1, taps):
+            out += coeffs[j] * window[:, taps - 1 - j : taps - 1 - j + frames]
+        return out
+
+    def _shared_window(self, ring, group, wp, width):
+        # Channels with one delay in rings of one capacity start their window
+        # at the same ring position: one 2-D slice of the capacity block
+        # instead of a gather per channel. None when the rings differ.
+        layout = group.layouts.get(ring.generation)
+        if layout is None:
+            layout = group.layouts[ring.generation] = _shared_layout(ring, group.source)
+        if layout is False:
+            return None
+        block, rows, mask = layout
+        p = ring.pad + ((wp - int(group.base[0]) - (group.taps - 1)) & mask)
+        return block[rows, p : p + width]
+
+    def process_block(self, in_block, out_block, params):
+        frames = in_block.shape[1]
+        if frames != self._block_frames:
+            self._prepare_blocks(frames)
+        wp = self.write_pointer
+        ring = self._ring
+        migration = self._migration
+        if migration is not None:
+            # Growing: move at least a period of history, then write both rings.
+            migration.advance(wp, frames)
+            migration.new.store(in_block, wp)
+        ring.store(in_block, wp)
+        if migration is not None and migration.complete:
+            # Drop the local reference first: the old ring is then freed by
+            # the growing thread, not here.
+            self._ring = ring = migration.new
+            migration = None
+            self._migration = None
+        handover = self._handover
+        if handover is not None:
+            successor = handover.successor
+            handover.migration.advance(wp, frames)
+            stage = np.zeros((successor.channels, frames), dtype=np.float32)
+            stage[: handover.kept] = in_block[: handover.kept]
+            successor._ring.store(stage, wp)
+
+        live = self._live
+        if params is not live and self._fade_pos < 0 and params.generation <= ring.generation:
+            if params.crossfade and params.read_key != live.read_key and self.fade_frames > 0:
+                self._fade_from = live
+                self._fade_state[:] = self._allpass_state
+                self._fade_pos = 0
+            self._live = live = params
+
+        for group in live.groups:
+            out_block[group.target] = self._read_group(ring, group, wp, frames, self._allpass_state, in_block)
+        if self._fade_pos >= 0:
+            self._crossfade(ring, in_block, out_block, wp, frames)
+
+        self.write_pointer = wp + frames
+        if handover is not None and handover.migration.complete:
+            handover.successor.write_pointer = wp + frames
+            handover.successor_state[:] = handover.state
+            self.successor = handover.successor
+            self.handed_over = True
+
+    def _crossfade(self, ring, in_block, out_block, wp, frames):
+        old = self._fade_block
+        for group in self._fade_from.groups:
+            old[group.target] = self._read_group(ring, group, wp, frames, self._fade_state, in_block)
+        gain = np.minimum((self._fade_pos + self._fade_ramp) / self.fade_frames, 1.0)
+        # old + gain * (new - old): channels whose delay did not change come out
+        # bit-identical because new - old is exactly zero for them.
+        out_block -= old
+        out_block *= gain
+        out_block += old
+        self._fade_pos += frames
+        if self._fade_pos >= self.fade_frames:
+            self._fade_pos = -1
+            self._fade_from = self._live
+
+    def process_ports(self, frames):
+        params = self.params
+        if frames != self._block_frames:
+            self._prepare_blocks(frames)
+        silence = self._silence
+        np.concatenate([silence if port is None else port.get_array() for port in params.in_ports], out=self._in_flat)
+        if self.meter is not None:
+            self.meter.process()
+        self.process_block(self.in_block, self.out_block, params)
+        for row, port in zip(self._out_rows, params.out_ports):
+            port.get_array()[:] = row
+
+
+# Python ints above 256 are new objects, so the real-time loops below only
+# count up to this and split longer sequences into chunks of it.
+SMALL_INT = 256
+
+
+def _chunked(items):
+    return [items[i : i + SMALL_INT] for i in range(0, len(items), SMALL_INT)]
+
+
+def _full(values, shape):
+    return np.ascontiguousarray(np.broadcast_to(values, shape))
+
+
+# Gather and interpolation work of one tap group for a fixed period size. All
+# index arrays and scratch buffers are built on the control thread; reading
+# only runs ufuncs with out= targets and 1-D take/put on preallocated arrays.
+class _GroupPlan:
+    def __init__(self, group, frames, outputs, in_flat):
+        taps = group.taps
+        width = frames + taps - 1
+        index, source, base, coeffs = group.index, group.source, group.base, group.coeffs
+        if len(index) == 1:
+            # In-place ufuncs on one-element arrays allocate; a single channel
+            # is processed twice instead, writing the same result twice.
+            index, source, base = np.repeat(index, 2), np.repeat(source, 2), np.repeat(base, 2)
+            coeffs = None if coeffs is None else np.repeat(coeffs, 2, axis=-2)
+        count = len(index)
+        self.mode = group.mode
+        self.taps = taps
+        # Output rows, and the channel rows (rings, inputs) they read.
+        self.channel_index = index.astype(np.intp)
+        self.source_index = source.astype(np.intp)
+        self.neg_delay = -(base + taps - 1).astype(np.intp)
+        self.starts = np.zeros(count, dtype=np.intp)
+        self.index = np.zeros(count * width, dtype=np.intp)
+        # Ring mask and offset of each channel, refreshed whenever a grown ring
+        # (a new generation) comes into use.
+        self.mask = np.zeros(count, dtype=np.intp)
+        self.offset = np.zeros(count, dtype=np.intp)
+        self.bound = -1
+        self.window = np.zeros(count * width, dtype=np.float32)
+        # The allpass recursion walks the period sample by sample, so its
+        # window is stored time-major to make every step a contiguous row.
+        time_major = group.mode == "allpass"
+        rows, cols = np.arange(count), np.arange(width)
+        if time_major:
+            self.row_id = np.tile(rows, width)
+            self.ramp = np.repeat(cols, count)
+            out_index = (self.channel_index[None, :] * frames + np.arange(frames)[:, None]).ravel()
+        else:
+            self.row_id = np.repeat(rows, width)
+            self.ramp = np.tile(cols, count)
+            out_index = (self.channel_index[:, None] * frames + np.arange(frames)[None, :]).ravel()
+        self.out_index = out_index.astype(np.intp)
+
+        if group.mode == "bypass":
+            # Straight from the input block: one gather, no ring positions.
+            self.in_flat = in_flat
+            self.in_index = (self.source_index[:, None] * frames + np.arange(frames)[None, :]).ravel().astype(np.intp)
+            self.result = self.window[: count * frames]
+        elif group.mode == "none":
+            self.result = self.window
+        elif time_major:
+            window = self.window.reshape(width, count)
+            self.current = window[1:]
+            self.previous = window[:-1]
+            self.a_vec = np.ascontiguousarray(coeffs[:, 0])
+            self.a_full = _full(self.a_vec, (frames, count))
+            self.acc = np.zeros((frames, count), dtype=np.float32)
+            self.tmp = np.zeros(count, dtype=np.float32)
+            self.y = np.zeros(count, dtype=np.float32)
+            self.steps = _chunked(list(self.acc))
+            self.result = self.acc.reshape(-1)
+        else:
+            # Ufuncs on strided 2-D views buffer internally, so the taps run
+            # over the flat window: shifted 1-D views line up every tap with
+            # its output sample. The taps - 1 positions that straddle two rows
+            # are junk and are sent to the sink element behind the out block.
+            span = count * width - (taps - 1)
+            self.views = [self.window[taps - 1 - j : taps - 1 - j + span] for j in range(taps)]
+            self.coeffs = [np.repeat(coeffs[j][:, 0], width)[:span] for j in range(taps)]
+            self.acc = np.zeros(span, dtype=np.float32)
+            self.tmp = np.zeros(span, dtype=np.float32)
+            self.result = self.acc
+            pos = np.arange(span)
+            n = pos % width
+            self.out_index = np.where(n < frames, self.channel_index[pos // width] * frames + n, outputs * frames)
+
+    def read(self, ring, wp, out_flat, state):
+        if self.mode == "bypass":
+            self.in_flat.take(self.in_index, out=self.result, mode="clip")
+            out_flat.put(self.out_index, self.result)
+            return
+        if self.bound != ring.generation:
+            ring.mask.take(self.source_index, out=self.mask, mode="clip")
+            ring.offset.take(self.source_index, out=self.offset, mode="clip")
+            self.bound = ring.generation
+        starts, index = self.starts, self.index
+        np.add(wp, self.neg_delay, out=starts)
+        np.bitwise_and(starts, self.mask, out=starts)
+        np.add(starts, self.offset, out=starts)
+        starts.take(self.row_id, out=index, mode="clip")
+        np.add(index, self.ramp, out=index)
+        ring.data.take(index, out=self.window, mode="clip")
+
+        if self.mode == "allpass":
+            acc = self.acc
+            np.multiply(self.a_full, self.current, out=acc)
+            np.add(acc, self.previous, out=acc)
+            state.take(self.channel_index, out=self.y, mode="clip")
+            a, tmp, y = self.a_vec, self.tmp, self.y
+            c = 0
+            while c < len(self.steps):
+                chunk = self.steps[c]
+                k = 0
+                while k < len(chunk):
+                    row = chunk[k]
+                    np.multiply(a, y, out=tmp)
+                    np.subtract(row, tmp, out=row)
+                    y = row
+                    k += 1
+                c += 1
+            state.put(self.channel_index, y)
+        elif self.mode != "none":
+            acc, tmp = self.acc, self.tmp
+            np.multiply(self.coeffs[0], self.views[0], out=acc)
+            j = 1
+            while j < self.taps:
+                np.multiply(self.coeffs[j], self.views[j], out=tmp)
+                np.add(acc, tmp, out=acc)
+                j += 1
+        out_flat.put(self.out_index, self.result)
+
+
+class _RealtimePlan:
+    def __init__(self, dsp, params):
+        self.frames = dsp.max_block
+        in_flat = dsp.in_block.reshape(-1)
+        self.groups = [_GroupPlan(g, self.frames, dsp.outputs, in_flat) for g in params.groups]
+        # Inputs without connections are zeroed instead of copied.
+        self.inputs = _chunked([(row, port) for row, port in zip(dsp._in_rows, params.in_ports) if port is not None])
+        self.silent = _chunked([row for row, port in zip(dsp._in_rows, params.in_ports) if port is None])
+        self.outputs = _chunked(list(zip(dsp._out_rows, params.out_ports)))
+
+
+# Real-time safe variant for a fixed JACK period size: everything the callback
+# touches is allocated when the engine is prepared, a parameter block is
+# published or a ring is grown, so a steady-state period creates no Python
+# objects and no arrays.
+class RealtimeDelay(MultiChannelDelay):
+    def __init__(
+        self,
+        channels,
+        max_delay_ms,
+        sample_rate,
+        block=256,
+        fade_ms=FADE_MS,
+        metering=False,
+        buffer_dir=None,
+        taps=(),
+    ):
+        super().__init__(
+            channels,
+            max_delay_ms,
+            sample_rate,
+            max_block=block,
+            fade_ms=fade_ms,
+            metering=metering,
+            buffer_dir=buffer_dir,
+            taps=taps,
+        )
+
+    def reset(self, channels, sample_rate):
+        super().reset(channels, sample_rate)
+        frames = self.max_block
+        self._prepare_blocks(frames)
+        # Output blocks carry one spare element as the sink for junk samples.
+        outputs = self.outputs
+        self._out_flat = np.zeros(outputs * frames + 1, dtype=np.float32)
+        self._fade_flat = np.zeros(outputs * frames + 1, dtype=np.float32)
+        self.out_block = self._out_flat[:-1].reshape(outputs, frames)
+        self._fade_block = self._fade_flat[:-1].reshape(outputs, frames)
+        self._out_rows = list(self.out_block)
+        self._prepare_ring(self._ring)
+
+        # Zero-dimensional in-place ufuncs allocate; counters alternate between
+        # two arrays.
+        self.write_pointer = np.zeros((), dtype=np.intp)
+        self._wp_next = np.zeros((), dtype=np.intp)
+        self._wp_step = np.array(frames, dtype=np.intp)
+        self._fading = False
+        self._fade_count = np.zeros((), dtype=np.float32)
+        self._fade_next = np.zeros((), dtype=np.float32)
+        self._fade_total = np.array(max(self.fade_frames, 1), dtype=np.float32)
+        self._fade_step = np.array(frames, dtype=np.float32)
+        self._fade_done = np.zeros((), dtype=bool)
+        self._one = np.array(1.0, dtype=np.float32)
+        self._gain_row = np.zeros(frames, dtype=np.float32)
+        self._gain_cols = np.tile(np.arange(frames, dtype=np.intp), outputs)
+        self._gain = np.zeros(outputs * frames, dtype=np.float32)
+        self._gain_block = self._gain.reshape(outputs, frames)
+
+        self.params = self._make_params([0.0] * outputs, None, (), (), False)
+        self._live = self.params
+        self._fade_from = self.params
+
+    def _prepare_ring(self, ring):
+        ring.prepare_writes(self.in_block)
+
+    def _start_position(self, wp):
+        # Power-of-two periods are written at multiples of the period.
+        return -(-wp // self.max_block) * self.max_block
+
+    def _start_at(self, wp):
+        self.write_pointer.fill(wp)
+
+    def prepare_blocks(self, frames):
+        # Built for one period size at construction; see prepare().
+        if frames != self.max_block:
+            self.prepare(frames)
+
+    def _migrate_frames(self):
+        return MIGRATE_PERIODS * self.max_block
+
+    def prepare(self, frames):
+        # Control thread: size everything for a new period and carry the
+        # current settings over. Clears the delay line.
+        params = self.params
+        self.max_block = frames
+        self.reset(self.channels, self.sample_rate)
+        self.params = self._make_params(params.delays_ms, params.interp, params.in_ports, params.out_ports, False)
+        # The new rings are empty anyway: size them right here.
+        running, self.running = self.running, False
+        self._reserve(self.params)
+        self.running = running
+        self._live = self.params
+        self._fade_from = self.params
+
+    def _make_handover(self, successor):
+        handover = super()._make_handover(successor)
+        handover.source = self.in_block[: handover.kept]
+        handover.target = successor.in_block[: handover.kept]
+        return handover
+
+    def _make_params(self, delays_ms, interp, in_ports, out_ports, crossfade):
+        params = super()._make_params(delays_ms, interp, in_ports, out_ports, crossfade)
+        params.plan = _RealtimePlan(self, params)
+        return params
+
+    def process_block(self, in_block, out_block, params):
+        if in_block is not self.in_block:
+            if in_block.shape[1] != self.max_block:
+                # A new period size: not real-time safe, but it keeps audio
+                # going until the control side prepares the engine properly.
+                self.prepare(in_block.shape[1])
+                params = self.params
+            np.copyto(self.in_block, in_block)
+        wp = self.write_pointer
+        ring = self._ring
+        migration = self._migration
+        if migration is not None:
+            if not migration.started:
+                migration.start(wp)
+            migration.step()
+            migration.new.store_rt(wp)
+        ring.store_rt(wp)
+        if migration is not None and migration.complete:
+            self._ring = ring = migration.new
+            migration = None
+            self._migration = None
+        handover = self._handover
+        if handover is not None:
+            migration = handover.migration
+            if not migration.started:
+                migration.start(wp)
+            if not migration.complete:
+                migration.step()
+            np.copyto(handover.target, handover.source)
+            handover.successor._ring.store_rt(wp)
+
+        live = self._live
+        if params is not live and not self._fading and params.generation <= ring.generation:
+            if params.crossfade and params.read_key != live.read_key and self.fade_frames > 0:
+                self._fade_from = live
+                np.copyto(self._fade_state, self._allpass_state)
+                self._fade_count.fill(0.0)
+                self._fading = True
+            self._live = live = params
+
+        self._read(ring, live.plan, wp, self._out_flat, self._allpass_state)
+        if self._fading:
+            self._crossfade_rt(ring, wp)
+        if out_block is not self.out_block:
+            np.copyto(out_block, self.out_block)
+        if handover is not None and handover.migration.complete:
+            np.add(wp, self._wp_step, out=handover.successor.write_pointer)
+            np.copyto(handover.successor_state, handover.state)
+            self.successor = handover.successor
+            self.handed_over = True
+        np.add(wp, self._wp_step, out=self._wp_next)
+        self.write_pointer, self._wp_next = self._wp_next, wp
+
+    def _read(self, ring, plan, wp, out_flat, state):
+        groups = plan.groups
+        i = 0
+        while i < len(groups):
+            groups[i].read(ring, wp, out_flat, state)
+            i += 1
+
+    def _crossfade_rt(self, ring, wp):
+        old = self._fade_block
+        out = self.out_block
+        self._read(ring, self._fade_from.plan, wp, self._fade_flat, self._fade_state)
+        row = self._gain_row
+        np.add(self._fade_ramp, self._fade_count, out=row)
+        np.divide(row, self._fade_total, out=row)
+        np.minimum(row, self._one, out=row)
+        row.take(self._gain_cols, out=self._gain, mode="clip")
+        np.subtract(out, old, out=out)
+        np.multiply(out, self._gain_block, out=out)
+        np.add(out, old, out=out)
+        # Zero-dimensional in-place ufuncs allocate; alternate two counters.
+        np.add(self._fade_count, self._fade_step, out=self._fade_next)
+        self._fade_count, self._fade_next = self._fade_next, self._fade_count
+        np.greater_equal(self._fade_count, self._fade_total, out=self._fade_done)
+        if self._fade_done:
+            self._fading = False
+            self._fade_from = self._live
+
+    def process_ports(self, frames):
+        params = self.params
+        if frames != self.max_block:
+            self.prepare(frames)
+            params = self.params
+        chunks = params.plan.inputs
+        c = 0
+        while c < len(chunks):
+            chunk = chunks[c]
+            k = 0
+            while k < len(chunk):
+                row, port = chunk[k]
+                np.copyto(row, port.get_array())
+                k += 1
+            c += 1
+        chunks = params.plan.silent
+        c = 0
+        while c < len(chunks):
+            chunk = chunks[c]
+            k = 0
+            while k < len(chunk):
+                chunk[k].fill(0.0)
+                k += 1
+            c += 1
+        if self.meter is not None:
+            self.meter.process()
+        self.process_block(self.in_block, self.out_block, params)
+        chunks = params.plan.outputs
+        c = 0
+        while c < len(chunks):
+            chunk = chunks[c]
+            k = 0
+            while k < len(chunk):
+                row, port = chunk[k]
+                np.copyto(port.get_array(), row)
+                k += 1
+            c += 1
+
+
+# Sharding (JDelayEngine threads > 1): the channels are split into shards of
+# consecutive channels, each an independent MultiChannelDelay or RealtimeDelay
+# with its own ring, parameters and ports. NumPy releases the GIL inside its
+# copies and ufunc loops, so shards processed on different threads overlap
+# wherever the per-period work is dominated by array operations.
+
+
+def _process_shards(shards, frames):
+    i = 0
+    while i < len(shards):
+        shards[i].process_ports(frames)
+        i += 1
+
+
+class ShardPool:
+    # Worker threads started once, each parked on its own lock. run() releases
+    # every worker's start lock, processes the first shard list on the calling
+    # (JACK) thread and then takes every done lock: two lock operations per
+    # worker and period, and nothing allocated.
+    def __init__(self, workers):
+        self.workers = workers
+        self.tasks = None
+        self.frames = 0
+        self.error = None
+        self.stopping = False
+        self._start = [threading.Lock() for _ in range(workers)]
+        self._done = [threading.Lock() for _ in range(workers)]
+        for lock in self._start + self._done:
+            lock.acquire()
+        self._threads = [
+            threading.Thread(target=self._work, args=(i,), name=f"jdelay-shard-{i + 1}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, i):
+        start, done = self._start[i], self._done[i]
+        while True:
+            start.acquire()
+            if self.stopping:
+                done.release()
+                return
+            try:
+                _process_shards(self.tasks[i + 1], self.frames)
+            except Exception as e:
+                self.error = e
+            done.release()
+
+    def run(self, tasks, frames):
+        # tasks[0] runs here, tasks[i + 1] on worker i.
+        self.tasks = tasks
+        self.frames = frames
+        i = 0
+        while i < self.workers:
+            self._start[i].release()
+            i += 1
+        try:
+            _process_shards(tasks[0], frames)
+        finally:
+            i = 0
+            while i < self.workers:
+                self._done[i].acquire()
+                i += 1
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def stop(self):
+        self.stopping = True
+        for lock in self._start:
+            lock.release()
+        for thread in self._threads:
+            thread.join()
+
+
+class _ShardedParams:
+    # The joined settings of all shards, for the control side: every channel's
+    # output, then every tap, as in an unsharded engine.
+    def __init__(self, shards):
+        params = [shard.params for shard in shards]
+        parts = [slice(None, shard.channels) for shard in shards] + [slice(shard.channels, None) for shard in shards]
+        params = params + params
+        self.delays_ms = tuple(d for p, part in zip(params, parts) for d in p.delays_ms[part])
+        self.interp = tuple(mode for p, part in zip(params, parts) for mode in p.interp[part])
+        self.delay_frames = np.concatenate([p.delay_frames[part] for p, part in zip(params, parts)])
+        self.delay_fraction = np.concatenate([p.delay_fraction[part] for p, part in zip(params, parts)])
+
+
+class ShardedDelay:
+    # Stands in for a MultiChannelDelay on the engine side. `make(channels,
+    # taps)` builds one shard; shard k holds channels k * shard_size onwards
+    # and the taps of those channels. Keeping shard_size across channel count
+    # changes lets every shard hand over to the shard at the same position, so
+    # kept channels never move between shards. Taps must be sorted by channel.
+    def __init__(self, channels, shard_size, make, pool, taps=()):
+        self.channels = channels
+        self.taps = tuple(taps)
+        self.outputs = channels + len(self.taps)
+        self.shard_size = shard_size
+        self.pool = pool
+        self.bounds = [(a, min(a + shard_size, channels)) for a in range(0, channels, shard_size)]
+        self.tap_bounds = [(sum(c < a for c in self.taps), sum(c < b for c in self.taps)) for a, b in self.bounds]
+        self.shards = [
+            make(b - a, [c - a for c in self.taps[ta:tb]]) for (a, b), (ta, tb) in zip(self.bounds, self.tap_bounds)
+        ]
+        lanes = pool.workers + 1
+        self._tasks = [self.shards[i::lanes] for i in range(lanes)]
+        self._running = False
+        self._handing_over = None
+        self._next = None
+        self.successor = None
+        self.handed_over = False
+
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, running):
+        self._running = running
+        for shard in self.shards:
+            shard.running = running
+
+    @property
+    def params(self):
+        return _ShardedParams(self.shards)
+
+    def publish(self, delays_ms=None, interp=None, in_ports=None, out_ports=None, crossfade=True):
+        # Per output: the shard's channels, then their taps.
+        def outputs(values, a, b, ta, tb):
+            return list(values[a:b]) + list(values[self.channels + ta : self.channels + tb])
+
+        for (a, b), (ta, tb), shard in zip(self.bounds, self.tap_bounds, self.shards):
+            shard.publish(
+                None if delays_ms is None else outputs(delays_ms, a, b, ta, tb),
+                None if interp is None else interp[a:b],
+                None if in_ports is None else in_ports[a:b],
+                None if out_ports is None else outputs(out_ports, a, b, ta, tb),
+                crossfade,
+            )
+
+    def hand_over(self, successor, deadline=None):
+        # Shards beyond the successor's count are dropped, successor shards
+        # beyond ours start empty. Shards that finish early keep feeding their
+        # successor until all are done.
+        pairs = list(zip(self.shards, successor.shards))
+        for shard, target in pairs:
+            if not shard.hand_over(target, deadline):
+                return False
+        self._next = successor
+        self._handing_over = [shard for shard, _ in pairs]
+        return True
+
+    def adopt(self, previous, resample=True):
+        for shard, old in zip(self.shards, previous.shards):
+            shard.adopt(old, resample)
+
+    def levels(self):
+        levels = [shard.levels() for shard in self.shards]
+        if any(level is None for level in levels):
+            return None
+        return np.concatenate([peak for peak, _ in levels]), np.concatenate([rms for _, rms in levels])
+
+    def warm(self):
+        for shard in self.shards:
+            shard.warm()
+
+    def memory_usage(self):
+        channel, total = [], 0
+        for shard in self.shards:
+            shard_channel, shard_total = shard.memory_usage()
+            channel += shard_channel
+            total += shard_total
+        return channel, total
+
+    def process_ports(self, frames):
+        self.pool.run(self._tasks, frames)
+        pending = self._handing_over
+        if pending is not None and not self.handed_over:
+            i = 0
+            while i < len(pending) and pending[i].handed_over:
+                i += 1
+            if i == len(pending):
+                self.successor = self._next
+                self.handed_over = True
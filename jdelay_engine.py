@@ -0,0 +1,1270 @@
+# ***jdelay_engine.py***
+# Version: ***1.0***
+# Description: ***Headless JACK engine, config loading and daemon entry point for J-Delay***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# Only light standard-library modules are imported here. NumPy (through
+# jdelay_dsp) and JACK-Client are imported when they are first needed, and
+# tkinter is never imported by this module.
+import argparse
+import gc
+import importlib
+import json
+import math
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from array import array
+
+# Settings file of earlier versions, imported into the preset store once.
+CONFIG_FILE = "J-Delay.ini"
+CLIENT_NAME = "j_delay"
+DEFAULT_FADE_MS = 20.0
+# Same names as jdelay_dsp.INTERP_MODES, spelled out so parsing does not load NumPy.
+INTERP_NAMES = ("none", "linear", "cubic", "allpass")
+# Callback time histogram in percent of the period; the last bucket collects >= 200 %.
+STATS_BUCKETS = 201
+STATS_INTERVAL = 1.0
+# Longest wait for the process callback to take over a new channel count.
+RESIZE_TIMEOUT = 5.0
+# Same names as jdelay_measure.SIGNALS.
+MEASURE_SIGNALS = ("impulse", "mls", "sweep")
+# Same as jdelay_dsp.BUFFER_FORMATS and WARM_INTERVAL.
+BUFFER_FORMATS = ("float32", "float16")
+WARM_INTERVAL = 0.005
+# Same values as jack.CAPTURE and jack.PLAYBACK, so JACK-Client is not needed for them.
+LATENCY_CAPTURE = 0
+LATENCY_PLAYBACK = 1
+# Seconds between reconnect attempts after JACK shut down: doubling from
+# RECONNECT_MIN, at most RECONNECT_MAX, which bounds how long a returned server
+# waits for us.
+RECONNECT_MIN = 0.02
+RECONNECT_MAX = 0.5
+# Longest wait for the first callback after a reconnect.
+RECOVER_TIMEOUT = 5.0
+
+
+def initial_delays(channels, initial_delay=0.0, loaded_delays=None):
+    # Loaded delays win; channels without a stored value get the initial delay.
+    delays = [initial_delay] * channels
+    if loaded_delays:
+        for i, d in enumerate(loaded_delays[:channels]):
+            delays[i] = d
+    return delays
+
+
+def parse_latency_groups(text):
+    # "all", or comma separated groups of 1-based channels such as "1-4,5-8"
+    # or "1+3+5,2+4+6", which become lists of channel indices.
+    if text == "all":
+        return text
+    groups = []
+    for item in text.split(","):
+        try:
+            if "-" in item:
+                first, last = item.split("-")
+                group = list(range(int(first) - 1, int(last)))
+            else:
+                group = [int(c) - 1 for c in item.split("+")]
+        except ValueError:
+            group = []
+        if not group or min(group) < 0:
+            raise argparse.ArgumentTypeError(f"invalid latency group {item!r}")
+        groups.append(group)
+    return groups
+
+
+def initial_interp(channels, interp="none", loaded_interp=None):
+    result = [interp] * channels
+    if loaded_interp:
+        for i, mode in enumerate(loaded_interp[:channels]):
+            if mode in INTERP_NAMES:
+                result[i] = mode
+    return result
+
+
+def initial_taps(channels, loaded_taps=None):
+    # Extra outputs as (channel index, delay in ms), sorted by channel; the
+    # taps of one channel keep their order, taps of missing channels are dropped.
+    taps = [(int(channel), float(ms)) for channel, ms in loaded_taps or ()]
+    return sorted([tap for tap in taps if 0 <= tap[0] < channels], key=lambda tap: tap[0])
+
+
+def tap_port_names(taps):
+    # out_N_tapK, K counting the taps of channel N from 1.
+    counts = {}
+    names = []
+    for channel, _ in taps:
+        counts[channel] = counts.get(channel, 0) + 1
+        names.append(f"out_{channel + 1}_tap{counts[channel]}")
+    return names
+
+
+def parse_tap(text):
+    # "N:ms", N counting from 1, as (channel index, ms).
+    try:
+        channel, ms = text.split(":")
+        tap = (int(channel) - 1, float(ms))
+    except ValueError:
+        tap = (-1, 0.0)
+    if tap[0] < 0 or not tap[1] >= 0.0:
+        raise argparse.ArgumentTypeError(f"invalid tap {text!r}, expected CHANNEL:MS")
+    return tap
+
+
+class CallbackStats:
+    # Written only by the process and xrun callbacks, into preallocated storage.
+    # The control thread reads it through snapshot(); a value may be one
+    # callback stale, which does not matter at a one-second refresh. Per-callback
+    # counts are floats: Python ints above 256 are allocated, floats come from
+    # the interpreter's free list.
+    def __init__(self):
+        self.histogram = array("d", bytes(8 * STATS_BUCKETS))
+        self.reset()
+
+    def reset(self):
+        for i in range(STATS_BUCKETS):
+            self.histogram[i] = 0.0
+        self.callbacks = 0.0
+        self.errors = 0
+        self.last_error = None
+        self.xruns = 0
+        self.own_xruns = 0
+        self.xrun_delay_us = 0.0
+        self.busy = 0.0
+        self.period_total = 0.0
+        self.last_load = 0.0
+        self.max_load = 0.0
+        self.frames = 0
+        self._mark = (0.0, 0.0)
+
+    def record(self, duration, frames, period):
+        load = duration / period
+        self.histogram[int(min(load * 100.0, STATS_BUCKETS - 1.0))] += 1.0
+        self.callbacks += 1.0
+        self.busy += duration
+        self.period_total += period
+        self.last_load = load
+        self.frames = frames
+        if load > self.max_load:
+            self.max_load = load
+
+    def record_xrun(self, delayed_usecs):
+        self.xruns += 1
+        self.xrun_delay_us += delayed_usecs
+        # Our own previous callback ran past its deadline.
+        if self.last_load >= 1.0:
+            self.own_xruns += 1
+
+    def percentile(self, q):
+        # Upper edge of the histogram bucket holding the q-th percentile, as a
+        # fraction of the period.
+        total = sum(self.histogram)
+        if not total:
+            return 0.0
+        limit = total * q / 100.0
+        count = 0
+        for i, n in enumerate(self.histogram):
+            count += n
+            if count >= limit:
+                return (i + 1) / 100.0
+        return STATS_BUCKETS / 100.0
+
+    def snapshot(self):
+        # DSP load is averaged since the previous snapshot; the percentiles and
+        # the maximum cover everything since the last reset.
+        busy, period_total = self.busy, self.period_total
+        window = period_total - self._mark[1]
+        load = (busy - self._mark[0]) / window if window > 0 else 0.0
+        self._mark = (busy, period_total)
+        return {
+            "callbacks": int(self.callbacks),
+            "frames": self.frames,
+            "dsp_load": load,
+            "p50_load": self.percentile(50),
+            "p99_load": self.percentile(99),
+            "max_load": self.max_load,
+            "errors": self.errors,
+            "last_error": repr(self.last_error) if self.last_error is not None else None,
+            "xruns": self.xruns,
+            "own_xruns": self.own_xruns,
+            "xrun_delay_us": self.xrun_delay_us,
+        }
+
+
+class StatsReporter:
+    # Sends stats snapshots as JSON, either to a file that is replaced
+    # atomically or, for "udp://host:port", as one datagram each.
+    def __init__(self, target):
+        self.target = target
+        self.sock = None
+        if target.startswith("udp://"):
+            host, _, port = target[len("udp://") :].rpartition(":")
+            self.address = (host or "127.0.0.1", int(port))
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, stats):
+        payload = json.dumps(stats, sort_keys=True)
+        try:
+            if self.sock:
+                self.sock.sendto(payload.encode(), self.address)
+            else:
+                tmp = f"{self.target}.tmp"
+                with open(tmp, "w") as f:
+                    f.write(payload + "\n")
+                os.replace(tmp, self.target)
+        except OSError as e:
+            print(f"J-Delay: cannot write stats to {self.target}: {e}", file=sys.stderr)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+
+
+class JDelayEngine:
+    # Owns the JACK client, the ports and the DSP. The GUI and the headless
+    # daemon both drive J-Delay through this class.
+    def __init__(
+        self,
+        channels=2,
+        max_delay_ms=1000.0,
+        delays_ms=None,
+        interp_modes=None,
+        fade_ms=DEFAULT_FADE_MS,
+        client_name=CLIENT_NAME,
+        client_factory=None,
+        realtime=False,
+        threads=1,
+        meters=True,
+        resample=True,
+        latency_groups=None,
+        buffer_format="float32",
+        buffer_dir=None,
+        taps=None,
+        reconnect=True,
+    ):
+        if realtime and buffer_format != "float32":
+            raise ValueError("The real-time engine keeps its buffers in float32")
+        self.channels = channels
+        self.max_delay_ms = max_delay_ms
+        self.fade_ms = fade_ms
+        self.client_name = client_name
+        self.client_factory = client_factory
+        self.realtime = realtime
+        # Threads processing the channels; above 1 the DSP is sharded (see
+        # jdelay_dsp.ShardedDelay) and threads - 1 workers join the JACK thread.
+        self.threads = max(int(threads), 1)
+        self.pool = None
+        self.shard_size = None
+        # Per-channel input peak/RMS, computed in the callback; see levels().
+        self.meters = meters
+        # Resample the buffered audio when JACK changes its sample rate, rather
+        # than restarting the delays from silence.
+        self.resample = resample
+        # Lists of channel indices whose delays are set automatically so their
+        # paths through the JACK graph line up, or "all" for one group of every
+        # channel; None leaves delays to the user.
+        self.latency_groups = latency_groups
+        # Ring sample format and, for long delays, a directory to map the rings
+        # from files in (see jdelay_dsp.DelayRing); such rings are kept warm
+        # by a background thread while active.
+        self.buffer_format = buffer_format
+        self.buffer_dir = buffer_dir
+        self.warmer = None
+        # Called from the latency thread after a compensation changed delays.
+        self.on_compensate = None
+        self.compensations = 0
+        # Channel -> capture latency of in_N / playback latency of out_N, in
+        # frames, as last reported by JACK.
+        self.capture_latency = {}
+        self.playback_latency = {}
+        self._latency_wake = threading.Condition(threading.Lock())
+        self._latency_dirty = set()
+        self._latency_report = False
+        self._latency_busy = False
+        self._latency_thread = None
+        self.delays_ms = initial_delays(channels, 0.0, delays_ms)
+        self.interp_modes = initial_interp(channels, "none", interp_modes)
+        # Extra outputs out_N_tapK reading channel N's buffer at their own
+        # delays, as (channel, ms) sorted by channel (see initial_taps).
+        self.taps = initial_taps(channels, taps)
+        self.sample_rate = 44100
+        self.blocksize = 1024
+
+        self.client = None
+        self.dsp = None
+        self.active = False
+        self.in_ports = []
+        self.out_ports = []
+        self.tap_ports = []
+        # Input port name -> number of connections, while JACK reports them.
+        self.in_connections = None
+        self.shutdown_reason = None
+        self.on_shutdown = None
+        # After a JACK shutdown, a watchdog thread reopens the client with the
+        # same ports and connections (see shutdown_cb); on_recover is called
+        # from it once audio flows again.
+        self.reconnect = reconnect
+        self.on_recover = None
+        self.recoveries = 0
+        # Figures of the last recovery, see _recover().
+        self.recovery = None
+        # (output, input) names of every connection of our ports, as JACK
+        # reported them.
+        self.connections = set()
+        self._port_prefix = None
+        self._watchdog = None
+        self._watchdog_lock = threading.Lock()
+        self._watchdog_stop = threading.Event()
+        self._lost = False
+        self.stats = CallbackStats()
+        self.measurement = None
+        # Even channel indices whose pair (i, i + 1) moves together.
+        self.links = set()
+        # Serializes control threads (GUI, OSC) around configure/publish.
+        self.lock = threading.RLock()
+
+    def connect(self):
+        if self.client_factory is None:
+            import jack
+
+            self.client_factory = jack.Client
+        self.client = self.client_factory(self.client_name, no_start_server=True)
+        # JACK may have given the client another name.
+        self._port_prefix = f"{self.client.name}:"
+        self.client.set_process_callback(self.process)
+        self.client.set_samplerate_callback(self.samplerate_cb)
+        self.client.set_blocksize_callback(self.blocksize_cb)
+        self.client.set_shutdown_callback(self.shutdown_cb)
+        self.client.set_xrun_callback(self.xrun_cb)
+        if hasattr(self.client, "set_port_connect_callback"):
+            self.client.set_port_connect_callback(self.port_connect_cb)
+            self.in_connections = {}
+        if hasattr(self.client, "set_latency_callback"):
+            self.client.set_latency_callback(self.latency_cb)
+        self.sample_rate = self.client.samplerate
+        self.blocksize = self.client.blocksize
+        self.shutdown_reason = None
+
+    def activate(self):
+        if not self.client:
+            self.connect()
+        self.in_ports = []
+        self.out_ports = []
+        for i in range(self.channels):
+            self.in_ports.append(self._register_input(i))
+            self.out_ports.append(self.client.outports.register(f"out_{i+1}"))
+        self.tap_ports = self._tap_ports(self.taps)
+        self.init_buffers()
+        self.stats.reset()
+        if self.realtime:
+            # Everything built so far lives as long as the engine; moving it out
+            # of the collector's reach keeps collections short.
+            gc.collect()
+            gc.freeze()
+        self.client.activate()
+        self.active = True
+        self.dsp.running = True
+        self.update_latency()
+        if self.buffer_dir is not None:
+            self.warmer = threading.Event()
+            threading.Thread(target=self._warm_loop, args=(self.warmer,), name="jdelay-warm", daemon=True).start()
+
+    def deactivate(self):
+        self.client.deactivate()
+        self.active = False
+        self.dsp.running = False
+        if self.warmer is not None:
+            self.warmer.set()
+            self.warmer = None
+        for p in self.in_ports + self.out_ports + self.tap_ports:
+            p.unregister()
+        if self.in_connections is not None:
+            self.in_connections.clear()
+        self.connections.clear()
+        self.capture_latency.clear()
+        self.playback_latency.clear()
+        self.in_ports = []
+        self.out_ports = []
+        self.tap_ports = []
+
+    def close(self):
+        if self._watchdog:
+            self._watchdog_stop.set()
+            self._watchdog.join()
+            self._watchdog = None
+            self._watchdog_stop.clear()
+        if self.client:
+            try:
+                if self.active:
+                    self.deactivate()
+                self.client.close()
+            except Exception as e:
+                # The server may already be gone; the client is dropped anyway.
+                print(f"J-Delay: closing the JACK client failed: {e}", file=sys.stderr)
+            self.client = None
+        if self.pool:
+            self.pool.stop()
+            self.pool = None
+        if self._latency_thread:
+            with self._latency_wake:
+                self._latency_report = None
+                self._latency_wake.notify()
+            self._latency_thread.join()
+            self._latency_thread = None
+            self._latency_report = False
+
+    def init_buffers(self):
+        self.dsp = self._new_dsp(
+            self.channels,
+            self.output_delays(),
+            self.interp_modes,
+            self.in_ports,
+            self.out_ports + self.tap_ports,
+            [channel for channel, _ in self.taps],
+        )
+
+    def output_delays(self):
+        # Delays of every DSP output: the channels' own, then the taps'.
+        return list(self.delays_ms) + [ms for _, ms in self.taps]
+
+    def _new_dsp(self, channels, delays_ms, interp_modes, in_ports, out_ports, taps=()):
+        # `delays_ms` and `out_ports` cover every output, `taps` lists the
+        # channel each tap reads.
+        from jdelay_dsp import MultiChannelDelay, RealtimeDelay, ShardedDelay, ShardPool
+
+        def make(count, taps):
+            if self.realtime:
+                return RealtimeDelay(
+                    count,
+                    self.max_delay_ms,
+                    self.sample_rate,
+                    self.blocksize,
+                    fade_ms=self.fade_ms,
+                    metering=self.meters,
+                    buffer_dir=self.buffer_dir,
+                    taps=taps,
+                )
+            dsp = MultiChannelDelay(
+                count,
+                self.max_delay_ms,
+                self.sample_rate,
+                fade_ms=self.fade_ms,
+                metering=self.meters,
+                buffer_format=self.buffer_format,
+                buffer_dir=self.buffer_dir,
+                taps=taps,
+            )
+            dsp.prepare_blocks(self.blocksize)
+            return dsp
+
+        # Rings are sized from the current delays before the callback sees the
+        # new DSP, so nothing has to grow while audio runs.
+        if self.threads > 1:
+            if self.pool is None:
+                self.pool = ShardPool(self.threads - 1)
+            if self.shard_size is None:
+                # Whole stereo pairs per shard; kept for later channel changes.
+                per_thread = -(-channels // self.threads)
+                self.shard_size = max(per_thread + per_thread % 2, 2)
+            dsp = ShardedDelay(channels, self.shard_size, make, self.pool, taps)
+        else:
+            dsp = make(channels, taps)
+        dsp.publish(delays_ms, interp_modes, self._connected(in_ports), out_ports, crossfade=False)
+        dsp.running = self.active
+        return dsp
+
+    def _tap_ports(self, taps):
+        # Output ports for `taps`; ports that already exist under the same
+        # name are kept, with their connections.
+        ports = {p.shortname: p for p in self.tap_ports}
+        return [ports.get(name) or self.client.outports.register(name) for name in tap_port_names(taps)]
+
+    def _register_input(self, i):
+        port = self.client.inports.register(f"in_{i+1}")
+        if self.in_connections is not None:
+            self.in_connections[port.name] = 0
+        return port
+
+    def _connected(self, in_ports):
+        # The DSP gets None for inputs without connections and zeroes them
+        # instead of copying JACK's silent buffer every period.
+        if self.in_connections is None:
+            return in_ports
+        return [p if self.in_connections.get(p.name, 0) > 0 else None for p in in_ports]
+
+    def port_connect_cb(self, a, b, connect):
+        # JACK notification thread; counts instead of querying JACK here.
+        if a.name.startswith(self._port_prefix) or b.name.startswith(self._port_prefix):
+            pair = (a.name, b.name) if a.is_output else (b.name, a.name)
+            if connect:
+                self.connections.add(pair)
+            else:
+                self.connections.discard(pair)
+        connections = self.in_connections
+        if b.name not in connections:
+            return
+        was = connections[b.name] > 0
+        connections[b.name] = max(connections[b.name] + (1 if connect else -1), 0)
+        if (connections[b.name] > 0) != was and self.dsp:
+            with self.lock:
+                self.dsp.publish(in_ports=self._connected(self.in_ports))
+            if self.latency_groups is not None:
+                # The channel joins or leaves its group's alignment.
+                self._wake_latency({i for i, p in enumerate(self.in_ports) if p.name == b.name})
+
+    def configure(self, channels=None, delays_ms=None, interp_modes=None, taps=None):
+        # Control-thread entry point: copies the settings and publishes them to
+        # the running DSP. A new channel count or tap layout while active
+        # registers and unregisters only the ports that change, then delays
+        # that changed on the remaining outputs are crossfaded as usual. Taps
+        # of channels that go away are dropped.
+        with self.lock:
+            count = self.channels if channels is None else channels
+            taps = initial_taps(count, self.taps if taps is None else taps)
+            layout = [channel for channel, _ in taps]
+            if count != self.channels or layout != [channel for channel, _ in self.taps]:
+                if self.active:
+                    self.resize(count, delays_ms, interp_modes, taps)
+                self.channels = count
+                self.delays_ms = initial_delays(count, 0.0, self.delays_ms)
+                self.interp_modes = initial_interp(count, "none", self.interp_modes)
+            self.taps = taps
+            if delays_ms is not None:
+                self.delays_ms = initial_delays(self.channels, 0.0, delays_ms)
+            if interp_modes is not None:
+                self.interp_modes = initial_interp(self.channels, "none", interp_modes)
+            self.publish()
+        self.update_latency()
+
+    def set_link(self, channel, linked):
+        pair = channel - channel % 2
+        if linked:
+            self.links.add(pair)
+        else:
+            self.links.discard(pair)
+
+    def linked_channel(self, channel):
+        # The other channel of a linked pair, or -1.
+        pair = channel - channel % 2
+        partner = pair + 1 - channel % 2
+        if pair in self.links and partner < self.channels:
+            return partner
+        return -1
+
+    def publish(self):
+        if self.dsp:
+            self.dsp.publish(self.output_delays(), self.interp_modes)
+
+    def resize(self, channels, delays_ms=None, interp_modes=None, taps=None, timeout=RESIZE_TIMEOUT):
+        # Control thread, while active: the channels both counts share keep
+        # their ports, connections, delays and buffered audio. A DSP for the new
+        # count and `taps` (the current ones by default) is prepared here, the
+        # callback hands over to it (see MultiChannelDelay.hand_over) and only
+        # then are dropped ports removed. New channels start with their entry
+        # of `delays_ms`/`interp_modes`.
+        taps = initial_taps(channels, self.taps if taps is None else taps)
+        kept = min(channels, self.channels)
+        current = self.dsp.params
+        delays = list(current.delays_ms[:kept]) + initial_delays(channels, 0.0, delays_ms)[kept:]
+        interp = list(current.interp[:kept]) + initial_interp(channels, "none", interp_modes)[kept:]
+        in_ports = self.in_ports[:kept]
+        out_ports = self.out_ports[:kept]
+        for i in range(kept, channels):
+            in_ports.append(self._register_input(i))
+            out_ports.append(self.client.outports.register(f"out_{i+1}"))
+        tap_ports = self._tap_ports(taps)
+        dsp = self._new_dsp(
+            channels,
+            delays + [ms for _, ms in taps],
+            interp,
+            in_ports,
+            out_ports + tap_ports,
+            [channel for channel, _ in taps],
+        )
+        old = self.dsp
+        deadline = time.monotonic() + timeout
+        if not old.hand_over(dsp, deadline):
+            # A ring growth the callback never got to finish: switch without
+            # the buffered audio rather than wait for it.
+            self.dsp = dsp
+        while self.dsp is not dsp:
+            if not self.active or time.monotonic() > deadline:
+                # No callbacks are coming; nothing is lost by switching here.
+                self.dsp = dsp
+                break
+            time.sleep(0.002)
+        old.running = False
+        dropped = self.in_ports[kept:] + self.out_ports[kept:] + [p for p in self.tap_ports if p not in tap_ports]
+        self.in_ports = in_ports
+        self.out_ports = out_ports
+        self.tap_ports = tap_ports
+        # The callback that switched may still be writing the old outputs.
+        done = self.stats.callbacks
+        while dropped and self.active and self.stats.callbacks < done + 2 and time.monotonic() < deadline:
+            time.sleep(0.002)
+        for port in dropped:
+            port.unregister()
+            if self.in_connections is not None:
+                self.in_connections.pop(port.name, None)
+
+    def start_measurement(self, kind="mls", channels=None, level=None, max_latency_ms=None):
+        # Plays a test signal on out_N and records in_N for the given channels
+        # (all by default) in one pass. Poll measurement.finished, then call
+        # finish_measurement().
+        if not self.active:
+            raise RuntimeError("Activate before measuring")
+        from jdelay_measure import LEVEL, MAX_LATENCY_MS, LatencyMeasurement
+
+        self.measurement = LatencyMeasurement(
+            self.channels,
+            self.sample_rate,
+            kind,
+            LEVEL if level is None else level,
+            MAX_LATENCY_MS if max_latency_ms is None else max_latency_ms,
+            channels,
+        )
+        return self.measurement
+
+    def finish_measurement(self):
+        measurement, self.measurement = self.measurement, None
+        return measurement.result() if measurement else {}
+
+    def measure(self, kind="mls", channels=None, level=None, max_latency_ms=None, timeout=10.0):
+        # Blocking helper: returns {channel index: loop latency in ms or None}.
+        measurement = self.start_measurement(kind, channels, level, max_latency_ms)
+        deadline = time.monotonic() + timeout
+        while not measurement.finished:
+            if time.monotonic() > deadline or not self.active:
+                self.measurement = None
+                raise RuntimeError("Measurement did not complete")
+            time.sleep(0.02)
+        return self.finish_measurement()
+
+    def apply_latencies(self, latencies, mode="align"):
+        from jdelay_measure import compensation_delays
+
+        self.configure(delays_ms=compensation_delays(latencies, self.delays_ms, mode))
+        return self.delays_ms
+
+    def samplerate_cb(self, sr):
+        if sr != self.sample_rate:
+            self.sample_rate = sr
+            self.retune()
+
+    def blocksize_cb(self, blocksize):
+        if blocksize != self.blocksize:
+            self.blocksize = blocksize
+            self.retune()
+
+    def retune(self):
+        # JACK notification thread, called between periods while JACK holds
+        # processing for a new sample rate or period size. Everything for the
+        # new settings is built here, the buffered audio is carried over
+        # (see MultiChannelDelay.adopt) and the callback picks the new DSP up
+        # with its next period, from one reference swap.
+        with self.lock:
+            old = self.dsp
+            if old is None:
+                return
+            params = old.params
+            dsp = self._new_dsp(
+                self.channels,
+                params.delays_ms,
+                params.interp,
+                self.in_ports,
+                self.out_ports + self.tap_ports,
+                [channel for channel, _ in self.taps],
+            )
+            dsp.adopt(old, self.resample)
+            self.dsp = dsp
+            old.running = False
+        self.update_latency()
+
+    def _warm_loop(self, stop):
+        # Pages of memory-mapped rings the callback is about to touch are read
+        # in here (see MultiChannelDelay.warm), whichever DSP is in use.
+        while not stop.wait(WARM_INTERVAL):
+            dsp = self.dsp
+            if dsp is not None:
+                try:
+                    dsp.warm()
+                except Exception as e:
+                    print(f"J-Delay: buffer warm-up failed: {e}", file=sys.stderr)
+
+    def latency_cb(self, mode):
+        # JACK notification thread, whenever latencies in the graph may have
+        # changed: in CAPTURE mode JACK has just set the capture latency of
+        # in_N from upstream, in PLAYBACK mode the playback latency of out_N
+        # from downstream. Each output passes them on with its own delay
+        # added; an input with taps gets the widest range of its outputs.
+        # Channels whose path latency changed are handed to the latency
+        # thread, which never holds the engine lock across a JACK call, so
+        # this callback does not take it.
+        dsp = self.dsp
+        if dsp is None:
+            return
+        params = dsp.params
+        frames = params.delay_frames.tolist()
+        longer = (params.delay_fraction > 0.0).tolist()
+        in_ports, out_ports = self.in_ports, self.out_ports
+        outputs = out_ports + self.tap_ports
+        sources = list(range(len(out_ports))) + [channel for channel, _ in self.taps]
+        if mode == LATENCY_CAPTURE:
+            ports, known = in_ports, self.capture_latency
+        else:
+            ports, known = out_ports, self.playback_latency
+        ranges = [port.get_latency_range(mode) for port in ports]
+        changed = set()
+        for i, (low, high) in enumerate(ranges):
+            if known.get(i) != high:
+                known[i] = high
+                changed.add(i)
+        if mode == LATENCY_CAPTURE:
+            for port, source, delay, more in zip(outputs, sources, frames, longer):
+                if source < len(ranges):
+                    low, high = ranges[source]
+                    port.set_latency_range(mode, (low + delay, high + delay + more))
+        else:
+            widest = {}
+            for i, (port, source, delay, more) in enumerate(zip(outputs, sources, frames, longer)):
+                low, high = ranges[i] if i < len(ranges) else port.get_latency_range(mode)
+                low, high = low + delay, high + delay + more
+                if source in widest:
+                    low, high = min(low, widest[source][0]), max(high, widest[source][1])
+                widest[source] = (low, high)
+            for i, port in enumerate(in_ports):
+                if i in widest:
+                    port.set_latency_range(mode, widest[i])
+        if changed and self.latency_groups is not None:
+            self._wake_latency(changed)
+
+    def update_latency(self):
+        # Asks JACK to recompute the graph's latencies (and so to call
+        # latency_cb) after the delays changed; done on the latency thread.
+        if self.active and hasattr(self.client, "recompute_total_latencies"):
+            self._wake_latency(report=True)
+
+    def _wake_latency(self, channels=(), report=False):
+        with self._latency_wake:
+            if self._latency_report is None:
+                return
+            self._latency_dirty.update(channels)
+            self._latency_report = self._latency_report or report
+            if self._latency_thread is None:
+                self._latency_thread = threading.Thread(target=self._latency_loop, name="jdelay-latency", daemon=True)
+                self._latency_thread.start()
+            self._latency_wake.notify()
+
+    def _latency_loop(self):
+        while True:
+            with self._latency_wake:
+                self._latency_busy = False
+                self._latency_wake.notify_all()
+                while not self._latency_dirty and self._latency_report is False:
+                    self._latency_wake.wait()
+                if self._latency_report is None:
+                    return
+                dirty, self._latency_dirty = self._latency_dirty, set()
+                self._latency_report = False
+                self._latency_busy = True
+            try:
+                if dirty:
+                    self.compensate_latency(dirty)
+                else:
+                    client = self.client
+                    if self.active and client is not None:
+                        client.recompute_total_latencies()
+            except Exception as e:
+                print(f"J-Delay: latency update failed: {e}", file=sys.stderr)
+
+    def wait_latency(self, timeout=5.0):
+        # Blocks until pending compensations and latency reports are done.
+        deadline = time.monotonic() + timeout
+        with self._latency_wake:
+            while self._latency_busy or self._latency_dirty or self._latency_report:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._latency_wake.wait(left)
+        return True
+
+    def path_latency(self, channel):
+        # Frames from the capture of in_N's sources to the playback of out_N's
+        # destinations, without this channel's own delay; None while in_N has
+        # no connections.
+        if self.in_connections is not None and self.in_connections.get(self.in_ports[channel].name, 0) == 0:
+            return None
+        if channel not in self.capture_latency:
+            return None
+        return self.capture_latency[channel] + self.playback_latency.get(channel, 0)
+
+    def compensate_latency(self, channels):
+        # Latency thread: new delays for the groups holding any of `channels`,
+        # so every connected channel of a group ends up with the path latency
+        # of its slowest one. Delays only change when the graph did.
+        from jdelay_measure import compensation_delays
+
+        with self.lock:
+            delays = list(self.delays_ms)
+            groups = self.latency_groups
+            if groups == "all":
+                groups = [range(self.channels)]
+            for group in groups:
+                group = [c for c in group if c < self.channels]
+                if not channels.intersection(group):
+                    continue
+                latencies = {}
+                for c in group:
+                    frames = self.path_latency(c)
+                    if frames is not None:
+                        latencies[c] = frames * 1000.0 / self.sample_rate
+                delays = compensation_delays(latencies, delays, "align")
+            delays = [min(d, self.max_delay_ms) for d in delays]
+            if delays == self.delays_ms:
+                return False
+            self.configure(delays_ms=delays)
+            self.compensations += 1
+        if self.on_compensate:
+            self.on_compensate()
+        return True
+
+    def shutdown_cb(self, status, reason):
+        # JACK's thread, with the client already unusable: no JACK calls here,
+        # the watchdog thread does the reconnecting.
+        self.active = False
+        self.shutdown_reason = reason
+        if self.reconnect:
+            with self._watchdog_lock:
+                self._lost = True
+                if self._watchdog is None or not self._watchdog.is_alive():
+                    self._watchdog = threading.Thread(target=self._watch, name="jdelay-watchdog", daemon=True)
+                    self._watchdog.start()
+        if self.on_shutdown:
+            self.on_shutdown()
+
+    @property
+    def reconnecting(self):
+        return self._watchdog is not None and self._watchdog.is_alive()
+
+    def _watch(self):
+        # Recovers until no shutdown came in meanwhile, e.g. one during the
+        # previous recovery.
+        while True:
+            with self._watchdog_lock:
+                if not self._lost or self._watchdog_stop.is_set():
+                    return
+                self._lost = False
+            self._recover(time.perf_counter())
+
+    def _recover(self, lost_at):
+        # Reopens the client once the server is back, backing off between
+        # attempts; an engine that was running gets its ports and DSP back
+        # (activate()) and then its connections in one pass. The delays, taps
+        # and buffers are set up from the current settings; what was buffered
+        # is gone with the server.
+        pairs, prefix = set(self.connections), self._port_prefix
+        resume = self.dsp is not None and self.dsp.running
+        restored = missing = 0
+        self._drop_client()
+        wait = RECONNECT_MIN
+        attempts = 0
+        while not self._watchdog_stop.is_set():
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                with self.lock:
+                    if resume:
+                        self.activate()
+                        restored, missing = self.restore_connections(pairs, prefix)
+                        callbacks = self.stats.callbacks
+                    else:
+                        self.connect()
+                break
+            except Exception:
+                self._drop_client()
+                self._watchdog_stop.wait(wait)
+                wait = min(wait * 2, RECONNECT_MAX)
+        else:
+            return
+        if resume:
+            deadline = start + RECOVER_TIMEOUT
+            while self.stats.callbacks <= callbacks and self.active and time.perf_counter() < deadline:
+                if self._watchdog_stop.wait(0.001):
+                    return
+            if not self.active:
+                # Lost again; _watch() starts over.
+                return
+        self.recoveries += 1
+        self.recovery = {
+            "down_ms": (start - lost_at) * 1000.0,
+            "restore_ms": (time.perf_counter() - start) * 1000.0,
+            "attempts": attempts,
+            "connections": restored,
+            "missing": missing,
+        }
+        if self.on_recover:
+            self.on_recover()
+
+    def _drop_client(self):
+        # Forgets a client whose server is gone, and the ports that went with it.
+        client, self.client = self.client, None
+        self.active = False
+        if self.dsp is not None:
+            self.dsp.running = False
+        if self.warmer is not None:
+            self.warmer.set()
+            self.warmer = None
+        self.in_ports = []
+        self.out_ports = []
+        self.tap_ports = []
+        self.in_connections = None
+        self.connections.clear()
+        self.capture_latency.clear()
+        self.playback_latency.clear()
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def restore_connections(self, pairs, prefix=None):
+        # Connects (output, input) port name pairs one after the other; names
+        # under `prefix`, the client's name before a reconnect, are moved to
+        # its current one. Returns the (restored, missing) counts: a port that
+        # is not (yet) back cannot be connected.
+        prefix = prefix or self._port_prefix
+        restored = missing = 0
+        for pair in sorted(pairs):
+            source, destination = (
+                self._port_prefix + name[len(prefix) :] if name.startswith(prefix) else name for name in pair
+            )
+            try:
+                self.client.connect(source, destination)
+                restored += 1
+            except Exception:
+                missing += 1
+        return restored, missing
+
+    def xrun_cb(self, delayed_usecs):
+        self.stats.record_xrun(delayed_usecs)
+
+    def levels(self):
+        # (peak, rms) linear input levels per channel of the DSP in use, or
+        # None. Lock-free: any thread may call this while audio runs. During a
+        # channel count change the arrays may still have the old length.
+        dsp = self.dsp
+        return dsp.levels() if dsp is not None else None
+
+    def stats_snapshot(self):
+        stats = self.stats.snapshot()
+        jack_load = None
+        if self.client and hasattr(self.client, "cpu_load"):
+            try:
+                jack_load = self.client.cpu_load() / 100.0
+            except Exception:
+                pass
+        stats.update(
+            time=time.time(),
+            client=self.client_name,
+            active=self.active,
+            channels=self.channels,
+            sample_rate=self.sample_rate,
+            jack_load=jack_load,
+            reconnecting=self.reconnecting,
+            recoveries=self.recoveries,
+            recovery=self.recovery,
+        )
+        if self.dsp:
+            channel_bytes, total = self.dsp.memory_usage()
+            stats.update(buffer_bytes=total, channel_buffer_bytes=channel_bytes)
+        levels = self.levels() if self.active else None
+        if levels is not None:
+            peak, rms = levels
+            stats.update(
+                peak_db=[round(20.0 * math.log10(p), 1) for p in peak.tolist()],
+                rms_db=[round(20.0 * math.log10(r), 1) for r in rms.tolist()],
+            )
+        return stats
+
+    def process(self, frames):
+        if not self.active:
+            return
+        # NumPy releases the GIL inside larger operations; another thread could
+        # start a collection there and keep the GIL while this callback waits.
+        pause_gc = self.realtime and gc.isenabled()
+        if pause_gc:
+            gc.disable()
+        start = time.perf_counter()
+        try:
+            dsp = self.dsp
+            dsp.process_ports(frames)
+            if dsp.handed_over:
+                self.dsp = dsp.successor
+            measurement = self.measurement
+            if measurement is not None and not measurement.finished:
+                measurement.process(frames, self.in_ports, self.out_ports, self.tap_ports)
+        except Exception as e:
+            # Never let an exception escape into JACK, but keep count of it.
+            self.stats.errors += 1
+            self.stats.last_error = e
+        self.stats.record(time.perf_counter() - start, frames, frames / self.sample_rate)
+        if pause_gc:
+            gc.enable()
+
+
+def load_config():
+    # The last session: (channels, names, delays, interp, taps), channels None
+    # if there is none. See jdelay_presets for the store behind these helpers.
+    from jdelay_presets import get_store
+
+    return get_store().last_session()
+
+
+def save_session(channels, names, delays, interp, taps=None):
+    # Returns at once; the store writes the file in the background.
+    from jdelay_presets import get_store
+
+    get_store().save_session(channels, names, delays, interp, taps)
+
+
+def load_preset(slot):
+    # Returns (channels, names, delays, interp, taps) or None for an empty slot.
+    from jdelay_presets import get_store
+
+    return get_store().preset(slot)
+
+
+def save_preset(slot, channels, delays, interp, names=None, taps=None):
+    from jdelay_presets import get_store
+
+    get_store().save_preset(slot, channels, delays, interp, names, taps)
+
+
+def build_arg_parser(default_channels=2):
+    parser = argparse.ArgumentParser(description="J-Delay")
+    parser.add_argument("-c", "--channels", type=int, default=default_channels)
+    parser.add_argument("-d", "--delay", type=float, default=0.0)
+    parser.add_argument("-m", "--max", type=float, default=1000.0)
+    parser.add_argument("-a", "--autostart", action="store_true")
+    parser.add_argument("-i", "--interp", choices=INTERP_NAMES, default="none")
+    parser.add_argument(
+        "-f", "--fade", type=float, default=DEFAULT_FADE_MS, help="Crossfade window for delay changes in ms"
+    )
+    parser.add_argument("-n", "--name", default=CLIENT_NAME, help="JACK client name")
+    parser.add_argument(
+        "--rt", action="store_true", help="Real-time safe processing: allocation-free callback, no GC inside it"
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=1,
+        help="Process channel shards on this many threads (JACK thread included)",
+    )
+    parser.add_argument(
+        "--no-meters", action="store_true", help="Skip the input level meters (saves a little callback time)"
+    )
+    parser.add_argument(
+        "--auto-latency",
+        nargs="?",
+        const="all",
+        type=parse_latency_groups,
+        metavar="GROUPS",
+        help="Set delays from JACK's port latencies so each group lines up: all channels, or e.g. 1-4,5-8 or 1+3,2+4",
+    )
+    parser.add_argument(
+        "--buffer-format",
+        choices=BUFFER_FORMATS,
+        default="float32",
+        help="Sample format of the delay buffers; float16 halves their memory (not with --rt)",
+    )
+    parser.add_argument(
+        "--buffer-dir", help="Keep the delay buffers in memory-mapped temporary files in this directory (long delays)"
+    )
+    parser.add_argument(
+        "--tap",
+        action="append",
+        type=parse_tap,
+        metavar="CHANNEL:MS",
+        help="Add an output out_N_tapK reading channel N's buffer at its own delay; repeat for more taps",
+    )
+    parser.add_argument(
+        "--no-reconnect",
+        action="store_true",
+        help="Do not reopen the client when JACK shuts down (headless then exits with status 1)",
+    )
+    parser.add_argument("--headless", action="store_true", help="Run the engine without GUI (never loads tkinter)")
+    parser.add_argument("-p", "--preset", type=int, help="Headless: start from this preset slot")
+    parser.add_argument("--check", action="store_true", help="Headless: exit as soon as the ports are registered")
+    parser.add_argument("--stats", help="Write callback stats as JSON to this file, or send them to udp://host:port")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL, help="Seconds between stats updates")
+    parser.add_argument(
+        "--measure", choices=MEASURE_SIGNALS, help="Headless: measure the out_N -> in_N loop latencies on startup"
+    )
+    parser.add_argument(
+        "--measure-mode",
+        choices=("align", "absolute"),
+        default="align",
+        help="Set delays so all loops match the slowest one (align) or to the latency itself (absolute)",
+    )
+    parser.add_argument("--save-preset", type=int, help="Headless: store the measured delays in this preset slot")
+    parser.add_argument(
+        "--osc", help="Listen for OSC control messages on [host:]port (UDP, host defaults to 127.0.0.1)"
+    )
+    # Runs against the in-process server from jdelay_fakejack (benchmarks, dry runs).
+    parser.add_argument("--fake-jack", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def run_headless(args, config=None):
+    ini_channels, ini_names, ini_delays, ini_interp, ini_taps = config if config else load_config()
+    channels = max(args.channels, 2)
+    delays = initial_delays(channels, args.delay, ini_delays)
+    interp = initial_interp(channels, args.interp, ini_interp)
+    taps = ini_taps
+    if args.preset:
+        preset = load_preset(args.preset)
+        if preset is None:
+            print(f"J-Delay: preset {args.preset} is empty", file=sys.stderr)
+            return 1
+        channels, _, preset_delays, preset_interp, taps = preset
+        delays = initial_delays(channels, 0.0, preset_delays)
+        interp = initial_interp(channels, "none", preset_interp)
+    if args.tap:
+        taps = args.tap
+
+    server = None
+    client_factory = None
+    if args.fake_jack:
+        from jdelay_fakejack import FakeServer
+
+        server = FakeServer()
+        server.add_system(channels, channels)
+        client_factory = server.Client
+    engine = JDelayEngine(
+        channels,
+        args.max,
+        delays,
+        interp,
+        fade_ms=args.fade,
+        client_name=args.name,
+        client_factory=client_factory,
+        realtime=args.rt,
+        threads=args.threads,
+        meters=not args.no_meters,
+        latency_groups=args.auto_latency,
+        buffer_format=args.buffer_format,
+        buffer_dir=args.buffer_dir,
+        taps=taps,
+        reconnect=not args.no_reconnect,
+    )
+    stop = threading.Event()
+    if args.no_reconnect:
+        engine.on_shutdown = stop.set
+    else:
+        engine.on_shutdown = lambda: print(
+            f"J-Delay: JACK shut down: {engine.shutdown_reason}, reconnecting", flush=True
+        )
+        engine.on_recover = lambda: print(
+            "J-Delay: reconnected after {down_ms:.0f} ms, audio {restore_ms:.1f} ms later, "
+            "{connections} connections restored, {missing} missing".format(**engine.recovery),
+            flush=True,
+        )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    try:
+        engine.activate()
+    except Exception as e:
+        print(f"J-Delay: cannot start: {e}", file=sys.stderr)
+        engine.close()
+        return 1
+    taps = f" and {len(engine.taps)} taps" if engine.taps else ""
+    print(f"J-Delay: {engine.channels} channels{taps} running at {engine.sample_rate} Hz", flush=True)
+
+    if args.measure:
+        result = measure_and_apply(engine, args)
+        if result:
+            engine.close()
+            return result
+
+    if not args.check:
+        reporter = StatsReporter(args.stats) if args.stats else None
+        osc = start_osc(engine, args.osc) if args.osc else None
+        if server:
+            server.start()
+        while not stop.wait(args.stats_interval if reporter else 0.5):
+            if reporter:
+                reporter.send(engine.stats_snapshot())
+        if server:
+            server.stop()
+        if reporter:
+            reporter.close()
+        if osc:
+            osc.stop()
+    if engine.shutdown_reason is not None:
+        print(f"J-Delay: JACK shut down: {engine.shutdown_reason}", file=sys.stderr)
+    engine.close()
+    return 0 if engine.shutdown_reason is None else 1
+
+
+def start_osc(engine, target, names=None, on_change=None):
+    from jdelay_osc import OscControl, parse_address
+
+    host, port = parse_address(target)
+    osc = OscControl(engine, host, port, names, on_change)
+    osc.start()
+    print(f"J-Delay: OSC control on udp://{host}:{osc.port}", flush=True)
+    return osc
+
+
+def measure_and_apply(engine, args):
+    if args.fake_jack:
+        # Dry run: close every loop with a short simulated latency.
+        server = engine.client.server
+        loop = server.add_loopback([64.0 + 10.25 * i for i in range(engine.channels)])
+        for i in range(engine.channels):
+            server.connect(engine.out_ports[i], loop.client.inports[i])
+            server.connect(loop.client.outports[i], engine.in_ports[i])
+        server.start()
+    try:
+        latencies = engine.measure(args.measure)
+    except RuntimeError as e:
+        print(f"J-Delay: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.fake_jack:
+            server.stop()
+    for i, ms in sorted(latencies.items()):
+        print(f"J-Delay: channel {i + 1}: " + ("no signal" if ms is None else f"{ms:.4f} ms"), flush=True)
+    delays = engine.apply_latencies(latencies, args.measure_mode)
+    if args.save_preset:
+        save_preset(args.save_preset, engine.channels, delays, engine.interp_modes, taps=engine.taps)
+        print(f"J-Delay: delays saved to preset {args.save_preset}", flush=True)
+    return 0
+
+
+def parse_args(parser, argv=None):
+    args = parser.parse_args(argv)
+    if args.rt and args.buffer_format != "float32":
+        parser.error("--rt keeps its buffers in float32; use --buffer-dir for long delays")
+    return args
+
+
+def main(argv=None):
+    config = load_config()
+    args = parse_args(build_arg_parser(config[0] if config[0] else 2), argv)
+    if args.headless:
+        return run_headless(args, config)
+    # The GUI lives in J-Delay.py, which is not a valid module name for a
+    # plain import statement.
+    return importlib.import_module("J-Delay").run_gui(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
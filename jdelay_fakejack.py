@@ -0,0 +1,496 @@
+# ***jdelay_fakejack.py***
+# Version: ***1.0***
+# Description: ***In-process stand-in for a JACK server and jack.Client***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# Implements the part of the JACK-Client API that J-Delay uses, on top of a
+# FakeServer that runs process cycles on demand, as fast as the callbacks
+# allow, or paced in real time from a background thread. Lets the engine,
+# benchmarks and dry runs work without a JACK server:
+#
+#     server = FakeServer(samplerate=48000, blocksize=64)
+#     engine = JDelayEngine(8, client_factory=server.Client)
+#
+# shutdown() and restart() stand in for the server going away and coming back.
+import fnmatch
+import threading
+import time
+
+import numpy as np
+
+MAX_FAKE_BLOCK = 8192
+# Latency modes, with the values of jack.CAPTURE and jack.PLAYBACK.
+CAPTURE = 0
+PLAYBACK = 1
+
+
+class JackError(Exception):
+    pass
+
+
+class FakePort:
+    def __init__(self, client, shortname, is_input, is_physical=False):
+        self.client = client
+        self.shortname = shortname
+        self.name = f"{client.name}:{shortname}"
+        self.is_input = is_input
+        self.is_output = not is_input
+        self.is_audio = True
+        self.is_physical = is_physical
+        self._buffer = np.zeros(client.server.blocksize, dtype=np.float32)
+        # (min, max) frames per latency mode.
+        self._latency = [(0, 0), (0, 0)]
+
+    def get_array(self):
+        return self._buffer
+
+    def get_latency_range(self, mode):
+        return self._latency[mode]
+
+    def set_latency_range(self, mode, latency_range):
+        self._latency[mode] = (int(latency_range[0]), int(latency_range[1]))
+
+    def unregister(self):
+        self.client._unregister(self)
+
+    @property
+    def connections(self):
+        return self.client.server.get_connections(self)
+
+    def __repr__(self):
+        return f"FakePort({self.name!r})"
+
+
+class FakePorts(list):
+    def __init__(self, client, is_input):
+        super().__init__()
+        self._client = client
+        self._is_input = is_input
+
+    def register(self, shortname, is_physical=False):
+        if any(p.shortname == shortname for p in self):
+            raise JackError(f"Port {shortname!r} already registered")
+        port = FakePort(self._client, shortname, self._is_input, is_physical)
+        self.append(port)
+        return port
+
+
+class FakeClient:
+    def __init__(self, server, name, no_start_server=True):
+        if not server.running:
+            raise JackError("JACK server is not running")
+        if any(c.name == name for c in server.clients):
+            raise JackError(f"Client name {name!r} already in use")
+        self.server = server
+        self.name = name
+        self.inports = FakePorts(self, True)
+        self.outports = FakePorts(self, False)
+        self.active = False
+        # Set when the server shut down under this client; like a real client
+        # it can then only be closed.
+        self.lost = False
+        self.callbacks = {}
+        server.clients.append(self)
+
+    @property
+    def samplerate(self):
+        return self.server.samplerate
+
+    @property
+    def blocksize(self):
+        return self.server.blocksize
+
+    def set_process_callback(self, callback):
+        self.callbacks["process"] = callback
+
+    def set_samplerate_callback(self, callback):
+        self.callbacks["samplerate"] = callback
+
+    def set_blocksize_callback(self, callback):
+        self.callbacks["blocksize"] = callback
+
+    def set_shutdown_callback(self, callback):
+        self.callbacks["shutdown"] = callback
+
+    def set_xrun_callback(self, callback):
+        self.callbacks["xrun"] = callback
+
+    def set_port_connect_callback(self, callback):
+        self.callbacks["port_connect"] = callback
+
+    def set_latency_callback(self, callback):
+        self.callbacks["latency"] = callback
+
+    def recompute_total_latencies(self):
+        self.server.recompute_latencies()
+
+    def cpu_load(self):
+        return self.server.load * 100.0
+
+    def activate(self):
+        if self.lost:
+            raise JackError("JACK server is gone")
+        self.active = True
+        self.server.graph_changed()
+
+    def deactivate(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+        for port in list(self.inports) + list(self.outports):
+            self._unregister(port)
+        if self in self.server.clients:
+            self.server.clients.remove(self)
+
+    def connect(self, source, destination):
+        if self.lost:
+            raise JackError("JACK server is gone")
+        self.server.connect(source, destination)
+
+    def disconnect(self, source, destination):
+        self.server.disconnect(source, destination)
+
+    def get_ports(
+        self, name_pattern="", is_audio=False, is_midi=False, is_input=False, is_output=False, is_physical=False
+    ):
+        ports = []
+        for client in self.server.clients:
+            for port in list(client.outports) + list(client.inports):
+                if name_pattern and not fnmatch.fnmatch(port.name, f"*{name_pattern}*"):
+                    continue
+                if (is_input and not port.is_input) or (is_output and not port.is_output):
+                    continue
+                if (is_physical and not port.is_physical) or is_midi:
+                    continue
+                ports.append(port)
+        return ports
+
+    def get_all_connections(self, port):
+        return self.server.get_connections(port)
+
+    def _unregister(self, port):
+        self.server.drop_port(port)
+        ports = self.inports if port.is_input else self.outports
+        if port in ports:
+            ports.remove(port)
+
+
+class FakeLoopback:
+    # Stands in for hardware send/return loops: loop:out_N plays loop:in_N back
+    # after delays[N] samples (fractional allowed, band-limited windowed sinc).
+    # Created after the client under test, its returns reach that client one
+    # period later, so a measured round trip is delay + blocksize samples.
+    # With report_latency it stands in for a plugin host instead and reports
+    # its delays through the latency callback, as JACK clients should.
+    HALF = 16
+
+    def __init__(self, server, delays, name="loop", report_latency=False):
+        self.client = FakeClient(server, name)
+        self.delays = list(delays)
+        taps = np.arange(-self.HALF + 1, self.HALF + 1)
+        self.filters = []
+        for i, delay in enumerate(delays):
+            self.client.inports.register(f"in_{i+1}")
+            self.client.outports.register(f"out_{i+1}")
+            whole = int(np.floor(delay))
+            if whole < self.HALF:
+                raise ValueError(f"Loop delays must be at least {self.HALF} samples")
+            h = np.sinc(taps - (delay - whole)) * np.kaiser(len(taps), 8.0)
+            self.filters.append((whole, h.astype(np.float32)))
+        longest = max((w for w, _ in self.filters), default=0)
+        self.history = np.zeros((len(delays), longest + self.HALF + MAX_FAKE_BLOCK), dtype=np.float32)
+        self.client.set_process_callback(self.process)
+        if report_latency:
+            self.client.set_latency_callback(self.latency)
+        self.client.activate()
+
+    def latency(self, mode):
+        # Capture latency flows from in_N to out_N, playback latency back.
+        if mode == CAPTURE:
+            sources, targets = self.client.inports, self.client.outports
+        else:
+            sources, targets = self.client.outports, self.client.inports
+        for source, target, delay in zip(sources, targets, self.delays):
+            low, high = source.get_latency_range(mode)
+            target.set_latency_range(mode, (low + int(np.floor(delay)), high + int(np.ceil(delay))))
+
+    def process(self, frames):
+        hist = self.history
+        length = hist.shape[1]
+        hist[:, :-frames] = hist[:, frames:]
+        for c, port in enumerate(self.client.inports):
+            hist[c, -frames:] = port.get_array()
+        for c, (whole, h) in enumerate(self.filters):
+            start = length - frames - whole - self.HALF
+            segment = hist[c, start : start + frames + 2 * self.HALF - 1]
+            self.client.outports[c].get_array()[:] = np.convolve(segment, h, "valid")
+
+
+class FakeServer:
+    def __init__(self, samplerate=48000, blocksize=256):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.running = True
+        self.clients = []
+        self.connections = []
+        self.frame_time = 0
+        self.load = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        # Held for a whole cycle; reconfigure() waits for it like JACK stops
+        # processing between two periods.
+        self._cycle_lock = threading.Lock()
+        # Port latencies are recomputed before the next cycle after a graph
+        # change, once for any number of changes.
+        self._latency_dirty = False
+        # add_system() arguments, for restart().
+        self._systems = []
+        self._paced = False
+
+    def Client(self, name, no_start_server=True):
+        # Drop-in for jack.Client, usable as JDelayEngine(client_factory=...).
+        return FakeClient(self, name, no_start_server)
+
+    def add_system(self, capture=2, playback=2, capture_latency=0, playback_latency=0):
+        # A "system" client with physical capture outputs and playback inputs.
+        # Their latencies are fixed, as if set by the driver.
+        self._systems.append((capture, playback, capture_latency, playback_latency))
+        return self._add_system(capture, playback, capture_latency, playback_latency)
+
+    def _add_system(self, capture, playback, capture_latency, playback_latency):
+        system = FakeClient(self, "system")
+        for i in range(capture):
+            port = system.outports.register(f"capture_{i+1}", is_physical=True)
+            port.set_latency_range(CAPTURE, (capture_latency, capture_latency))
+        for i in range(playback):
+            port = system.inports.register(f"playback_{i+1}", is_physical=True)
+            port.set_latency_range(PLAYBACK, (playback_latency, playback_latency))
+        system.set_latency_callback(lambda mode: None)
+        system.active = True
+        self.graph_changed()
+        return system
+
+    def add_loopback(self, delays, name="loop", report_latency=False):
+        return FakeLoopback(self, delays, name, report_latency)
+
+    def port(self, name):
+        if not isinstance(name, str):
+            return name
+        for client in self.clients:
+            for port in list(client.outports) + list(client.inports):
+                if port.name == name:
+                    return port
+        raise JackError(f"No such port: {name}")
+
+    def connect(self, source, destination):
+        source = self.port(source)
+        destination = self.port(destination)
+        if not (source.is_output and destination.is_input):
+            raise JackError(f"Cannot connect {source.name} to {destination.name}")
+        if (source, destination) not in self.connections:
+            self.connections.append((source, destination))
+            self._notify(source, destination, True)
+            self.graph_changed()
+
+    def disconnect(self, source, destination):
+        pair = (self.port(source), self.port(destination))
+        if pair in self.connections:
+            self.connections.remove(pair)
+            self._notify(*pair, False)
+            self.graph_changed()
+
+    def get_connections(self, port):
+        port = self.port(port)
+        return [d if s is port else s for s, d in self.connections if port in (s, d)]
+
+    def drop_port(self, port):
+        for pair in [c for c in self.connections if port in c]:
+            self.connections.remove(pair)
+            self._notify(*pair, False)
+        self.graph_changed()
+
+    def _notify(self, source, destination, connect):
+        # Like JACK, every active client hears about every (dis)connection.
+        for c in list(self.clients):
+            callback = c.callbacks.get("port_connect")
+            if c.active and callback:
+                callback(source, destination, connect)
+
+    def graph_changed(self):
+        self._latency_dirty = True
+
+    def recompute_latencies(self):
+        # jack_recompute_total_latencies(): waits for the current cycle.
+        with self._cycle_lock:
+            self._recompute_latencies()
+
+    def _recompute_latencies(self):
+        # Like JACK after a graph change: capture latencies flow downstream
+        # and playback latencies upstream, combined over all connections, and
+        # in between each active client's latency callback sets its own ports
+        # from them. Without a callback JACK's default applies: every output
+        # depends on every input. Client order is not graph order here, so
+        # the passes repeat until nothing changes (bounded, for loops).
+        self._latency_dirty = False
+        clients = [c for c in self.clients if c.active]
+        feeds = {}
+        for source, destination in self.connections:
+            feeds.setdefault(destination, []).append(source)
+            feeds.setdefault(source, []).append(destination)
+        for _ in range(len(clients) + 1):
+            before = [p._latency[:] for c in clients for p in list(c.inports) + list(c.outports)]
+            for c in clients:
+                for port in c.inports:
+                    port._latency[CAPTURE] = _combined(feeds.get(port, ()), CAPTURE)
+                self._client_latency(c, CAPTURE, c.inports, c.outports)
+            for c in reversed(clients):
+                for port in c.outports:
+                    port._latency[PLAYBACK] = _combined(feeds.get(port, ()), PLAYBACK)
+                self._client_latency(c, PLAYBACK, c.outports, c.inports)
+            if before == [p._latency[:] for c in clients for p in list(c.inports) + list(c.outports)]:
+                break
+
+    def _client_latency(self, client, mode, sources, targets):
+        callback = client.callbacks.get("latency")
+        if callback:
+            callback(mode)
+            return
+        combined = _combined(sources, mode)
+        for port in targets:
+            port._latency[mode] = combined
+
+    def cycle(self, timings=None, index=0, client=None):
+        # One process cycle: mix connected sources into every input, then run
+        # the process callbacks in client order. When `timings` is given, the
+        # duration of `client`'s callback is stored at timings[index].
+        with self._cycle_lock:
+            self._cycle(timings, index, client)
+
+    def _cycle(self, timings, index, client):
+        if self._latency_dirty:
+            self._recompute_latencies()
+        frames = self.blocksize
+        for c in self.clients:
+            if not c.active:
+                continue
+            for port in c.inports:
+                sources = [s for s, d in self.connections if d is port]
+                if not sources:
+                    port._buffer[:] = 0.0
+                else:
+                    np.copyto(port._buffer, sources[0]._buffer)
+                    for s in sources[1:]:
+                        port._buffer += s._buffer
+            callback = c.callbacks.get("process")
+            if callback is None:
+                continue
+            if timings is not None and c is client:
+                start = time.perf_counter()
+                callback(frames)
+                timings[index] = time.perf_counter() - start
+            else:
+                callback(frames)
+        self.frame_time += frames
+
+    def reconfigure(self, samplerate=None, blocksize=None):
+        # Changes the sample rate and/or period size between two cycles: port
+        # buffers are reallocated, then every active client's sample rate and
+        # buffer size callbacks run before the next period, as with JACK.
+        with self._cycle_lock:
+            if samplerate is not None and samplerate != self.samplerate:
+                self.samplerate = samplerate
+                for c in list(self.clients):
+                    callback = c.callbacks.get("samplerate")
+                    if c.active and callback:
+                        callback(samplerate)
+            if blocksize is not None and blocksize != self.blocksize:
+                if not 0 < blocksize <= MAX_FAKE_BLOCK:
+                    raise JackError(f"Period sizes are 1-{MAX_FAKE_BLOCK}")
+                self.blocksize = blocksize
+                for c in self.clients:
+                    for port in list(c.inports) + list(c.outports):
+                        port._buffer = np.zeros(blocksize, dtype=np.float32)
+                for c in list(self.clients):
+                    callback = c.callbacks.get("blocksize")
+                    if c.active and callback:
+                        callback(blocksize)
+
+    def shutdown(self, reason="JACK server stopped"):
+        # The server goes away: processing stops, all clients with their ports
+        # and connections are gone without (dis)connect notifications, and
+        # each client's shutdown callback runs once, as with JACK.
+        self._paced = self._thread is not None
+        self.stop()
+        with self._cycle_lock:
+            self.running = False
+            clients, self.clients = self.clients, []
+            self.connections = []
+            for c in clients:
+                c.active = False
+                c.lost = True
+        for c in clients:
+            callback = c.callbacks.get("shutdown")
+            if callback:
+                callback(0, reason)
+
+    def restart(self):
+        # The server is back with the system clients it had, nothing connected,
+        # and paced again if it was before shutdown().
+        with self._cycle_lock:
+            self.running = True
+        for args in self._systems:
+            self._add_system(*args)
+        if self._paced:
+            self.start()
+
+    def xrun(self, delayed_usecs=0.0):
+        for c in self.clients:
+            callback = c.callbacks.get("xrun")
+            if c.active and callback:
+                callback(delayed_usecs)
+
+    def run(self, periods, client=None):
+        # Runs `periods` cycles back to back and returns the per-callback
+        # durations (seconds) of `client`.
+        timings = np.zeros(periods)
+        for i in range(periods):
+            self.cycle(timings, i, client)
+        return timings
+
+    def start(self):
+        # Runs cycles from a background thread, paced like a real server.
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_realtime, name="fakejack", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run_realtime(self):
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            period = self.blocksize / self.samplerate
+            start = time.perf_counter()
+            self.cycle()
+            now = time.perf_counter()
+            self.load = (now - start) / period
+            deadline += period
+            if now < deadline:
+                time.sleep(deadline - now)
+            else:
+                # Like JACK, report the overrun and restart the clock.
+                self.xrun((now - deadline) * 1e6)
+                deadline = now
+
+
+def _combined(ports, mode):
+    # The latency range over several ports: shortest minimum, longest maximum.
+    ranges = [p._latency[mode] for p in ports]
+    if not ranges:
+        return (0, 0)
+    return (min(r[0] for r in ranges), max(r[1] for r in ranges))
@@ -0,0 +1,163 @@
+# ***jdelay_measure.py***
+# Version: ***1.0***
+# Description: ***Loop latency measurement for J-Delay***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# A test signal is played on the out_N ports of every measured channel at once
+# and the returns on in_N are recorded. The lag of each return is found by
+# FFT cross-correlation (normalised by the test signal's spectrum, so impulse,
+# MLS and sweep all give a sharp peak), batched over all channels, and refined
+# to sub-sample precision by evaluating the band-limited correlation on a fine
+# grid around the peak.
+import numpy as np
+
+SIGNALS = ("impulse", "mls", "sweep")
+MAX_LATENCY_MS = 500.0
+LEVEL = 0.5
+# Feedback taps of maximum length sequences, by register length.
+MLS_TAPS = {
+    12: (12, 11, 10, 4),
+    13: (13, 12, 11, 8),
+    14: (14, 13, 12, 2),
+    15: (15, 14),
+    16: (16, 15, 13, 4),
+    17: (17, 14),
+    18: (18, 11),
+}
+SWEEP_SECONDS = 1.0
+# Peak to RMS ratio of the correlation below which a channel counts as silent.
+MIN_PEAK_RATIO = 8.0
+# Fine grid (in samples) used to refine the correlation peak.
+REFINE_STEPS = np.linspace(-1.0, 1.0, 33)
+
+
+def mls(order):
+    taps = MLS_TAPS[order]
+    state = [1] * order
+    seq = np.empty((1 << order) - 1, dtype=np.float32)
+    for i in range(len(seq)):
+        bit = 0
+        for t in taps:
+            bit ^= state[t - 1]
+        seq[i] = state[-1]
+        state = [bit] + state[:-1]
+    return seq * 2.0 - 1.0
+
+
+def test_signal(kind, sample_rate):
+    if kind == "impulse":
+        return np.ones(1, dtype=np.float32)
+    if kind == "mls":
+        # About half a second at common rates, never shorter than 4096 samples.
+        order = min(max(int(np.log2(sample_rate / 2)) + 1, 12), max(MLS_TAPS))
+        return mls(order)
+    if kind == "sweep":
+        # Exponential sine sweep from 20 Hz to just below Nyquist with short fades.
+        n = int(SWEEP_SECONDS * sample_rate)
+        f0, f1 = 20.0, min(20000.0, 0.45 * sample_rate)
+        t = np.arange(n) / sample_rate
+        rate = np.log(f1 / f0)
+        sweep = np.sin(2 * np.pi * f0 * SWEEP_SECONDS / rate * (np.exp(t * rate / SWEEP_SECONDS) - 1))
+        fade = min(n // 20, int(0.01 * sample_rate))
+        sweep[:fade] *= np.linspace(0, 1, fade)
+        sweep[-fade:] *= np.linspace(1, 0, fade)
+        return sweep.astype(np.float32)
+    raise ValueError(f"Unknown test signal: {kind}")
+
+
+def estimate_lags(reference, recordings, max_lag):
+    # reference: (L,), recordings: (channels, R). Returns the lag of every
+    # channel in (fractional) samples, NaN where no clear peak was found.
+    n = 1 << int(np.ceil(np.log2(recordings.shape[1] + len(reference))))
+    ref = np.fft.rfft(reference, n)
+    power = np.abs(ref) ** 2
+    cross = np.fft.rfft(recordings, n, axis=1) * (np.conj(ref) / (power + 1e-3 * power.max()))
+    corr = np.fft.irfft(cross, n, axis=1)[:, : max_lag + 1]
+
+    peaks = np.argmax(np.abs(corr), axis=1)
+    rows = np.arange(len(corr))
+    peak = np.abs(corr[rows, peaks])
+    rms = np.sqrt(np.mean(corr**2, axis=1)) + 1e-20
+
+    # Evaluate the band-limited correlation at peak + REFINE_STEPS: shift every
+    # channel's spectrum by its integer peak, then one matrix product covers
+    # the common fractional grid for all channels.
+    k = np.arange(cross.shape[1])
+    weights = np.full(len(k), 2.0)
+    weights[0] = 1.0
+    if n % 2 == 0:
+        weights[-1] = 1.0
+    shifted = cross * weights * np.exp(2j * np.pi * np.outer(peaks, k) / n)
+    grid = np.exp(2j * np.pi * np.outer(k, REFINE_STEPS) / n)
+    fine = np.abs((shifted @ grid).real) / n
+    best = np.argmax(fine, axis=1)
+    # Parabolic interpolation between the fine grid points.
+    step = REFINE_STEPS[1] - REFINE_STEPS[0]
+    inner = np.clip(best, 1, len(REFINE_STEPS) - 2)
+    y0, y1, y2 = fine[rows, inner - 1], fine[rows, inner], fine[rows, inner + 1]
+    denom = y0 - 2 * y1 + y2
+    offset = np.where(np.abs(denom) > 1e-20, 0.5 * (y0 - y2) / np.where(denom == 0, 1, denom), 0.0)
+    lags = peaks + REFINE_STEPS[inner] + np.clip(offset, -1, 1) * step
+    lags[peak / rms < MIN_PEAK_RATIO] = np.nan
+    return lags
+
+
+class LatencyMeasurement:
+    # Plays the test signal and records the returns from the process callback.
+    # The control thread polls `finished` and then calls result().
+    def __init__(self, channels, sample_rate, kind="mls", level=LEVEL, max_latency_ms=MAX_LATENCY_MS, measured=None):
+        self.kind = kind
+        self.sample_rate = sample_rate
+        self.reference = test_signal(kind, sample_rate)
+        self.max_lag = int(max_latency_ms / 1000.0 * sample_rate)
+        self.length = len(self.reference) + self.max_lag
+        self.measured = list(range(channels)) if measured is None else sorted(set(measured))
+        play = np.zeros(self.length, dtype=np.float32)
+        play[: len(self.reference)] = self.reference * level
+        self.play = play
+        self.record = np.zeros((len(self.measured), self.length), dtype=np.float32)
+        self.pos = 0
+        self.finished = False
+
+    def process(self, frames, in_ports, out_ports, tap_ports=()):
+        # Called after the normal DSP run, so the delay lines stay filled; the
+        # outputs of every channel are replaced for the duration of the test,
+        # and taps are silenced so they cannot leak into the loops.
+        pos = self.pos
+        n = max(min(frames, self.length - pos), 0)
+        for port in out_ports:
+            port.get_array()[:] = 0.0
+        for port in tap_ports:
+            port.get_array()[:] = 0.0
+        for row, i in enumerate(self.measured):
+            if i >= len(out_ports):
+                continue
+            if n:
+                out_ports[i].get_array()[:n] = self.play[pos : pos + n]
+                self.record[row, pos : pos + n] = in_ports[i].get_array()[:n]
+        self.pos = pos + n
+        if self.pos >= self.length:
+            self.finished = True
+
+    def result(self):
+        # Loop latency per channel in ms; None where nothing came back.
+        lags = estimate_lags(self.reference, self.record, self.max_lag)
+        latencies = {}
+        for i, lag in zip(self.measured, lags):
+            latencies[i] = None if np.isnan(lag) else float(lag) / self.sample_rate * 1000.0
+        return latencies
+
+
+def compensation_delays(latencies, delays_ms, mode="align"):
+    # "align" delays every measured channel so all loops end up as long as the
+    # slowest one; "absolute" uses the measured latency itself as the delay.
+    # Channels without a result keep their current delay.
+    delays = list(delays_ms)
+    valid = {i: ms for i, ms in latencies.items() if ms is not None and i < len(delays)}
+    if not valid:
+        return delays
+    target = max(valid.values())
+    for i, ms in valid.items():
+        delays[i] = target - ms if mode == "align" else ms
+    return delays
@@ -0,0 +1,385 @@
+# ***jdelay_osc.py***
+# Version: ***1.0***
+# Description: ***OSC/UDP remote control for J-Delay***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# An asyncio UDP server on its own thread that drives a JDelayEngine from show
+# control and console automation. Channels and preset slots count from 1, as
+# in the GUI:
+#
+#     /jdelay/delay   <channel> <ms>       one channel (and its linked partner)
+#     /jdelay/delays  <ms> <ms> ...        channels 1..n at once; no arguments
+#                                          replies with every current delay
+#     /jdelay/link    <channel> <0|1>      link the pair holding this channel
+#     /jdelay/taps    <channel> <ms> ...   the channel's extra outputs
+#                                          out_N_tap1.. at these delays; no
+#                                          delays removes them
+#     /jdelay/preset/recall <slot>
+#     /jdelay/preset/save   <slot>
+#
+# Delay messages only update a pending table. The first change after a quiet
+# period is published right away, later ones at most once per audio period,
+# so a burst of any size costs the audio thread one parameter swap per period.
+#
+#     python jdelay_osc.py send 127.0.0.1:9100 /jdelay/delay 3 12.5
+import argparse
+import asyncio
+import math
+import socket
+import struct
+import sys
+import threading
+import time
+
+from jdelay_engine import load_preset, save_preset
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9100
+PREFIX = "/jdelay"
+# Coalescing interval while no JACK period is known.
+FALLBACK_PERIOD = 0.005
+RECEIVE_BUFFER = 1 << 20
+
+
+class OscError(Exception):
+    pass
+
+
+def _pad(data):
+    return data + b"\0" * (4 - len(data) % 4)
+
+
+def _read_string(data, pos):
+    end = data.find(b"\0", pos)
+    if end < 0:
+        raise OscError("Unterminated OSC string")
+    return data[pos:end].decode("utf-8", "replace"), (end // 4 + 1) * 4
+
+
+def encode_message(address, *args):
+    tags = ","
+    payload = b""
+    for arg in args:
+        if isinstance(arg, bool):
+            tags += "T" if arg else "F"
+        elif isinstance(arg, int):
+            tags += "i"
+            payload += struct.pack(">i", arg)
+        elif isinstance(arg, float):
+            tags += "f"
+            payload += struct.pack(">f", arg)
+        else:
+            tags += "s"
+            payload += _pad(str(arg).encode())
+    return _pad(address.encode()) + _pad(tags.encode()) + payload
+
+
+def decode_packet(data):
+    # Returns [(address, args), ...]; bundles are flattened and run at once,
+    # their time tags are ignored.
+    if data.startswith(b"#bundle\0"):
+        messages = []
+        pos = 16
+        while pos + 4 <= len(data):
+            (size,) = struct.unpack_from(">i", data, pos)
+            messages.extend(decode_packet(data[pos + 4 : pos + 4 + size]))
+            pos += 4 + size
+        return messages
+    address, pos = _read_string(data, 0)
+    if not address.startswith("/"):
+        raise OscError(f"Not an OSC address: {address!r}")
+    if pos >= len(data):
+        return [(address, [])]
+    tags, pos = _read_string(data, pos)
+    args = []
+    for tag in tags[1:]:
+        if tag == "i":
+            args.append(struct.unpack_from(">i", data, pos)[0])
+            pos += 4
+        elif tag == "f":
+            args.append(struct.unpack_from(">f", data, pos)[0])
+            pos += 4
+        elif tag == "h":
+            args.append(struct.unpack_from(">q", data, pos)[0])
+            pos += 8
+        elif tag == "d":
+            args.append(struct.unpack_from(">d", data, pos)[0])
+            pos += 8
+        elif tag == "s":
+            value, pos = _read_string(data, pos)
+            args.append(value)
+        elif tag in "TF":
+            args.append(tag == "T")
+        elif tag == "N":
+            args.append(None)
+        else:
+            raise OscError(f"Unsupported OSC type tag {tag!r}")
+    return [(address, args)]
+
+
+def parse_address(text, default_host=DEFAULT_HOST):
+    # "9100", ":9100" or "host:9100"
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port)
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, control):
+        self.control = control
+
+    def connection_made(self, transport):
+        self.control.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.control.handle_packet(data, addr)
+
+
+class OscControl:
+    # Owns its event loop thread. on_change, when given, is called from that
+    # thread after every applied change; GUIs should only set a flag there.
+    def __init__(self, engine, host=DEFAULT_HOST, port=DEFAULT_PORT, names=None, on_change=None):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.names = names
+        self.on_change = on_change
+        self.transport = None
+        self.loop = None
+        self.received = 0
+        self.publishes = 0
+        self.errors = 0
+        self.last_error = None
+        # (slot, names) of the last preset recalled over OSC.
+        self.recalled = None
+        self._pending = {}
+        self._flush_handle = None
+        self._last_publish = 0.0
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="jdelay-osc", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self.transport is None:
+            raise OscError(f"Cannot listen on {self.host}:{self.port}: {self.last_error}")
+        # Port 0 picks a free port.
+        self.port = self.transport.get_extra_info("sockname")[1]
+
+    def stop(self):
+        if self.loop and self._thread:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Room for a burst while this thread waits for the GIL.
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+            sock.bind((self.host, self.port))
+            self.loop.run_until_complete(self.loop.create_datagram_endpoint(lambda: _Protocol(self), sock=sock))
+        except OSError as e:
+            self.last_error = e
+            self._ready.set()
+            self.loop.close()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.flush()
+            self.transport.close()
+            self.loop.close()
+
+    def period(self):
+        engine = self.engine
+        if engine.active and engine.client:
+            return engine.client.blocksize / engine.sample_rate
+        return FALLBACK_PERIOD
+
+    def handle_packet(self, data, addr=None):
+        try:
+            messages = decode_packet(data)
+        except (OscError, struct.error) as e:
+            self._error(e)
+            return
+        for address, args in messages:
+            self.received += 1
+            try:
+                self.dispatch(address, args, addr)
+            except (OscError, TypeError, ValueError, IndexError, RuntimeError, OSError) as e:
+                self._error(e)
+
+    def _error(self, e):
+        self.errors += 1
+        self.last_error = e
+
+    def dispatch(self, address, args, addr=None):
+        if not address.startswith(PREFIX + "/"):
+            raise OscError(f"Unknown address {address}")
+        command = address[len(PREFIX) + 1 :]
+        engine = self.engine
+        if command == "delay":
+            channel, ms = self._channel(args[0]), self._delay(args[1])
+            self._set(channel, ms)
+            partner = engine.linked_channel(channel)
+            if partner >= 0:
+                self._set(partner, ms)
+            self._schedule()
+        elif command == "delays":
+            if not args:
+                self.reply(addr, PREFIX + "/delays", *[float(d) for d in engine.delays_ms])
+                return
+            # All checked before any is set, so a bad value changes nothing.
+            for channel, ms in enumerate([self._delay(ms) for ms in args[: engine.channels]]):
+                self._set(channel, ms)
+            self._schedule()
+        elif command == "link":
+            channel = self._channel(args[0])
+            with engine.lock:
+                engine.set_link(channel, bool(args[1]))
+            self._changed()
+        elif command == "taps":
+            channel = self._channel(args[0])
+            delays = [self._delay(ms) for ms in args[1:]]
+            self.flush()
+            with engine.lock:
+                taps = [tap for tap in engine.taps if tap[0] != channel]
+                taps += [(channel, ms) for ms in delays]
+                engine.configure(taps=taps)
+            self._changed()
+        elif command == "preset/recall":
+            self.recall(int(args[0]))
+        elif command == "preset/save":
+            self.flush()
+            with engine.lock:
+                names = self.names() if self.names else None
+                save_preset(int(args[0]), engine.channels, engine.delays_ms, engine.interp_modes, names, engine.taps)
+        else:
+            raise OscError(f"Unknown address {address}")
+
+    def _channel(self, value):
+        channel = int(value) - 1
+        if not 0 <= channel < self.engine.channels:
+            raise OscError(f"No channel {value}")
+        return channel
+
+    def _delay(self, value):
+        # A delay in ms, clamped to the engine's range; NaN and infinities
+        # would pass the clamp and end up in the engine and the presets.
+        ms = float(value)
+        if not math.isfinite(ms):
+            raise OscError(f"Invalid delay {value}")
+        return min(max(ms, 0.0), self.engine.max_delay_ms)
+
+    def _set(self, channel, ms):
+        self._pending[channel] = ms
+
+    def _schedule(self):
+        if self._flush_handle is not None:
+            return
+        wait = self._last_publish + self.period() - time.perf_counter()
+        if wait <= 0:
+            self.flush()
+        else:
+            self._flush_handle = self.loop.call_later(wait, self.flush)
+
+    def flush(self):
+        # Publishes everything pending as one parameter block.
+        self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        engine = self.engine
+        with engine.lock:
+            delays = list(engine.delays_ms)
+            for channel, ms in pending.items():
+                if channel < len(delays):
+                    delays[channel] = ms
+            engine.configure(delays_ms=delays)
+        self._last_publish = time.perf_counter()
+        self.publishes += 1
+        self._changed()
+
+    def recall(self, slot):
+        preset = load_preset(slot)
+        if preset is None:
+            raise OscError(f"Preset {slot} is empty")
+        self._pending = {}
+        channels, names, delays, interp, taps = preset
+        with self.engine.lock:
+            self.engine.configure(max(channels, 2), delays, interp, taps)
+        self.recalled = (slot, names)
+        self._changed()
+
+    def reply(self, addr, address, *args):
+        if addr is not None and self.transport is not None:
+            self.transport.sendto(encode_message(address, *args), addr)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+
+class OscClient:
+    # Minimal blocking sender, for scripts and tests on localhost.
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=1.0):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(timeout)
+
+    def send(self, address, *args):
+        self.sock.sendto(encode_message(address, *args), self.address)
+
+    def send_bundle(self, messages):
+        body = b"".join(struct.pack(">i", len(m)) + m for m in (encode_message(a, *args) for a, *args in messages))
+        self.sock.sendto(b"#bundle\0" + struct.pack(">Q", 1) + body, self.address)
+
+    def query_delays(self):
+        self.send(PREFIX + "/delays")
+        data, _ = self.sock.recvfrom(65536)
+        return decode_packet(data)[0][1]
+
+    def close(self):
+        self.sock.close()
+
+
+def _argument(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send an OSC message to a running J-Delay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("send", help="Send one message; /jdelay/delays without values prints the current delays")
+    p.add_argument("target", help="host:port of J-Delay's --osc listener")
+    p.add_argument("address")
+    p.add_argument("args", nargs="*", type=_argument)
+    args = parser.parse_args(argv)
+
+    host, port = parse_address(args.target)
+    client = OscClient(host, port)
+    try:
+        if args.address == PREFIX + "/delays" and not args.args:
+            print(",".join(f"{d:.4f}" for d in client.query_delays()))
+        else:
+            client.send(args.address, *args.args)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
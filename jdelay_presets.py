@@ -0,0 +1,222 @@
+# ***jdelay_presets.py***
+# Version: ***1.0***
+# Description: ***In-memory preset store with atomic background autosave for J-Delay***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# The last session and all preset slots live in one JSON file that is read
+# once per process. Presets are kept parsed and padded to their channel
+# count, so a recall is a lookup plus one parameter publish. Changes only mark
+# the store dirty; a writer thread saves AUTOSAVE_DELAY after the last change,
+# through a temporary file and os.replace, so a crash leaves either the old or
+# the new file. A J-Delay.ini from earlier versions is imported on first run.
+#
+#     store = get_store()
+#     store.save_preset(3, 8, delays, interp, names, taps)
+#     channels, names, delays, interp, taps = store.preset(3)
+#
+# Taps are (channel, ms) pairs, stored as [channel, ms] lists; files without
+# them load with none.
+import atexit
+import configparser
+import json
+import os
+import sys
+import threading
+import time
+
+from jdelay_engine import CONFIG_FILE, initial_delays, initial_interp, initial_taps
+
+PRESET_FILE = "J-Delay.json"
+PRESET_SLOTS = 128
+# Seconds without changes before the file is written.
+AUTOSAVE_DELAY = 1.0
+STORE_VERSION = 1
+
+
+class Preset:
+    __slots__ = ("channels", "names", "delays", "interp", "taps")
+
+    def __init__(self, channels, names=None, delays=None, interp=None, taps=None):
+        self.channels = int(channels)
+        self.names = {int(idx): str(name) for idx, name in (names or {}).items()}
+        self.delays = [float(d) for d in initial_delays(self.channels, 0.0, delays)]
+        self.interp = initial_interp(self.channels, "none", interp)
+        self.taps = initial_taps(self.channels, taps)
+
+    def as_tuple(self):
+        # Copies, so callers may edit what they get.
+        return self.channels, dict(self.names), list(self.delays), list(self.interp), list(self.taps)
+
+    def to_json(self):
+        return {
+            "channels": self.channels,
+            "names": {str(idx): name for idx, name in sorted(self.names.items())},
+            "delays": self.delays,
+            "interp": self.interp,
+            "taps": [list(tap) for tap in self.taps],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["channels"], data.get("names"), data.get("delays"), data.get("interp"), data.get("taps"))
+
+
+def _read_ini(path):
+    # (session, {slot: Preset}) from an INI written by earlier versions.
+    config = configparser.ConfigParser()
+    config.read(path)
+    session = None
+    if "IO" in config and config["IO"].get("input", "").strip():
+        names = {}
+        if "NAMES" in config:
+            names = {int(key): name for key, name in config["NAMES"].items() if key.isdigit()}
+        delays = config.get("DELAYS", "values", fallback="")
+        interp = config.get("INTERP", "values", fallback="")
+        session = Preset(
+            config.getint("IO", "input"),
+            names,
+            [float(x) for x in delays.split(",") if x.strip()],
+            [m.strip() for m in interp.split(",")],
+        )
+    presets = {}
+    for section in config.sections():
+        if not section.startswith("PRESET_"):
+            continue
+        values = config[section]
+        if not values.get("channels", "").strip():
+            # Earlier versions could not recall a slot without a channel count either.
+            continue
+        names = {int(key[len("name_") :]): name for key, name in values.items() if key.startswith("name_")}
+        presets[int(section[len("PRESET_") :])] = Preset(
+            values.getint("channels"),
+            names,
+            [float(x) for x in values.get("delays", "").split(",") if x.strip()],
+            [m.strip() for m in values.get("interp", "").split(",")],
+        )
+    return session, presets
+
+
+class PresetStore:
+    def __init__(self, path=PRESET_FILE, ini_path=CONFIG_FILE):
+        self.path = path
+        self.session = None
+        self.presets = {}
+        self.saves = 0
+        # Guards the contents; the file itself is written outside of it, under
+        # _write_lock, so callers never wait for the disk.
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._dirty_since = None
+        self._thread = None
+        if os.path.exists(path):
+            self._load()
+        elif ini_path and os.path.exists(ini_path):
+            try:
+                self.session, self.presets = _read_ini(ini_path)
+            except (configparser.Error, ValueError, KeyError, TypeError) as e:
+                print(f"J-Delay: cannot import {ini_path}: {e}", file=sys.stderr)
+            if self.session or self.presets:
+                self._changed()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            session = data.get("session")
+            self.session = Preset.from_json(session) if session else None
+            self.presets = {int(slot): Preset.from_json(p) for slot, p in data.get("presets", {}).items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # Keep the unreadable file for inspection instead of overwriting it.
+            print(f"J-Delay: cannot read {self.path}: {e}", file=sys.stderr)
+            try:
+                os.replace(self.path, self.path + ".bad")
+            except OSError:
+                pass
+
+    def preset(self, slot):
+        # (channels, names, delays, interp, taps) or None for an empty slot.
+        preset = self.presets.get(slot)
+        return preset.as_tuple() if preset else None
+
+    def save_preset(self, slot, channels, delays, interp, names=None, taps=None):
+        if not 1 <= slot <= PRESET_SLOTS:
+            raise ValueError(f"Preset slots are 1-{PRESET_SLOTS}")
+        preset = Preset(channels, names, delays, interp, taps)
+        with self._lock:
+            self.presets[slot] = preset
+            self._changed()
+
+    def last_session(self):
+        # (channels, names, delays, interp, taps); channels is None without a
+        # session.
+        if self.session is None:
+            return None, {}, [], [], []
+        return self.session.as_tuple()
+
+    def save_session(self, channels, names, delays, interp, taps=None):
+        session = Preset(channels, names, delays, interp, taps)
+        with self._lock:
+            self.session = session
+            self._changed()
+
+    def _changed(self):
+        # Called with the lock held (or before any thread exists).
+        self._dirty_since = time.monotonic()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="jdelay-presets", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+        else:
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    if self._dirty_since is None:
+                        self._wake.wait()
+                        continue
+                    wait = self._dirty_since + AUTOSAVE_DELAY - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._wake.wait(wait)
+            self.flush()
+
+    def flush(self):
+        # Writes pending changes now, e.g. before the process exits.
+        with self._write_lock:
+            with self._lock:
+                if self._dirty_since is None:
+                    return
+                self._dirty_since = None
+                text = json.dumps(
+                    {
+                        "version": STORE_VERSION,
+                        "session": self.session.to_json() if self.session else None,
+                        "presets": {str(slot): p.to_json() for slot, p in sorted(self.presets.items())},
+                    },
+                    indent=1,
+                )
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self.saves += 1
+            except OSError as e:
+                print(f"J-Delay: cannot save {self.path}: {e}", file=sys.stderr)
+
+
+_store = None
+
+
+def get_store():
+    # The process-wide store, loaded on first use.
+    global _store
+    if _store is None:
+        _store = PresetStore()
+    return _store
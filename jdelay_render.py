@@ -0,0 +1,280 @@
+# ***jdelay_render.py***
+# Version: ***1.0***
+# Description: ***Offline multichannel WAV rendering with the J-Delay engine***
+# Author: Marco Herglotz
+# License: ***GPLv3***
+
+# Streams WAV/RF64 files through the same MultiChannelDelay.process_block used
+# by the live engine, so the rendered samples match what JACK would output.
+# The input is read and processed in large chunks into reused buffers; memory
+# use depends on the chunk size and the longest delay, never on the file length.
+# Taps become extra channels after the input's, in the order of their JACK
+# ports (out_1_tap1, out_1_tap2, out_2_tap1, ...).
+import argparse
+import struct
+import sys
+import time
+
+import numpy as np
+
+from jdelay_dsp import MultiChannelDelay
+from jdelay_engine import initial_delays, initial_interp, initial_taps, load_config, load_preset
+
+DEFAULT_CHUNK = 65536
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format tag, bits) -> storage dtype; 24-bit PCM is handled as raw bytes.
+SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 24): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+OUTPUT_FORMATS = {
+    "pcm16": (WAVE_FORMAT_PCM, 16),
+    "pcm24": (WAVE_FORMAT_PCM, 24),
+    "pcm32": (WAVE_FORMAT_PCM, 32),
+    "float32": (WAVE_FORMAT_IEEE_FLOAT, 32),
+}
+
+
+class WavError(Exception):
+    pass
+
+
+class WavReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+                raise WavError(f"{path}: not a WAV file")
+            data_size64 = None
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise WavError(f"{path}: no data chunk")
+                chunk_id, size = struct.unpack("<4sI", header)
+                if chunk_id == b"ds64":
+                    body = f.read(size)
+                    data_size64 = struct.unpack("<Q", body[8:16])[0]
+                elif chunk_id == b"fmt ":
+                    fmt = f.read(size)
+                elif chunk_id == b"data":
+                    self.data_offset = f.tell()
+                    if size == 0xFFFFFFFF and data_size64 is not None:
+                        size = data_size64
+                    self.data_size = size
+                    break
+                else:
+                    f.seek(size, 1)
+                if size % 2 and chunk_id != b"data":
+                    f.seek(1, 1)
+        if fmt is None:
+            raise WavError(f"{path}: no fmt chunk")
+
+        tag, self.channels, self.sample_rate, _, self.block_align, self.bits = struct.unpack("<HHIIHH", fmt[:16])
+        if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            tag = struct.unpack("<H", fmt[24:26])[0]
+        self.format = tag
+        if (tag, self.bits) not in SAMPLE_DTYPES:
+            raise WavError(f"{path}: unsupported sample format {tag}/{self.bits} bit")
+        self.frames = self.data_size // self.block_align
+
+        self._dtype = SAMPLE_DTYPES[(tag, self.bits)]
+        self._raw = bytearray()
+        self._file = open(path, "rb")
+
+    def read(self, start, stop, out):
+        # Decodes frames [start, stop) into out[:, :stop - start] as float32.
+        frames = stop - start
+        nbytes = frames * self.block_align
+        if len(self._raw) < nbytes:
+            self._raw = bytearray(nbytes)
+        self._file.seek(self.data_offset + start * self.block_align)
+        if self._file.readinto(memoryview(self._raw)[:nbytes]) < nbytes:
+            raise WavError(f"{self.path}: truncated data chunk")
+        raw = np.frombuffer(self._raw, dtype=self._dtype, count=nbytes // self._dtype.itemsize).reshape(frames, -1)
+        if self.format == WAVE_FORMAT_IEEE_FLOAT:
+            out[:, :frames] = raw.T
+        elif self.bits == 24:
+            b = raw.reshape(frames, self.channels, 3).astype(np.int32)
+            value = (b[:, :, 0] << 8) | (b[:, :, 1] << 16) | (b[:, :, 2] << 24)
+            np.multiply(value.T, np.float32(1.0 / 2147483648.0), out=out[:, :frames], casting="unsafe")
+        else:
+            scale = np.float32(1.0 / (1 << (self.bits - 1)))
+            np.multiply(raw.T, scale, out=out[:, :frames], casting="unsafe")
+
+    def close(self):
+        self._file.close()
+
+
+class WavWriter:
+    # Writes a RIFF header with a JUNK chunk that is turned into ds64 when the
+    # data outgrows 4 GB, so long multichannel renders become valid RF64.
+    def __init__(self, path, channels, sample_rate, fmt):
+        self.format, self.bits = OUTPUT_FORMATS[fmt]
+        self.channels = channels
+        self.block_align = channels * self.bits // 8
+        self.data_size = 0
+        self.f = open(path, "wb")
+        fmt_chunk = struct.pack(
+            "<HHIIHH",
+            self.format,
+            channels,
+            sample_rate,
+            sample_rate * self.block_align,
+            self.block_align,
+            self.bits,
+        )
+        self.f.write(b"RIFF" + struct.pack("<I", 0) + b"WAVE")
+        self.f.write(b"JUNK" + struct.pack("<I", 28) + bytes(28))
+        self.f.write(b"fmt " + struct.pack("<I", len(fmt_chunk)) + fmt_chunk)
+        self.f.write(b"data" + struct.pack("<I", 0))
+        self.data_offset = self.f.tell()
+
+    def write(self, block):
+        # block: float32 (channels, frames)
+        if self.format == WAVE_FORMAT_IEEE_FLOAT:
+            data = block.T.astype("<f4")
+        else:
+            full = 1 << (self.bits - 1)
+            # float32 holds every 16/24-bit step exactly; 32-bit needs float64 headroom.
+            if self.bits == 32:
+                work = block.T.astype(np.float64) * full
+            else:
+                work = block.T * np.float32(full)
+            scaled = np.rint(np.clip(work, -full, full - 1))
+            if self.bits == 16:
+                data = scaled.astype("<i2")
+            elif self.bits == 32:
+                data = scaled.astype("<i4")
+            else:
+                data = np.ascontiguousarray(scaled.astype("<i4")).view(np.uint8).reshape(-1, 4)[:, :3]
+        payload = np.ascontiguousarray(data).tobytes()
+        self.f.write(payload)
+        self.data_size += len(payload)
+
+    def close(self):
+        if self.data_size % 2:
+            self.f.write(b"\0")
+        riff_size = self.f.tell() - 8
+        if riff_size > 0xFFFFFFFF:
+            self.f.seek(0)
+            self.f.write(b"RF64" + struct.pack("<I", 0xFFFFFFFF))
+            self.f.seek(12)
+            self.f.write(b"ds64" + struct.pack("<IQQQI", 28, riff_size, self.data_size, 0, 0))
+            self.f.seek(self.data_offset - 4)
+            self.f.write(struct.pack("<I", 0xFFFFFFFF))
+        else:
+            self.f.seek(4)
+            self.f.write(struct.pack("<I", riff_size))
+            self.f.seek(self.data_offset - 4)
+            self.f.write(struct.pack("<I", self.data_size))
+        self.f.close()
+
+
+def render(
+    in_path, out_path, delays_ms, interp=None, max_delay_ms=1000.0, chunk=DEFAULT_CHUNK, fmt=None, tail=False, taps=None
+):
+    reader = WavReader(in_path)
+    channels = reader.channels
+    delays = initial_delays(channels, 0.0, delays_ms)
+    modes = initial_interp(channels, "none", interp)
+    taps = initial_taps(channels, taps)
+    outputs = channels + len(taps)
+    if fmt is None:
+        native = (reader.format, reader.bits)
+        fmt = next((name for name, spec in OUTPUT_FORMATS.items() if spec == native), "float32")
+
+    dsp = MultiChannelDelay(
+        channels, max_delay_ms, reader.sample_rate, max_block=chunk, fade_ms=0.0, taps=[c for c, _ in taps]
+    )
+    dsp.publish(delays + [ms for _, ms in taps], modes, crossfade=False)
+    params = dsp.params
+    total = reader.frames
+    if tail:
+        total += int(params.delay_frames.max()) + 1
+    in_block = np.zeros((channels, chunk), dtype=np.float32)
+    out_block = np.zeros((outputs, chunk), dtype=np.float32)
+
+    writer = WavWriter(out_path, outputs, reader.sample_rate, fmt)
+    try:
+        pos = 0
+        while pos < total:
+            frames = min(chunk, total - pos)
+            if frames < chunk:
+                in_block = np.zeros((channels, frames), dtype=np.float32)
+                out_block = np.zeros((outputs, frames), dtype=np.float32)
+            stop = min(pos + frames, reader.frames)
+            if stop > pos:
+                reader.read(pos, stop, in_block)
+            in_block[:, max(stop - pos, 0) :] = 0.0
+            dsp.process_block(in_block, out_block, params)
+            writer.write(out_block)
+            pos += frames
+    finally:
+        writer.close()
+        reader.close()
+    return total, reader.sample_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render J-Delay channel delays into a multichannel WAV file")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("-p", "--preset", type=int, help="Use the delays of this preset instead of the last session")
+    parser.add_argument("--delays", help="Comma separated delays in ms, overrides the config")
+    parser.add_argument("-i", "--interp", help="Comma separated interpolation modes, overrides the config")
+    parser.add_argument("-m", "--max", type=float, default=1000.0, help="Maximum delay in ms (as in the live app)")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="Frames processed per step")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), help="Output sample format (default: as input)")
+    parser.add_argument("--tail", action="store_true", help="Append frames until the longest delay has played out")
+    parser.add_argument(
+        "--no-taps",
+        action="store_true",
+        help="Leave out the tap outputs of the session or preset (same channels as in)",
+    )
+    args = parser.parse_args(argv)
+
+    _, _, delays, interp, taps = load_config()
+    if args.preset:
+        preset = load_preset(args.preset)
+        if preset is None:
+            print(f"Preset {args.preset} is empty.", file=sys.stderr)
+            return 1
+        _, _, delays, interp, taps = preset
+    if args.delays:
+        delays = [float(x) for x in args.delays.split(",")]
+    if args.interp:
+        interp = [m.strip() for m in args.interp.split(",")]
+
+    start = time.perf_counter()
+    try:
+        frames, sample_rate = render(
+            args.input,
+            args.output,
+            delays,
+            interp,
+            args.max,
+            args.chunk,
+            args.format,
+            args.tail,
+            None if args.no_taps else taps,
+        )
+    except (OSError, WavError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+    seconds = frames / sample_rate
+    print(f"Rendered {seconds:.1f} s of audio in {elapsed:.1f} s ({seconds / max(elapsed, 1e-9):.0f}x real-time)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,14 +9,24 @@ setup(
     author="Marco Herglotz",
     url="https://github.com/YOUR_USERNAME/J-Delay",  # Update this before publishing!
     license="GPLv3",
-    py_modules=["J-Delay"],
+    py_modules=[
+        "J-Delay",
+        "jdelay_dsp",
+        "jdelay_engine",
+        "jdelay_render",
+        "jdelay_fakejack",
+        "jdelay_measure",
+        "jdelay_osc",
+        "jdelay_presets",
+    ],
     install_requires=[
         "JACK-Client",
         "numpy",
     ],
     entry_points={
         "console_scripts": [
-            "j-delay=J-Delay:main",  # Requires refactoring J-Delay.py to have a main() function exposed properly if imported
+            "j-delay=jdelay_engine:main",
+            "j-delay-render=jdelay_render:main",
         ],
     },
     classifiers=[